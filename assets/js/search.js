@@ -0,0 +1,218 @@
+// Site search over the sharded index written by scripts/build_search_index.py
+//
+// The index is split by the first two letters of each term, so a query only
+// downloads the shards for the terms it contains (and keeps them for the next
+// query). Queries are tokenized and stemmed exactly as the build script does;
+// the last word is also matched as a prefix, so results show up while typing.
+//
+// Usage: <input id="search-input"> <div id="search-results"></div>
+//        <script src="/assets/js/search.js" data-index="/assets/search/"></script>
+(function () {
+  var script = document.currentScript;
+  var base = script.getAttribute('data-index') || '/assets/search/';
+  var INDEX_VERSION = 2;
+  var MAX_RESULTS = 50;
+
+  var manifest = null, docs = null, shards = {}, stopWords = {};
+
+  function getJSON(url, done) {
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', url);
+    xhr.onload = function () { if (xhr.status === 200) done(JSON.parse(xhr.responseText)); };
+    xhr.send();
+  }
+
+  // ---- the Porter stemmer, rule for rule as in build_search_index.py
+
+  function cons(w, i) {
+    var c = w.charAt(i);
+    if ('aeiou'.indexOf(c) >= 0) return false;
+    if (c === 'y') return i === 0 || !cons(w, i - 1);
+    return true;
+  }
+
+  function measure(stem) {
+    var m = 0, vowel = false;
+    for (var i = 0; i < stem.length; i++) {
+      if (cons(stem, i)) { if (vowel) m++; vowel = false; } else vowel = true;
+    }
+    return m;
+  }
+
+  function hasVowel(stem) {
+    for (var i = 0; i < stem.length; i++) if (!cons(stem, i)) return true;
+    return false;
+  }
+
+  function ends(w, s) { return w.length >= s.length && w.slice(w.length - s.length) === s; }
+
+  function isDouble(w) {
+    var n = w.length;
+    return n >= 2 && w.charAt(n - 1) === w.charAt(n - 2) && cons(w, n - 1);
+  }
+
+  function cvc(w) {
+    var n = w.length;
+    return n >= 3 && cons(w, n - 3) && !cons(w, n - 2) && cons(w, n - 1) && 'wxy'.indexOf(w.charAt(n - 1)) < 0;
+  }
+
+  var STEP2 = {ational: 'ate', tional: 'tion', enci: 'ence', anci: 'ance', izer: 'ize', abli: 'able',
+               alli: 'al', entli: 'ent', eli: 'e', ousli: 'ous', ization: 'ize', ation: 'ate',
+               ator: 'ate', alism: 'al', iveness: 'ive', fulness: 'ful', ousness: 'ous', aliti: 'al',
+               iviti: 'ive', biliti: 'ble'};
+  var STEP3 = {icate: 'ic', ative: '', alize: 'al', iciti: 'ic', ical: 'ic', ful: '', ness: ''};
+  var STEP4 = ['al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent',
+               'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize'];
+
+  function longest(w, suffixes) {
+    var best = null;
+    for (var i = 0; i < suffixes.length; i++) {
+      if (ends(w, suffixes[i]) && (best === null || suffixes[i].length > best.length)) best = suffixes[i];
+    }
+    return best;
+  }
+
+  function stem(w) {
+    if (w.length <= 2) return w;
+
+    if (ends(w, 'sses') || ends(w, 'ies')) w = w.slice(0, -2);
+    else if (ends(w, 's') && !ends(w, 'ss')) w = w.slice(0, -1);
+
+    if (ends(w, 'eed')) {
+      if (measure(w.slice(0, -3)) > 0) w = w.slice(0, -1);
+    } else {
+      var endings = ['ed', 'ing'];
+      for (var i = 0; i < endings.length; i++) {
+        var s = endings[i];
+        if (ends(w, s) && hasVowel(w.slice(0, -s.length))) {
+          w = w.slice(0, -s.length);
+          var last2 = w.slice(-2);
+          if (last2 === 'at' || last2 === 'bl' || last2 === 'iz') w += 'e';
+          else if (isDouble(w) && 'lsz'.indexOf(w.charAt(w.length - 1)) < 0) w = w.slice(0, -1);
+          else if (measure(w) === 1 && cvc(w)) w += 'e';
+          break;
+        }
+      }
+    }
+
+    if (ends(w, 'y') && hasVowel(w.slice(0, -1))) w = w.slice(0, -1) + 'i';
+
+    [STEP2, STEP3].forEach(function (table) {
+      var suffix = longest(w, Object.keys(table));
+      if (suffix && measure(w.slice(0, -suffix.length)) > 0) w = w.slice(0, -suffix.length) + table[suffix];
+    });
+
+    var suffix = longest(w, STEP4);
+    if (suffix) {
+      var rest = w.slice(0, -suffix.length);
+      if (measure(rest) > 1 && (suffix !== 'ion' || ends(rest, 's') || ends(rest, 't'))) w = rest;
+    }
+
+    if (ends(w, 'e')) {
+      var r = w.slice(0, -1), m = measure(r);
+      if (m > 1 || (m === 1 && !cvc(r))) w = r;
+    }
+    if (ends(w, 'll') && measure(w) > 1) w = w.slice(0, -1);
+    return w;
+  }
+
+  function tokenize(text) {
+    var words = text.normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase().match(/[a-z0-9]+/g) || [];
+    return words.filter(function (t) { return t.length > 1 && !stopWords[t]; })
+                .map(function (t) { return /^[0-9]+$/.test(t) ? t : stem(t); });
+  }
+
+  // ---- querying
+
+  function withShards(terms, done) {
+    var needed = terms.map(function (t) { return t.slice(0, 2); })
+                      .filter(function (p, i, all) { return all.indexOf(p) === i && !shards[p]; });
+    var waiting = needed.length;
+    if (!waiting) return done();
+    needed.forEach(function (prefix) {
+      var file = manifest.shards[prefix];
+      if (!file) { shards[prefix] = {}; if (!--waiting) done(); return; }
+      getJSON(base + 'shards/' + file, function (data) { shards[prefix] = data; if (!--waiting) done(); });
+    });
+  }
+
+  // {doc id: score} for one term; `prefix` also counts every longer term starting with it
+  function postings(term, prefix) {
+    var shard = shards[term.slice(0, 2)] || {}, scores = {};
+    Object.keys(shard).forEach(function (key) {
+      if (key !== term && !(prefix && key.indexOf(term) === 0)) return;
+      var list = shard[key];
+      for (var i = 0; i < list.length; i += 2) scores[list[i]] = (scores[list[i]] || 0) + list[i + 1];
+    });
+    return scores;
+  }
+
+  function search(query, done) {
+    var raw = query.toLowerCase().match(/[a-z0-9]+$/);
+    var terms = tokenize(query);
+    if (!terms.length) return done([]);
+    // the word still being typed has not been stemmed to its full form yet
+    var typing = raw && raw[0].length > 1 && !stopWords[raw[0]] ? raw[0] : null;
+    withShards(terms.concat(typing ? [typing] : []), function () {
+      var total = null;
+      terms.forEach(function (term, i) {
+        var scores = postings(term, false);
+        if (i === terms.length - 1 && typing) {
+          var more = postings(typing, true);
+          Object.keys(more).forEach(function (id) { scores[id] = Math.max(scores[id] || 0, more[id]); });
+        }
+        if (total === null) { total = scores; return; }
+        // every term has to match
+        Object.keys(total).forEach(function (id) {
+          if (scores[id]) total[id] += scores[id]; else delete total[id];
+        });
+      });
+      var ids = Object.keys(total).sort(function (a, b) { return total[b] - total[a]; });
+      done(ids.slice(0, MAX_RESULTS).map(function (id) { return docs[id]; }));
+    });
+  }
+
+  // ---- page wiring
+
+  function escape(text) {
+    return String(text).replace(/[&<>"]/g, function (c) {
+      return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c];
+    });
+  }
+
+  function render(results, box, query) {
+    if (!query.trim()) { box.innerHTML = ''; return; }
+    if (!results.length) { box.innerHTML = '<p>No results.</p>'; return; }
+    box.innerHTML = results.map(function (doc) {
+      var url = doc[0], title = doc[1], collection = doc[2], date = doc[3], venue = doc[4];
+      var meta = [collection, venue, date.slice(0, 4)].filter(Boolean).map(escape).join(' &middot; ');
+      return '<div class="list__item"><article class="archive__item">' +
+             '<h2 class="archive__item-title"><a href="' + escape(script.getAttribute('data-baseurl') || '') +
+             escape(url) + '">' + escape(title) + '</a></h2>' +
+             '<p class="page__meta">' + meta + '</p></article></div>';
+    }).join('');
+  }
+
+  var input = document.getElementById('search-input');
+  var box = document.getElementById('search-results');
+  if (!input || !box) return;
+
+  getJSON(base + 'manifest.json', function (data) {
+    if (data.version !== INDEX_VERSION) return;
+    manifest = data;
+    data.stopWords.forEach(function (w) { stopWords[w] = true; });
+    getJSON(base + data.docs, function (table) {
+      docs = table;
+      var latest = 0;
+      function run() {
+        var query = input.value, ticket = ++latest;
+        // a slow shard must not overwrite the results of a newer query
+        search(query, function (results) { if (ticket === latest) render(results, box, query); });
+      }
+      input.addEventListener('input', run);
+      var q = new URLSearchParams(window.location.search).get('q');
+      if (q) { input.value = q; }
+      run();
+    });
+  });
+})();
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Cached BibTeX parsing for pubsFromBib.py
+#
+# pybtex is slow on large bibliographies, and `pubsFromBib.py` used to parse
+# every file in `publist` from scratch on every run. This module parses each
+# .bib file once, keyed by the SHA-256 of its contents, and stores the result
+# as a pickle of plain tuples in `.bibcache/`. Rerunning with unchanged .bib
+# files never imports or calls pybtex. When several files do need parsing,
+# they are parsed in parallel worker processes.
+#
+# The cached entries expose the two things the generator uses from pybtex's
+# `Entry`: a `fields` mapping (keys lower-cased, since pybtex's own mapping is
+# case-insensitive) and a `persons` mapping of role -> list of people with
+# `first_names`, `middle_names`, `prelast_names` and `last_names`.
+
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+
+CACHE_DIR = ".bibcache"
+# Bump when the cached layout changes so stale pickles are ignored
+CACHE_VERSION = 2
+
+Person = namedtuple("Person", ["first_names", "middle_names", "prelast_names", "last_names"])
+
+
+class Entry:
+    """A parsed BibTeX entry rebuilt from the cache."""
+
+    __slots__ = ("type", "fields", "persons")
+
+    def __init__(self, type, fields, persons):
+        self.type = type
+        self.fields = fields
+        self.persons = persons
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _parse_to_plain(path):
+    """Parse a .bib file with pybtex and flatten it into picklable tuples.
+
+    Runs in a worker process, so pybtex is only imported there.
+    """
+    from pybtex.database.input import bibtex
+
+    bibdata = bibtex.Parser().parse_file(path)
+    plain = []
+    for bib_id, entry in bibdata.entries.items():
+        fields = tuple((k.lower(), str(v)) for k, v in entry.fields.items())
+        persons = tuple(
+            (role, tuple((tuple(p.first_names), tuple(p.middle_names),
+                          tuple(p.prelast_names), tuple(p.last_names))
+                         for p in people))
+            for role, people in entry.persons.items())
+        plain.append((bib_id, entry.type, fields, persons))
+    return plain
+
+
+def _inflate(plain):
+    """Turn the flattened tuples back into an ordered dict of `Entry` objects."""
+    entries = {}
+    for bib_id, type_, fields, persons in plain:
+        entries[bib_id] = Entry(
+            type_,
+            dict(fields),
+            {role: [Person(*(list(names) for names in person)) for person in people]
+             for role, people in persons})
+    return entries
+
+
+def _cache_file(cache_dir, digest):
+    return os.path.join(cache_dir, "%s.v%d.pickle" % (digest, CACHE_VERSION))
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _store(path, plain):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(plain, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def parse_files(paths, cache_dir=CACHE_DIR, workers=None):
+    """Parse several .bib files, using the cache where possible.
+
+    Returns a dict mapping each path to an ordered dict of bib_id -> `Entry`.
+    Files whose contents are already cached are loaded without pybtex; the
+    rest are parsed in parallel and added to the cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    digests = {path: file_digest(path) for path in paths}
+
+    plain = {}
+    misses = []
+    for path, digest in digests.items():
+        cached = _load(_cache_file(cache_dir, digest))
+        if cached is None:
+            misses.append(path)
+        else:
+            plain[path] = cached
+
+    if len(misses) == 1:
+        plain[misses[0]] = _parse_to_plain(misses[0])
+    elif misses:
+        # multiprocessing is only worth importing when there is parallel work
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers or min(len(misses), os.cpu_count() or 1)) as pool:
+            for path, result in zip(misses, pool.map(_parse_to_plain, misses)):
+                plain[path] = result
+    for path in misses:
+        _store(_cache_file(cache_dir, digests[path]), plain[path])
+
+    # Drop cached parses of file versions that are no longer in use
+    current = {os.path.basename(_cache_file(cache_dir, d)) for d in digests.values()}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pickle") and name not in current:
+            os.remove(os.path.join(cache_dir, name))
+
+    return {path: _inflate(plain[path]) for path in paths}
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Streaming BibTeX reader
+#
+# pybtex builds the whole `BibliographyData` in memory before the first entry
+# can be used, which is slow and memory hungry for institutional exports of
+# hundreds of megabytes. `iter_entries()` reads a .bib file in chunks and
+# yields one entry at a time, so peak memory is bounded by the largest single
+# entry rather than the size of the file.
+#
+# It understands what real-world exports use: `@string` macros (including the
+# predefined month abbreviations), `#` concatenation, brace- and
+# quote-delimited values, bare numbers, nested braces, `@comment`/`@preamble`
+# blocks and entries delimited with parentheses. Yielded entries are the same
+# `bib_cache.Entry` objects the cached pybtex path produces, so
+# `pubsFromBib.render_entry()` accepts either.
+
+import re
+
+from bib_cache import Entry, Person
+
+CHUNK_SIZE = 1 << 16
+
+MONTHS = {
+    "jan": "January", "feb": "February", "mar": "March", "apr": "April",
+    "may": "May", "jun": "June", "jul": "July", "aug": "August",
+    "sep": "September", "oct": "October", "nov": "November", "dec": "December",
+}
+
+PERSON_FIELDS = ("author", "editor")
+
+_HEADER = re.compile(r"@\s*([A-Za-z]+)\s*([{(])")
+_IDENT = re.compile(r"[^\s\"#%'(),={}]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class BibSyntaxError(ValueError):
+    pass
+
+
+def _read_blocks(f):
+    """Yield (type, body) for every @-block in the open file `f`.
+
+    `body` is the text between the block's outer delimiters. Only the block
+    currently being assembled is held in memory.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+
+    while True:
+        at = buf.find("@", pos)
+        if at < 0:
+            if eof:
+                return
+            # nothing but inter-entry text left in the buffer; drop it
+            buf = ""
+            pos = 0
+            chunk = f.read(CHUNK_SIZE)
+            eof = not chunk
+            buf += chunk
+            continue
+
+        # Find the opening delimiter, reading more if the header is split
+        m = _HEADER.match(buf, at)
+        while m is None and not eof and len(buf) - at < 256:
+            chunk = f.read(CHUNK_SIZE)
+            eof = not chunk
+            buf += chunk
+            m = _HEADER.match(buf, at)
+        if m is None:
+            # a stray "@" in comment text between entries
+            pos = at + 1
+            continue
+
+        kind = m.group(1).lower()
+        closer = "}" if m.group(2) == "{" else ")"
+        start = m.end()
+        depth = 0
+        i = start
+        while True:
+            if i >= len(buf):
+                if eof:
+                    raise BibSyntaxError("unterminated @%s block" % kind)
+                # drop what has already been consumed before growing the buffer
+                buf = buf[at:]
+                i -= at
+                start -= at
+                at = 0
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buf += chunk
+                continue
+            c = buf[i]
+            if c == "{":
+                depth += 1
+            elif c == "}" and depth > 0:
+                depth -= 1
+            elif c == closer and depth == 0:
+                break
+            i += 1
+
+        yield kind, buf[start:i]
+        pos = i + 1
+        if pos > CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+
+def _parse_value(body, i, macros):
+    """Parse a `#`-concatenated value starting at body[i]; return (text, next index)."""
+    parts = []
+    n = len(body)
+    while True:
+        while i < n and body[i].isspace():
+            i += 1
+        if i >= n:
+            raise BibSyntaxError("missing value")
+        c = body[i]
+        if c == "{":
+            depth = 0
+            j = i
+            while j < n:
+                if body[j] == "{":
+                    depth += 1
+                elif body[j] == "}":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            parts.append(body[i + 1:j])
+            i = j + 1
+        elif c == '"':
+            depth = 0
+            j = i + 1
+            while j < n and not (body[j] == '"' and depth == 0):
+                if body[j] == "{":
+                    depth += 1
+                elif body[j] == "}":
+                    depth -= 1
+                j += 1
+            parts.append(body[i + 1:j])
+            i = j + 1
+        else:
+            m = _IDENT.match(body, i)
+            if not m:
+                raise BibSyntaxError("unexpected %r in value" % c)
+            word = m.group(0)
+            if word.isdigit():
+                parts.append(word)
+            else:
+                parts.append(macros.get(word.lower(), MONTHS.get(word.lower(), word)))
+            i = m.end()
+
+        while i < n and body[i].isspace():
+            i += 1
+        if i < n and body[i] == "#":
+            i += 1
+            continue
+        return _WHITESPACE.sub(" ", "".join(parts)).strip(), i
+
+
+def _parse_fields(body, i, macros):
+    """Parse `name = value, ...` pairs from body[i:] into an ordered dict."""
+    fields = {}
+    n = len(body)
+    while True:
+        while i < n and (body[i].isspace() or body[i] == ","):
+            i += 1
+        if i >= n:
+            return fields
+        m = _IDENT.match(body, i)
+        if not m:
+            raise BibSyntaxError("expected a field name at %r" % body[i:i + 20])
+        name = m.group(0).lower()
+        i = m.end()
+        while i < n and body[i].isspace():
+            i += 1
+        if i >= n or body[i] != "=":
+            raise BibSyntaxError("expected '=' after field %s" % name)
+        value, i = _parse_value(body, i + 1, macros)
+        fields[name] = value
+
+
+def _split_top_level(text, sep):
+    """Split on `sep` (a regex) wherever it occurs outside braces."""
+    out = []
+    depth = 0
+    last = 0
+    i = 0
+    pattern = re.compile(sep, re.IGNORECASE)
+    while i < len(text):
+        c = text[i]
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+        elif depth == 0:
+            m = pattern.match(text, i)
+            if m:
+                out.append(text[last:i])
+                last = i = m.end()
+                continue
+        i += 1
+    out.append(text[last:])
+    return [part.strip() for part in out if part.strip()]
+
+
+def _split_von(words):
+    """Split "von Last" words into (prelast, last) at lower-case particles."""
+    k = 0
+    while k < len(words) - 1 and words[k][:1].islower():
+        k += 1
+    return words[:k], words[k:]
+
+
+def parse_person(name):
+    """Split a BibTeX name into first, middle, "von" and last names like pybtex does.
+
+    Handles "First Middle von Last", "von Last, First Middle" and
+    "von Last, Jr, First".
+    """
+    parts = _split_top_level(name, r",")
+    if len(parts) == 1:
+        words = _split_top_level(parts[0], r"\s+")
+        if len(words) == 1:
+            return Person([], [], [], words)
+        # the "von Last" part starts at the first lower-case particle, or is the last word
+        split = len(words) - 1
+        for k, word in enumerate(words[1:-1], 1):
+            if word[:1].islower():
+                split = k
+                break
+        given = words[:split]
+        prelast, last = _split_von(words[split:])
+        return Person(given[:1], given[1:], prelast, last)
+    prelast, last = _split_von(_split_top_level(parts[0], r"\s+"))
+    given = _split_top_level(parts[-1], r"\s+")
+    return Person(given[:1], given[1:], prelast, last)
+
+
+def iter_entries(path, encoding="utf-8"):
+    """Yield (bib_id, Entry) for every entry in a .bib file, one at a time."""
+    macros = {}
+    with open(path, "r", encoding=encoding) as f:
+        for kind, body in _read_blocks(f):
+            if kind in ("comment", "preamble"):
+                continue
+            if kind == "string":
+                fields = _parse_fields(body, 0, macros)
+                macros.update(fields)
+                continue
+
+            comma = body.find(",")
+            if comma < 0:
+                bib_id, rest = body.strip(), ""
+            else:
+                bib_id, rest = body[:comma].strip(), body[comma + 1:]
+            fields = _parse_fields(rest, 0, macros)
+
+            persons = {}
+            for role in PERSON_FIELDS:
+                if role in fields:
+                    persons[role] = [parse_person(p)
+                                     for p in _split_top_level(fields.pop(role), r"\s+and\s+")]
+            yield bib_id, Entry(kind, fields, persons)
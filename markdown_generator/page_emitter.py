@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Shared output stage for the markdown generators
+#
+# `publications.py`, `talks.py` and `pubsFromBib.py` all end the same way: one
+# markdown page per row is written into a Jekyll collection directory. This
+# module does that part for them. Pages are written through a thread pool,
+# files whose bytes would not change are left alone, every write goes to a
+# temporary file first and is moved into place so a half-written page never
+# lands in the collection, and pages that a generator wrote on a previous run
+# but not on this one are removed.
+#
+# Each generator keeps its own manifest (a dotfile in the output directory, so
+# Jekyll ignores it), which means that the TSV generator never deletes pages
+# written by the BibTeX generator or by `scripts/fetch_orcid.py`, even though
+# they share `_publications/`.
+
+import json
+import os
+import threading
+from collections import deque
+
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+
+def manifest_path(out_dir, name):
+    """Return the manifest file used by the generator called `name`."""
+    return os.path.join(out_dir, ".%s.manifest.json" % name)
+
+
+def read_manifest(path):
+    """Return the list of filenames recorded in a manifest, or [] if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", [])
+    except (OSError, ValueError):
+        return []
+
+
+def generated_files(out_dir, name):
+    """Paths of the manifest of the generator called `name` and of the pages it lists.
+
+    The generators hand these to scripts/changes.py as their outputs, so a
+    deleted or hand-edited page makes them run again.
+    """
+    mpath = manifest_path(out_dir, name)
+    return [mpath] + [os.path.join(out_dir, page) for page in read_manifest(mpath)]
+
+
+def write_if_changed(path, content):
+    """Atomically write `content` to `path` unless the file already holds it.
+
+    Returns "written", "created" or "unchanged".
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return "unchanged"
+        status = "written"
+    except FileNotFoundError:
+        status = "created"
+
+    # hidden temp file in the same directory, unique per process and thread
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, ".tmp-%d-%d-%s" % (os.getpid(), threading.get_ident(), name))
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return status
+
+
+class PageEmitter:
+    """Collects generated pages and writes them out in one parallel pass.
+
+    Usage:
+
+        emitter = PageEmitter("../_publications", "publications-tsv")
+        for ...:
+            emitter.add(md_filename, md)
+        counts = emitter.finish()
+
+    With `stream=True` pages are handed to the pool as soon as they are added
+    and only their names are kept, so a generator pipeline never holds more
+    than a few pages in memory at once.
+    """
+
+    def __init__(self, out_dir, name, workers=DEFAULT_WORKERS, prune=True, stream=False):
+        self.out_dir = out_dir
+        self.name = name
+        self.workers = workers
+        self.prune = prune
+        self.stream = stream
+        self.pages = {}
+        self.counts = {"created": 0, "written": 0, "unchanged": 0, "kept": 0, "removed": 0}
+        self._pool = None
+        self._pending = deque()
+
+    def add(self, filename, content):
+        """Queue `content` to be written as `filename` inside the output directory."""
+        name = os.path.basename(filename)
+        if not self.stream:
+            self.pages[name] = content
+            return
+
+        if self._pool is None:
+            # imported here because concurrent.futures pulls in logging, which
+            # costs more than writing a handful of pages
+            from concurrent.futures import ThreadPoolExecutor
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        # bound the number of pages waiting in memory
+        while len(self._pending) >= self.workers * 4:
+            self.counts[self._pending.popleft().result()] += 1
+        self._pending.append(self._pool.submit(
+            write_if_changed, os.path.join(self.out_dir, name), content))
+        self.pages[name] = False
+
+    def keep(self, filename):
+        """Record a page as still generated without rewriting it.
+
+        Incremental generators use this for entries they skipped, so the page
+        is not treated as an orphan.
+        """
+        self.pages.setdefault(os.path.basename(filename), None)
+
+    def finish(self):
+        """Write all queued pages, remove orphans and return a dict of counts."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        counts = self.counts
+
+        if self._pool is not None:
+            while self._pending:
+                counts[self._pending.popleft().result()] += 1
+            self._pool.shutdown()
+            self._pool = None
+
+        # None marks a kept page, False one that was already streamed out
+        jobs = [(name, content) for name, content in self.pages.items()
+                if isinstance(content, str)]
+        counts["kept"] = sum(1 for content in self.pages.values() if content is None)
+
+        def emit(job):
+            name, content = job
+            return write_if_changed(os.path.join(self.out_dir, name), content)
+
+        if len(jobs) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for status in pool.map(emit, jobs):
+                    counts[status] += 1
+        else:
+            for status in map(emit, jobs):
+                counts[status] += 1
+
+        mpath = manifest_path(self.out_dir, self.name)
+        if self.prune:
+            for name in set(read_manifest(mpath)) - set(self.pages):
+                try:
+                    os.remove(os.path.join(self.out_dir, name))
+                    counts["removed"] += 1
+                except FileNotFoundError:
+                    pass
+
+        write_if_changed(mpath, json.dumps({"files": sorted(self.pages)}, indent=2) + "\n")
+        return counts
+
+
+def report(name, counts):
+    """Print a one-line summary of a finished emitter run."""
+    print("%s: %d created, %d updated, %d unchanged, %d kept, %d removed" % (
+        name, counts["created"], counts["written"], counts["unchanged"],
+        counts["kept"], counts["removed"]))
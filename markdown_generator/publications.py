@@ -13,29 +13,70 @@
 # The TSV needs to have the following columns: pub_date, title, venue, excerpt, citation, site_url, and paper_url, with a header at the top. 
 # 
 # - `excerpt` and `paper_url` can be blank, but the others must have values. 
+# - Optionally, an `authors` column (names separated by `;`) plus `volume`, `issue`, `pages` and `doi` columns. Rows with authors get their citation from `scripts/citations.py`, in the same style as the BibTeX and ORCID pages; the `citation` column is then ignored.
 # - `pub_date` must be formatted as YYYY-MM-DD.
 # - `url_slug` will be the descriptive part of the .md file and the permalink URL for the page about the paper. The .md file will be `YYYY-MM-DD-[url_slug].md` and the permalink will be `https://[yourdomain]/publications/YYYY-MM-DD-[url_slug]`
 
 
-# ## Import pandas
+# ## Import TSV
+# 
+# The notebook uses pandas' read_csv for this; the script reads the TSV with the standard library instead (see `tsv_reader.py`), because importing pandas takes longer than generating the pages.
 # 
-# We are using the very handy pandas library for dataframes.
+# I found it important to put this data in a tab-separated values format, because there are a lot of commas in this kind of data and comma-separated values can get messed up.
 
-# In[2]:
+# In[3]:
 
-import pandas as pd
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
+from profiling import start, stage
 
+start("publications")
 
-# ## Import TSV
+# ## Skip the run when nothing changed
 # 
-# Pandas makes this easy with the read_csv function. We are using a TSV, so we specify the separator as a tab, or `\t`.
-# 
-# I found it important to put this data in a tab-separated values format, because there are a lot of commas in this kind of data and comma-separated values can get messed up. However, you can modify the import statement, as pandas also has read_excel(), read_json(), and others.
+# `scripts/changes.py` asks git which files changed since the last successful run. If neither the TSV, the code that turns it into pages, nor any page written last time changed, there is nothing to do. Set `SITE_FORCE=1` to run anyway. The check only runs when the script is run, not when it is imported.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def generated_outputs():
+    """The manifest and the pages this script wrote last time."""
+    from page_emitter import generated_files
+    return [os.path.abspath(p) for p in generated_files("../_publications", "publications-tsv")]
 
-# In[3]:
 
-publications = pd.read_csv("publications.tsv", sep="\t", header=0)
-publications
+def changes_since_last_run():
+    """The inputs and pages that changed since this script last ran successfully."""
+    from changes import ChangeSet
+    inputs = [os.path.join(HERE, name) for name in ("publications.tsv", "publications.py", "page_emitter.py", "tsv_reader.py")] \
+        + [os.path.join(HERE, os.pardir, "scripts", "citations.py"), os.path.join(HERE, os.pardir, "_config.yml")]
+    return ChangeSet("publications-tsv", inputs, outputs=generated_outputs())
+
+
+changes = None
+if __name__ == "__main__":
+    changes = changes_since_last_run()
+    if not changes.changed():
+        print("publications.py: publications.tsv and the generated pages are unchanged; nothing to do")
+        sys.exit(0)
+
+from citations import DEFAULT_STYLE, render_citations
+from tsv_reader import read_tsv
+
+stage("read")
+publications = read_tsv("publications.tsv")
+
+# Format the citations of every row that lists its authors in one batch
+records = [{"authors": [a.strip() for a in item.authors.split(";") if a.strip()],
+            "title": item.title, "venue": item.venue, "year": item.pub_date[:4],
+            "volume": getattr(item, "volume", ""), "issue": getattr(item, "issue", ""),
+            "pages": getattr(item, "pages", ""), "doi": getattr(item, "doi", "")}
+           for item in publications if getattr(item, "authors", "").strip()]
+citations = iter(render_citations(records, style=DEFAULT_STYLE))
+for item in publications:
+    if getattr(item, "authors", "").strip():
+        item.citation = next(citations)
 
 
 # ## Escape special characters
@@ -61,8 +102,13 @@ def html_escape(text):
 
 # In[5]:
 
-import os
-for row, item in publications.iterrows():
+from page_emitter import PageEmitter, report
+
+emitter = PageEmitter("../_publications", "publications-tsv")
+
+stage("render")
+
+for row, item in enumerate(publications):
     
     md_filename = str(item.pub_date) + "-" + item.url_slug + ".md"
     html_filename = str(item.pub_date) + "-" + item.url_slug
@@ -103,7 +149,11 @@ for row, item in publications.iterrows():
     
     md_filename = os.path.basename(md_filename)
        
-    with open("../_publications/" + md_filename, 'w') as f:
-        f.write(md)
+    emitter.add(md_filename, md)
+
+stage("write")
+report("publications.py", emitter.finish())
+if changes is not None:
+    changes.record(outputs=generated_outputs())
 
 
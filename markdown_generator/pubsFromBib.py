@@ -16,13 +16,22 @@
 # TODO: Merge this with the existing TSV parsing solution
 
 
-from pybtex.database.input import bibtex
-import pybtex.database.input.bibtex 
 from time import strptime
-import string
 import html
 import os
 import re
+import json
+import hashlib
+import argparse
+import sys
+from page_emitter import PageEmitter, generated_files, report
+import bib_cache
+import bib_stream
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
+from profiling import span, stage, start
+from citations import DEFAULT_STYLE, STYLES, default_highlight, render_citations
+from changes import ChangeSet
 
 #todo: incorporate different collection types rather than a catch all publications, requires other changes to template
 publist = {
@@ -54,107 +63,267 @@ def html_escape(text):
     return "".join(html_escape_table.get(c,c) for c in text)
 
 
-for pubsource in publist:
-    parser = bibtex.Parser()
-    bibdata = parser.parse_file(publist[pubsource]["file"])
+# Bump when render_entry's output format changes so every page is rebuilt
+RENDER_VERSION = 3
+
+# Entries rendered per citation batch; bounded so --stream still holds only a few entries
+BATCH_SIZE = 256
+
+# Per-entry fingerprints from the last run, kept next to the emitter's manifest
+FINGERPRINTS = "../_publications/.publications-bib.entries.json"
+
+
+def entry_fingerprint(pubsource, entry, style=DEFAULT_STYLE):
+    """Hash an entry's normalized fields and authors together with its publist config and citation style."""
+    normalized = {
+        "render": RENDER_VERSION,
+        "style": style,
+        "highlight": default_highlight(style),
+        "source": publist[pubsource],
+        "fields": sorted((k.lower(), str(v)) for k, v in entry.fields.items()),
+        "persons": sorted((role.lower(), [list(p) for p in people])
+                          for role, people in entry.persons.items()),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_fingerprints(path=FINGERPRINTS):
+    """Return the {pubsource:bib_id: {"fingerprint", "file"}} map from the last run."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def venue_of(pubsource, entry):
+    """The venue line of an entry: the publist pre-text and the venue field, without BibTeX braces."""
+    b = entry.fields
+    return publist[pubsource]["venue-pretext"]+b[publist[pubsource]["venuekey"]].replace("{", "").replace("}","").replace("\\","")
+
+
+def citation_record(pubsource, entry):
+    """The fields of an entry that citations.render_citations uses."""
+    b = entry.fields
+    return {
+        "authors": entry.persons.get("author", []),
+        "title": b.get("title", ""),
+        "venue": venue_of(pubsource, entry) if publist[pubsource]["venuekey"] in b else "",
+        "year": b.get("year", ""),
+        "volume": b.get("volume", ""),
+        "issue": b.get("number", ""),
+        "pages": b.get("pages", ""),
+        "doi": b.get("doi", ""),
+    }
+
+
+def render_entry(pubsource, entry, citation):
+    """Build the markdown page for one BibTeX entry, given its formatted citation.
+
+    Returns (md_filename, md). Raises KeyError if an expected field is missing.
+    """
+    #reset default date
+    pub_year = "1900"
+    pub_month = "01"
+    pub_day = "01"
+
+    b = entry.fields
+
+    pub_year = f'{b["year"]}'
+
+    #todo: this hack for month and day needs some cleanup
+    if "month" in b.keys(): 
+        if(len(b["month"])<3):
+            pub_month = "0"+b["month"]
+            pub_month = pub_month[-2:]
+        elif(b["month"] not in range(12)):
+            tmnth = strptime(b["month"][:3],'%b').tm_mon   
+            pub_month = "{:02d}".format(tmnth) 
+        else:
+            pub_month = str(b["month"])
+    if "day" in b.keys(): 
+        pub_day = str(b["day"])
 
-    #loop through the individual references in a given bibtex file
-    for bib_id in bibdata.entries:
-        #reset default date
-        pub_year = "1900"
-        pub_month = "01"
-        pub_day = "01"
-        
-        b = bibdata.entries[bib_id].fields
         
-        try:
-            pub_year = f'{b["year"]}'
-
-            #todo: this hack for month and day needs some cleanup
-            if "month" in b.keys(): 
-                if(len(b["month"])<3):
-                    pub_month = "0"+b["month"]
-                    pub_month = pub_month[-2:]
-                elif(b["month"] not in range(12)):
-                    tmnth = strptime(b["month"][:3],'%b').tm_mon   
-                    pub_month = "{:02d}".format(tmnth) 
-                else:
-                    pub_month = str(b["month"])
-            if "day" in b.keys(): 
-                pub_day = str(b["day"])
-
-                
-            pub_date = pub_year+"-"+pub_month+"-"+pub_day
-            
-            #strip out {} as needed (some bibtex entries that maintain formatting)
-            clean_title = b["title"].replace("{", "").replace("}","").replace("\\","").replace(" ","-")    
-
-            url_slug = re.sub("\\[.*\\]|[^a-zA-Z0-9_-]", "", clean_title)
-            url_slug = url_slug.replace("--","-")
-
-            md_filename = (str(pub_date) + "-" + url_slug + ".md").replace("--","-")
-            html_filename = (str(pub_date) + "-" + url_slug).replace("--","-")
-
-            #Build Citation from text
-            citation = ""
-
-            #citation authors - todo - add highlighting for primary author?
-            for author in bibdata.entries[bib_id].persons["author"]:
-                citation = citation+" "+author.first_names[0]+" "+author.last_names[0]+", "
-
-            #citation title
-            citation = citation + "\"" + html_escape(b["title"].replace("{", "").replace("}","").replace("\\","")) + ".\""
-
-            #add venue logic depending on citation type
-            venue = publist[pubsource]["venue-pretext"]+b[publist[pubsource]["venuekey"]].replace("{", "").replace("}","").replace("\\","")
-
-            citation = citation + " " + html_escape(venue)
-            citation = citation + ", " + pub_year + "."
-
-            
-            ## YAML variables
-            md = "---\ntitle: \""   + html_escape(b["title"].replace("{", "").replace("}","").replace("\\","")) + '"\n'
-            
-            md += """collection: """ +  publist[pubsource]["collection"]["name"]
-
-            md += """\npermalink: """ + publist[pubsource]["collection"]["permalink"]  + html_filename
-            
-            note = False
-            if "note" in b.keys():
-                if len(str(b["note"])) > 5:
-                    md += "\nexcerpt: '" + html_escape(b["note"]) + "'"
-                    note = True
-
-            md += "\ndate: " + str(pub_date) 
-
-            md += "\nvenue: '" + html_escape(venue) + "'"
-            
-            url = False
-            if "url" in b.keys():
-                if len(str(b["url"])) > 5:
-                    md += "\npaperurl: '" + b["url"] + "'"
-                    url = True
-
-            md += "\ncitation: '" + html_escape(citation) + "'"
-
-            md += "\n---"
-
-            
-            ## Markdown description for individual page
-            if note:
-                md += "\n" + html_escape(b["note"]) + "\n"
-
-            if url:
-                md += "\n[Access paper here](" + b["url"] + "){:target=\"_blank\"}\n" 
-            else:
-                md += "\nUse [Google Scholar](https://scholar.google.com/scholar?q="+html.escape(clean_title.replace("-","+"))+"){:target=\"_blank\"} for full citation"
-
-            md_filename = os.path.basename(md_filename)
-
-            with open("../_publications/" + md_filename, 'w', encoding="utf-8") as f:
-                f.write(md)
-            print(f'SUCCESSFULLY PARSED {bib_id}: \"', b["title"][:60],"..."*(len(b['title'])>60),"\"")
-        # field may not exist for a reference
-        except KeyError as e:
-            print(f'WARNING Missing Expected Field {e} from entry {bib_id}: \"', b["title"][:30],"..."*(len(b['title'])>30),"\"")
+    pub_date = pub_year+"-"+pub_month+"-"+pub_day
+    
+    #strip out {} as needed (some bibtex entries that maintain formatting)
+    clean_title = b["title"].replace("{", "").replace("}","").replace("\\","").replace(" ","-")    
+
+    url_slug = re.sub("\\[.*\\]|[^a-zA-Z0-9_-]", "", clean_title)
+    url_slug = url_slug.replace("--","-")
+
+    md_filename = (str(pub_date) + "-" + url_slug + ".md").replace("--","-")
+    html_filename = (str(pub_date) + "-" + url_slug).replace("--","-")
+
+    #add venue logic depending on citation type
+    venue = venue_of(pubsource, entry)
+
+    
+    ## YAML variables
+    md = "---\ntitle: \""   + html_escape(b["title"].replace("{", "").replace("}","").replace("\\","")) + '"\n'
+    
+    md += """collection: """ +  publist[pubsource]["collection"]["name"]
+
+    # the author list, for scripts/export_bibliography.py
+    authors = [" ".join(p.first_names + p.middle_names + p.prelast_names + p.last_names)
+               for p in entry.persons.get("author", [])]
+    if authors:
+        md += "\nauthors:" + "".join("\n  - '" + html_escape(a.replace("{", "").replace("}","").replace("\\","")) + "'"
+                                     for a in authors)
+
+    md += """\npermalink: """ + publist[pubsource]["collection"]["permalink"]  + html_filename
+    
+    note = False
+    if "note" in b.keys():
+        if len(str(b["note"])) > 5:
+            md += "\nexcerpt: '" + html_escape(b["note"]) + "'"
+            note = True
+
+    md += "\ndate: " + str(pub_date) 
+
+    md += "\nvenue: '" + html_escape(venue) + "'"
+    
+    url = False
+    if "url" in b.keys():
+        if len(str(b["url"])) > 5:
+            md += "\npaperurl: '" + b["url"] + "'"
+            url = True
+
+    md += "\ncitation: '" + html_escape(citation) + "'"
+
+    md += "\n---"
+
+    
+    ## Markdown description for individual page
+    if note:
+        md += "\n" + html_escape(b["note"]) + "\n"
+
+    if url:
+        md += "\n[Access paper here](" + b["url"] + "){:target=\"_blank\"}\n" 
+    else:
+        md += "\nUse [Google Scholar](https://scholar.google.com/scholar?q="+html.escape(clean_title.replace("-","+"))+"){:target=\"_blank\"} for full citation"
+
+    return os.path.basename(md_filename), md
+
+
+def iter_entries(stream=False, sources=None):
+    """Yield (pubsource, bib_id, entry) for every entry of every file in publist.
+
+    `sources` limits this to some of the publist keys. By default each file is parsed whole through the pybtex cache. With
+    `stream=True` entries are read one at a time by bib_stream, so very large
+    exports never have to fit in memory.
+    """
+    sources = list(publist) if sources is None else sources
+    if stream:
+        for pubsource in sources:
+            for bib_id, entry in bib_stream.iter_entries(publist[pubsource]["file"]):
+                yield pubsource, bib_id, entry
+        return
+
+    # parse every bib file up front; unchanged files come straight from the cache
+    with span("parse"):
+        parsed = bib_cache.parse_files([publist[pubsource]["file"] for pubsource in sources])
+    for pubsource in sources:
+        entries = parsed[publist[pubsource]["file"]]
+        for bib_id in entries:
+            yield pubsource, bib_id, entries[bib_id]
+
+
+def main():
+    start("pubsFromBib")
+    parser = argparse.ArgumentParser(description="Generate publication pages from BibTeX files")
+    parser.add_argument("--stream", action="store_true",
+                        help="read .bib files one entry at a time instead of parsing them with pybtex")
+    parser.add_argument("--style", choices=sorted(STYLES), default=DEFAULT_STYLE,
+                        help=f"citation style (default: {DEFAULT_STYLE})")
+    args = parser.parse_args()
+
+    # ask git which .bib files changed since the last successful run; when only
+    # some did, the entries of the others are not even parsed
+    here = os.path.dirname(os.path.abspath(__file__))
+    bibs = {pubsource: os.path.join(here, publist[pubsource]["file"]) for pubsource in publist}
+    code = [os.path.join(here, name) for name in ("pubsFromBib.py", "bib_cache.py", "bib_stream.py", "page_emitter.py")] \
+        + [os.path.join(here, os.pardir, "scripts", "citations.py"), os.path.join(here, os.pardir, "_config.yml")]
+
+    def outputs():
+        return [os.path.abspath(p) for p in generated_files("../_publications", "publications-bib") + [FINGERPRINTS]]
+
+    changes = ChangeSet("publications-bib", list(bibs.values()) + code, outputs=outputs(), key=args.style)
+    if changes.paths is None or changes.matching(code + outputs()):
+        sources = list(publist)
+    else:
+        sources = [pubsource for pubsource in publist if changes.changed(bibs[pubsource])]
+    if not sources:
+        print("pubsFromBib.py: the .bib files and the generated pages are unchanged; nothing to do")
+        return
+
+    emitter = PageEmitter("../_publications", "publications-bib", stream=args.stream)
+    previous = load_fingerprints()
+    fingerprints = {}
+    skipped = 0
+    pending = []
+
+    # pages of the unchanged .bib files stay as they are
+    for key, old in previous.items():
+        if key.split(":", 1)[0] not in sources and key.split(":", 1)[0] in publist \
+                and os.path.exists(os.path.join("../_publications", old["file"])):
+            emitter.keep(old["file"])
+            fingerprints[key] = old
+            skipped += 1
+
+    def flush():
+        # format the citations of the pending entries in one batch, then render their pages
+        citations = render_citations([citation_record(pubsource, entry) for pubsource, _, entry, _ in pending],
+                                     style=args.style)
+        for (pubsource, bib_id, entry, fingerprint), citation in zip(pending, citations):
+            b = entry.fields
+            try:
+                md_filename, md = render_entry(pubsource, entry, citation)
+                emitter.add(md_filename, md)
+                fingerprints[pubsource + ":" + bib_id] = {"fingerprint": fingerprint, "file": md_filename}
+                print(f'SUCCESSFULLY PARSED {bib_id}: \"', b["title"][:60],"..."*(len(b['title'])>60),"\"")
+            # field may not exist for a reference
+            except KeyError as e:
+                print(f'WARNING Missing Expected Field {e} from entry {bib_id}: \"', b["title"][:30],"..."*(len(b['title'])>30),"\"")
+                # leave the page from an earlier run alone rather than let the emitter prune it
+                old = previous.get(pubsource + ":" + bib_id)
+                if old and os.path.exists(os.path.join("../_publications", old["file"])):
+                    emitter.keep(old["file"])
+                    fingerprints[pubsource + ":" + bib_id] = old
+                    print(f"WARNING Kept the previous page {old['file']} for {bib_id}")
+        pending.clear()
+
+    stage("render")
+
+    #loop through the individual references in every bibtex file
+    for pubsource, bib_id, entry in iter_entries(stream=args.stream, sources=sources):
+        key = pubsource + ":" + bib_id
+        fingerprint = entry_fingerprint(pubsource, entry, args.style)
+
+        # unchanged entry whose page is still on disk: nothing to render
+        old = previous.get(key)
+        if old and old["fingerprint"] == fingerprint \
+                and os.path.exists(os.path.join("../_publications", old["file"])):
+            emitter.keep(old["file"])
+            fingerprints[key] = old
+            skipped += 1
             continue
+
+        pending.append((pubsource, bib_id, entry, fingerprint))
+        if len(pending) >= BATCH_SIZE:
+            flush()
+    flush()
+
+    stage("write")
+    report("pubsFromBib.py", emitter.finish())
+    print(f"{skipped} unchanged entries skipped")
+
+    with open(FINGERPRINTS, "w", encoding="utf-8") as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+    changes.record(outputs=outputs())
+
+
+# the guard keeps bib_cache's worker processes from re-running the generator
+if __name__ == "__main__":
+    main()
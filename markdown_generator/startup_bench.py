@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Startup benchmark for the markdown generators
+#
+# The generators run in CI and pre-commit loops where most runs change only a
+# page or two, so interpreter startup and imports dominate. This measures, for
+# each generator, what it costs to get to the first line of real work: the
+# script's top-level imports are collected with `ast` (nothing is executed),
+# then run in a fresh `python -X importtime` process. The report lists the
+# total import time and the slowest modules, so a heavy import creeping back
+# in shows up immediately.
+#
+# Imports are not all a run costs before it can stop: a generator first asks
+# scripts/changes.py whether anything changed, which starts git. So each
+# generator is also run for real, once to bring its pages up to date and then
+# again while it has nothing to do, and that no-op run is timed against a bare
+# `python -c pass`. The first run writes pages like any other run would.
+#
+# Run from the `markdown_generator` folder:
+#
+#     python startup_bench.py                    # all generators
+#     python startup_bench.py talks.py -n 10     # one script, best of 10
+#     python startup_bench.py --budget 50        # exit 1 if any script's imports exceed 50 ms
+#     python startup_bench.py --run-budget 40    # exit 1 if a no-op run costs 40 ms more than a bare interpreter
+#     python startup_bench.py --imports-only     # do not run the generators
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+
+GENERATORS = ["publications.py", "talks.py", "pubsFromBib.py"]
+
+
+def _is_path_setup(node):
+    """True for a module-level `sys.path.insert(...)` / `sys.path.append(...)` call."""
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) \
+        and ast.unparse(node.value.func) in ("sys.path.insert", "sys.path.append")
+
+
+def top_level_imports(path):
+    """Return the source of every module-level import statement in a script.
+
+    sys.path changes are kept too (with `__file__` defined for them), since
+    some scripts use them to reach the shared modules in scripts/.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    statements = [ast.unparse(node) for node in tree.body
+                  if isinstance(node, (ast.Import, ast.ImportFrom)) or _is_path_setup(node)]
+    return [f"__file__ = {os.path.abspath(path)!r}"] + statements
+
+
+def measure(imports, cwd):
+    """Run `imports` under -X importtime and return [(cumulative_us, depth, module)]."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(imports)],
+        cwd=cwd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # nesting is shown by two extra spaces of indentation per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((int(cumulative_us), depth, name.strip()))
+    return modules
+
+
+def importtime_rows(imports, cwd):
+    """Return [(cumulative_us, module)] for the modules the script imports directly.
+
+    Only top-level rows are kept; their cumulative time already includes
+    everything they pull in.
+    """
+    rows = measure(imports, cwd)
+    # modules imported by the interpreter itself before running -c are not the script's
+    startup = {name for _, _, name in measure([], cwd)}
+    return [(us, name) for us, depth, name in rows if depth == 0 and name not in startup]
+
+
+def bench(script, cwd, repeat):
+    """Return (best_total_us, rows_of_best_run) for one generator script."""
+    imports = top_level_imports(os.path.join(cwd, script))
+    best = None
+    for _ in range(repeat):
+        rows = importtime_rows(imports, cwd)
+        total = sum(us for us, _ in rows)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    return best
+
+
+def run_time(cmd, cwd, repeat):
+    """Return the best wall time of `cmd` over `repeat` runs, in microseconds."""
+    # a forced run is never a no-op
+    env = {k: v for k, v in os.environ.items() if k not in ("SITE_FORCE", "SITE_PROFILE")}
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = (time.perf_counter() - started) * 1e6
+        if proc.returncode != 0:
+            raise RuntimeError((proc.stderr.strip().splitlines() or ["failed"])[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def noop_run(script, cwd, repeat):
+    """Return (noop_us, bare_us): the best times of a run of `script` with nothing to do and of `python -c pass`.
+
+    The two are measured alternately, so both see the same machine load.
+    """
+    run_time([sys.executable, script], cwd, 1)
+    noop = bare = None
+    for _ in range(repeat):
+        t = run_time([sys.executable, script], cwd, 1)
+        b = run_time([sys.executable, "-c", "pass"], cwd, 1)
+        noop = t if noop is None else min(noop, t)
+        bare = b if bare is None else min(bare, b)
+    return noop, bare
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure generator import time with -X importtime")
+    parser.add_argument("scripts", nargs="*", default=GENERATORS, help="scripts to measure")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="runs per script; the fastest is reported")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports to list")
+    parser.add_argument("--budget", type=float, help="fail if any script's imports take longer than this many ms")
+    parser.add_argument("--run-budget", type=float,
+                        help="fail if a no-op run of any script takes this many ms longer than a bare interpreter")
+    parser.add_argument("--imports-only", action="store_true", help="only measure imports; do not run the scripts")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    over_budget = []
+    for script in args.scripts:
+        total, rows = bench(script, cwd, args.repeat)
+        print(f"{script}: {total / 1000:.1f} ms in imports")
+        for us, name in sorted(rows, reverse=True)[:args.top]:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+        if args.budget is not None and total / 1000 > args.budget:
+            over_budget.append(script)
+        if args.imports_only:
+            continue
+
+        try:
+            noop, bare = noop_run(script, cwd, args.repeat)
+        except RuntimeError as ex:
+            print(f"    could not run {script}: {ex}")
+            continue
+        print(f"    {noop / 1000:8.1f} ms  run with nothing to do "
+              f"({(noop - bare) / 1000:.1f} ms more than a bare interpreter, {bare / 1000:.1f} ms)")
+        if args.run_budget is not None and (noop - bare) / 1000 > args.run_budget and script not in over_budget:
+            over_budget.append(script)
+
+    if over_budget:
+        print("Over budget:", ", ".join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,44 @@
 
 # In[1]:
 
-import pandas as pd
 import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
+from profiling import start, stage
+
+start("talks")
+
+# ## Skip the run when nothing changed
+# 
+# `scripts/changes.py` asks git which files changed since the last successful run. If neither the TSV, the code that turns it into pages, nor any page written last time changed, there is nothing to do. Set `SITE_FORCE=1` to run anyway. The check only runs when the script is run, not when it is imported.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def generated_outputs():
+    """The manifest and the pages this script wrote last time."""
+    from page_emitter import generated_files
+    return [os.path.abspath(p) for p in generated_files("../_talks", "talks-tsv")]
+
+
+def changes_since_last_run():
+    """The inputs and pages that changed since this script last ran successfully."""
+    from changes import ChangeSet
+    inputs = [os.path.join(HERE, name) for name in ("talks.tsv", "talks.py", "page_emitter.py", "tsv_reader.py")] \
+        + [os.path.join(HERE, os.pardir, "scripts", "front_matter.py")]
+    return ChangeSet("talks-tsv", inputs, outputs=generated_outputs())
+
+
+changes = None
+if __name__ == "__main__":
+    changes = changes_since_last_run()
+    if not changes.changed():
+        print("talks.py: talks.tsv and the generated pages are unchanged; nothing to do")
+        sys.exit(0)
+
+from tsv_reader import read_tsv
+from page_emitter import PageEmitter, report
+from front_matter import yaml_quote
 
 
 # ## Data format
@@ -27,19 +63,19 @@ import os
 
 # ## Import TSV
 # 
-# Pandas makes this easy with the read_csv function. We are using a TSV, so we specify the separator as a tab, or `\t`.
+# The notebook uses pandas' read_csv for this; the script reads the TSV with the standard library instead (see `tsv_reader.py`), because importing pandas takes longer than generating the pages.
 # 
-# I found it important to put this data in a tab-separated values format, because there are a lot of commas in this kind of data and comma-separated values can get messed up. However, you can modify the import statement, as pandas also has read_excel(), read_json(), and others.
+# I found it important to put this data in a tab-separated values format, because there are a lot of commas in this kind of data and comma-separated values can get messed up.
 
 # In[3]:
 
-talks = pd.read_csv("talks.tsv", sep="\t", header=0)
-talks
+stage("read")
+talks = read_tsv("talks.tsv")
 
 
 # ## Escape special characters
 # 
-# YAML is very picky about how it takes a valid string, so we are replacing single and double quotes (and ampersands) with their HTML encoded equivilents. This makes them look not so readable in raw format, but they are parsed and rendered nicely.
+# YAML is very picky about how it takes a valid string, so we are replacing single and double quotes (and ampersands) with their HTML encoded equivilents. This makes them look not so readable in raw format, but they are parsed and rendered nicely. Front matter values also go through `yaml_quote` (`scripts/front_matter.py`, shared with `fetch_orcid.py`), which escapes backslashes for the double-quoted YAML strings.
 
 # In[4]:
 
@@ -56,6 +92,11 @@ def html_escape(text):
         return "False"
 
 
+def yaml_value(text):
+    """An HTML-escaped value, ready to go between double quotes in the front matter."""
+    return yaml_quote(html_escape(text))
+
+
 # ## Creating the markdown files
 # 
 # This is where the heavy lifting is done. This loops through all the rows in the TSV dataframe, then starts to concatentate a big string (```md```) that contains the markdown for each type. It does the YAML metadata first, then does the description for the individual page.
@@ -64,30 +105,34 @@ def html_escape(text):
 
 loc_dict = {}
 
-for row, item in talks.iterrows():
+emitter = PageEmitter("../_talks", "talks-tsv")
+
+stage("render")
+
+for row, item in enumerate(talks):
     
     md_filename = str(item.date) + "-" + item.url_slug + ".md"
     html_filename = str(item.date) + "-" + item.url_slug 
     year = item.date[:4]
     
-    md = "---\ntitle: \""   + item.title + '"\n'
+    md = "---\ntitle: \""   + yaml_value(item.title) + '"\n'
     md += "collection: talks" + "\n"
     
     if len(str(item.type)) > 3:
-        md += 'type: "' + item.type + '"\n'
+        md += 'type: "' + yaml_value(item.type) + '"\n'
     else:
         md += 'type: "Talk"\n'
     
     md += "permalink: /talks/" + html_filename + "\n"
     
     if len(str(item.venue)) > 3:
-        md += 'venue: "' + item.venue + '"\n'
+        md += 'venue: "' + yaml_value(item.venue) + '"\n'
         
     if len(str(item.date)) > 3:
         md += "date: " + str(item.date) + "\n"
     
     if len(str(item.location)) > 3:
-        md += 'location: "' + str(item.location) + '"\n'
+        md += 'location: "' + yaml_value(str(item.location)) + '"\n'
            
     md += "---\n"
     
@@ -103,8 +148,12 @@ for row, item in talks.iterrows():
     md_filename = os.path.basename(md_filename)
     #print(md)
     
-    with open("../_talks/" + md_filename, 'w') as f:
-        f.write(md)
+    emitter.add(md_filename, md)
+
+stage("write")
+report("talks.py", emitter.finish())
+if changes is not None:
+    changes.record(outputs=generated_outputs())
 
 
 # These files are in the talks directory, one directory below where we're working from.
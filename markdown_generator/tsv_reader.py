@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Lightweight TSV reader for the markdown generators
+#
+# `publications.py` and `talks.py` used to import pandas only to call
+# `read_csv` on a small TSV, and importing pandas takes far longer than
+# generating the pages. This reads the same files with the standard library.
+# Rows support the attribute access the generators use (`item.title`,
+# `item.pub_date`, ...), and empty cells come back as "" rather than NaN, which
+# the generators' `len(str(...)) > n` checks already treat as missing.
+
+import csv
+from types import SimpleNamespace
+
+
+def read_tsv(path):
+    """Return the rows of a tab-separated file with a header line as a list of namespaces."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter="\t", restval="")
+        return [SimpleNamespace(**{k.strip(): v for k, v in row.items() if k is not None})
+                for row in reader]
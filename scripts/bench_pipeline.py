@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks of the content generators on synthetic corpora
+
+For each corpus size (100 to 100,000 entries) this builds a throwaway copy of
+the site's layout in a temporary folder. The copy has synthetic
+publications.tsv, talks.tsv and .bib files, and _publications/ and _talks/
+trees of that many entries. Each generator is then run twice: once "cold",
+on fresh outputs and caches, and once "warm", straight after, when nothing
+has changed.
+
+    markdown_generator/publications.py, talks.py, pubsFromBib.py
+    scripts/cv_markdown_to_json.py
+    talkmap.py (through build_talkmap, with a stub geocoder: no network)
+
+Every run is a separate process. For each run this records:
+
+- wall time, CPU time and throughput in entries per second
+- peak resident memory of that process
+- file operations inside the workspace: opens for reading and for writing,
+  renames and removes. An audit hook counts them in the generator's process
+  and its threads.
+
+Results are written as JSON to .bench/ and compared with the stored
+baseline in scripts/bench_baseline.json. A run counts as a regression when
+its time, memory or file operation count is more than --tolerance above
+the baseline. Times under MIN_SECONDS, which are mostly interpreter
+startup, are not compared. The baseline is tied to the machine it was
+recorded on. Re-record it with --save-baseline when moving to a new machine,
+or after a change that is meant to alter the numbers.
+
+Usage (from anywhere in the repository):
+    python scripts/bench_pipeline.py                      # sizes 100, 1000, 10000
+    python scripts/bench_pipeline.py --sizes 100000 talkmap
+    python scripts/bench_pipeline.py --save-baseline      # record new reference numbers
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, "scripts", "bench_baseline.json")
+RESULTS_DIR = os.path.join(ROOT, ".bench")
+
+SIZES = (100, 1000, 10000)
+PHASES = ("cold", "warm")
+TOLERANCE = 0.25
+MIN_SECONDS = 0.2
+SEED = 1234
+
+# What a workspace needs from the repository, besides the synthetic data
+COPY = ["_config.yml", "_pages/cv.md", "talkmap.py", "talkmap_*.py", "scripts/*.py",
+        "markdown_generator/*.py"]
+
+# Installed into every benchmarked process before the generator runs
+COUNTER = r'''
+import atexit, json, os, sys, threading
+_root = os.path.realpath(os.environ["BENCH_ROOT"]) + os.sep
+_counts = {"reads": 0, "writes": 0, "renames": 0, "removes": 0}
+_lock = threading.Lock()
+
+def _inside(path):
+    if isinstance(path, int):
+        return False
+    path = os.path.realpath(os.fsdecode(path))
+    return path.startswith(_root) and not path.endswith((".py", ".pyc"))
+
+def _count(key):
+    with _lock:
+        _counts[key] += 1
+
+_done = False
+
+def _hook(event, args):
+    if _done:
+        return
+    if event == "open":
+        path, mode, flags = args
+        if _inside(path):
+            writing = any(c in mode for c in "wax+") if mode else flags & (os.O_WRONLY | os.O_RDWR)
+            _count("writes" if writing else "reads")
+    elif event == "os.rename" and _inside(args[0]):
+        _count("renames")
+    elif event == "os.remove" and _inside(args[0]):
+        _count("removes")
+
+def _save():
+    # audit hooks cannot be removed; stop counting so the results file is not counted
+    global _done
+    _done = True
+    with open(os.environ["BENCH_COUNTS"], "w") as f:
+        json.dump(_counts, f)
+
+sys.addaudithook(_hook)
+atexit.register(_save)
+'''
+
+RUN_SCRIPT = r'''
+import runpy
+sys.argv = {argv!r}
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+runpy.run_path(sys.argv[0], run_name="__main__")
+'''
+
+RUN_TALKMAP = r'''
+import hashlib
+sys.path.insert(0, os.getcwd())
+import talkmap
+
+class StubGeocoder:
+    """Deterministic coordinates derived from the query; no network."""
+    def geocode(self, query, timeout=None):
+        h = hashlib.sha1(query.encode("utf-8")).digest()
+        return talkmap.CachedLocation(query, h[0] / 255 * 140 - 70, h[1] / 255 * 360 - 180)
+
+talkmap.build_talkmap("_talks", "talkmap", geocoder=StubGeocoder())
+'''
+
+
+class Benchmark:
+    """One generator run: a script and its arguments, or Python code, run in `cwd`."""
+
+    def __init__(self, name, cwd, argv=None, code=None, requires=(), needs_trees=False):
+        self.name = name
+        self.cwd = cwd
+        self.argv = argv
+        self.code = code
+        self.requires = requires
+        self.needs_trees = needs_trees
+
+    def program(self):
+        return COUNTER + (RUN_SCRIPT.format(argv=self.argv) if self.argv else self.code)
+
+    def missing(self):
+        return [m for m in self.requires if importlib.util.find_spec(m) is None]
+
+
+# The readers of the collection trees come first; the generators then write fresh trees
+BENCHMARKS = [
+    Benchmark("cv_markdown_to_json", ".",
+              argv=["scripts/cv_markdown_to_json.py", "--input", "_pages/cv.md",
+                    "--output", "_data/cv.json", "--config", "_config.yml"], needs_trees=True),
+    Benchmark("talkmap", ".", code=RUN_TALKMAP, needs_trees=True),
+    Benchmark("publications", "markdown_generator", argv=["publications.py"]),
+    Benchmark("talks", "markdown_generator", argv=["talks.py"]),
+    Benchmark("pubsFromBib", "markdown_generator", argv=["pubsFromBib.py"], requires=("pybtex",)),
+    Benchmark("pubsFromBib-stream", "markdown_generator", argv=["pubsFromBib.py", "--stream"]),
+]
+
+
+# ---------------------------------------------------------------- corpora
+
+WORDS = ("groundwater lithium brine isotope boron salinity aquifer mining sediment "
+         "geochemistry basin evaporation arsenic uranium watershed model field "
+         "analysis climate river soil trace metal radium strontium carbon").split()
+
+
+def _words(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _date(i):
+    return f"{1990 + i % 35}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+
+
+def _location(i):
+    # a few hundred distinct places, so geocoding is grouped as with real talks
+    return f"City {i % 311}, Region {i % 37}"
+
+
+def write_corpus(folder, size, seed=SEED):
+    """Write the synthetic inputs and collection trees for `size` entries into `folder`."""
+    rng = random.Random(seed)
+    gen = os.path.join(folder, "markdown_generator")
+
+    with open(os.path.join(gen, "publications.tsv"), "w", encoding="utf-8") as f:
+        f.write("pub_date\ttitle\tvenue\texcerpt\tcitation\turl_slug\tpaper_url\tslides_url\n")
+        for i in range(size):
+            title = f"{_words(rng, 6).capitalize()} {i}"
+            f.write(f"{_date(i)}\t{title}\tJournal {i % 50}\t{_words(rng, 25)}\t"
+                    f"Author, A. ({_date(i)[:4]}). \"{title}.\" <i>Journal {i % 50}</i>.\t"
+                    f"paper-{i}\thttp://example.org/files/paper{i}.pdf\t\n")
+
+    with open(os.path.join(gen, "talks.tsv"), "w", encoding="utf-8") as f:
+        f.write("title\ttype\turl_slug\tvenue\tdate\tlocation\ttalk_url\tdescription\n")
+        for i in range(size):
+            f.write(f"{_words(rng, 5).capitalize()} {i}\tTalk\ttalk-{i}\tUniversity {i % 90}\t"
+                    f"{_date(i)}\t{_location(i)}\t\t{_words(rng, 30)}\n")
+
+    # half the entries in each of the two files pubsFromBib reads
+    for name, kind, venue_key, count in (("proceedings.bib", "inproceedings", "booktitle", size // 2),
+                                         ("pubs.bib", "article", "journal", size - size // 2)):
+        with open(os.path.join(gen, name), "w", encoding="utf-8") as f:
+            for i in range(count):
+                f.write(f"@{kind}{{{kind}{i},\n"
+                        f"  title = {{{_words(rng, 7).capitalize()} {kind} {i}}},\n"
+                        f"  author = {{Author{i % 97}, First and Other{i % 31}, Second}},\n"
+                        f"  {venue_key} = {{Venue {i % 40}}},\n"
+                        f"  year = {{{1990 + i % 35}}},\n"
+                        f"  month = {{{('jan', 'apr', 'jul', 'oct')[i % 4]}}},\n"
+                        f"  note = {{{_words(rng, 20)}}},\n"
+                        f"  url = {{https://doi.org/10.0000/{kind}.{i}}}\n}}\n\n")
+
+    write_trees(folder, size, rng)
+
+
+def write_trees(folder, size, rng=None):
+    """Write `size` synthetic pages into each of _publications/ and _talks/."""
+    rng = rng or random.Random(SEED)
+    for collection in ("publications", "talks"):
+        out = os.path.join(folder, "_" + collection)
+        shutil.rmtree(out, ignore_errors=True)
+        os.makedirs(out)
+        for i in range(size):
+            extra = f"location: \"{_location(i)}\"\ntype: \"Talk\"\n" if collection == "talks" \
+                else f"citation: 'Author, A. ({_date(i)[:4]}).'\n"
+            with open(os.path.join(out, f"{_date(i)}-synthetic-{i}.md"), "w", encoding="utf-8") as f:
+                f.write(f"---\ntitle: \"{_words(rng, 6).capitalize()} {i}\"\n"
+                        f"collection: {collection}\npermalink: /{collection}/synthetic-{i}\n"
+                        f"date: {_date(i)}\nvenue: \"Venue {i % 40}\"\n{extra}"
+                        f"excerpt: '{_words(rng, 12)}'\n---\n\n{_words(rng, 80)}\n")
+
+
+def make_workspace(size):
+    folder = tempfile.mkdtemp(prefix=f"bench-{size}-")
+    for pattern in COPY:
+        for path in glob.glob(os.path.join(ROOT, pattern)):
+            target = os.path.join(folder, os.path.relpath(path, ROOT))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+    os.makedirs(os.path.join(folder, "_data"), exist_ok=True)
+    write_corpus(folder, size)
+    return folder
+
+
+# ---------------------------------------------------------------- running
+
+def run(bench, workspace, size, phase):
+    """Run one benchmark in its own process and return its measurements."""
+    counts_file = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+    env = dict(os.environ, BENCH_ROOT=workspace, BENCH_COUNTS=counts_file)
+    env.pop("SITE_PROFILE", None)
+
+    wall = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", bench.program()],
+                            cwd=os.path.join(workspace, bench.cwd), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # wait4 gives this child's own resource usage, unlike getrusage(RUSAGE_CHILDREN)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - wall
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    stderr = proc.stderr.read().decode("utf-8", "replace")
+    proc.stderr.close()
+
+    try:
+        with open(counts_file, "r", encoding="utf-8") as f:
+            file_ops = json.load(f)
+    except (OSError, ValueError):
+        file_ops = {}
+    os.remove(counts_file)
+
+    result = {
+        "benchmark": bench.name, "size": size, "phase": phase, "items": size,
+        "seconds": round(wall, 4),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 4),
+        "items_per_second": round(size / wall, 1) if wall else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": usage.ru_maxrss * 1024,
+        "file_ops": file_ops,
+        "returncode": proc.returncode,
+    }
+    if proc.returncode:
+        result["error"] = stderr.strip().splitlines()[-1] if stderr.strip() else "failed"
+    return result
+
+
+def run_size(size, benchmarks, keep=False):
+    workspace = make_workspace(size)
+    results = []
+    try:
+        trees_fresh = True
+        for bench in benchmarks:
+            if not bench.needs_trees and trees_fresh:
+                # the generators start from empty collections, like a first build
+                for collection in ("_publications", "_talks"):
+                    shutil.rmtree(os.path.join(workspace, collection), ignore_errors=True)
+                    os.makedirs(os.path.join(workspace, collection))
+                trees_fresh = False
+            for phase in PHASES:
+                result = run(bench, workspace, size, phase)
+                results.append(result)
+                report(result)
+    finally:
+        if keep:
+            print(f"Workspace kept in {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+
+def report(result):
+    ops = result["file_ops"]
+    line = (f"{result['benchmark']:<20} {result['size']:>7} {result['phase']:<5}"
+            f"{result['seconds']:>9.3f}s {result['items_per_second'] or 0:>11.0f}/s "
+            f"{result['peak_rss_bytes'] / 1e6:>8.1f} MB  "
+            f"r{ops.get('reads', 0)} w{ops.get('writes', 0)} "
+            f"mv{ops.get('renames', 0)} rm{ops.get('removes', 0)}")
+    if result.get("error"):
+        line += f"  FAILED: {result['error']}"
+    print(line, flush=True)
+
+
+# ---------------------------------------------------------------- baseline
+
+def result_key(result):
+    return f"{result['benchmark']}/{result['size']}/{result['phase']}"
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return a list of human-readable regressions against `baseline`."""
+    problems = []
+    limit = 1 + tolerance
+    for result in results:
+        key = result_key(result)
+        if result.get("error"):
+            problems.append(f"{key}: failed ({result['error']})")
+            continue
+        base = baseline.get(key)
+        if not base:
+            continue
+        if result["seconds"] > MIN_SECONDS and result["seconds"] > base["seconds"] * limit:
+            problems.append(f"{key}: {result['seconds']:.3f}s vs {base['seconds']:.3f}s")
+        if result["peak_rss_bytes"] > base["peak_rss_bytes"] * limit:
+            problems.append(f"{key}: peak memory {result['peak_rss_bytes'] / 1e6:.1f} MB "
+                            f"vs {base['peak_rss_bytes'] / 1e6:.1f} MB")
+        for op, count in result["file_ops"].items():
+            before = base.get("file_ops", {}).get(op)
+            if before is not None and count > before * limit and count - before > 2:
+                problems.append(f"{key}: {count} file {op} vs {before}")
+    return problems
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("results", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Merge `results` into the stored baseline."""
+    stored = load_baseline(path)
+    for result in results:
+        if not result.get("error"):
+            stored[result_key(result)] = {k: result[k] for k in
+                                          ("seconds", "cpu_seconds", "items_per_second",
+                                           "peak_rss_bytes", "file_ops")}
+    data = {"python": sys.version.split()[0], "platform": sys.platform,
+            "cpus": os.cpu_count(), "results": dict(sorted(stored.items()))}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+        f.write("\n")
+
+
+def main():
+    names = [b.name for b in BENCHMARKS]
+    parser = argparse.ArgumentParser(description="Benchmark the content generators on synthetic corpora")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"benchmarks to run (default: all of {', '.join(names)})")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma-separated corpus sizes (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed slowdown or growth over the baseline, as a fraction")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline instead of comparing")
+    parser.add_argument("--keep", action="store_true", help="keep the workspaces for inspection")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(names)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    benchmarks = [b for b in BENCHMARKS if not args.benchmarks or b.name in args.benchmarks]
+    for bench in list(benchmarks):
+        missing = bench.missing()
+        if missing:
+            print(f"Skipping {bench.name}: {', '.join(missing)} not installed")
+            benchmarks.remove(bench)
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results += run_size(size, benchmarks, keep=args.keep)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = os.path.join(RESULTS_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "platform": sys.platform,
+                   "cpus": os.cpu_count(), "results": results}, f, indent=1)
+    print(f"Results written to {out}")
+
+    if args.save_baseline:
+        save_baseline(results)
+        print(f"Baseline updated: {BASELINE_FILE}")
+        return 0
+
+    baseline = load_baseline()
+    if not baseline:
+        print("No baseline to compare with; record one with --save-baseline")
+        return 0
+    problems = compare(results, baseline, args.tolerance)
+    for problem in problems:
+        print("Regression:", problem)
+    if not problems:
+        print(f"No regressions against the baseline (tolerance {args.tolerance:.0%})")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# scripts/build.py
+# One command to regenerate all generated content, incrementally
+#
+# Each content generator has its own entry point and working directory. This
+# models them as a dependency graph:
+#
+#   ORCID / publications.tsv / *.bib / talks.tsv
+#       -> _publications/, _talks/
+#           -> _data/cv.json, _data/listings.json, assets/search/, talkmap/,
+#              files/publications.{bib,ris,json}
+#   files/*.pdf -> files/previews/, _data/pdfs.json (read by listings and search)
+#   images/ -> images/resized/, _data/images.json
+#
+# Every step lists the files it reads. Before a step runs, its inputs are
+# hashed; if the hash matches the last successful run (kept in .build-state.json)
+# and its outputs exist, the step is skipped. Steps whose dependencies are done
+# run in parallel, each in its own working directory.
+#
+# Usage (from anywhere in the repository):
+#   python scripts/build.py                 # everything except the optional steps
+#   python scripts/build.py cv talkmap      # just these steps and what they need
+#   python scripts/build.py --orcid         # include the ORCID fetch (needs secrets)
+#   python scripts/build.py --tsv           # include the TSV generators
+#
+# The ORCID fetch and the TSV generators (publications-tsv, talks-tsv) are
+# optional: they only run when named or enabled with their flag. The TSVs in
+# markdown_generator/ are the template's sample data, and the pages they once
+# produced have been edited by hand since, so regenerating them by default
+# would bring back the sample papers and overwrite those edits.
+#   python scripts/build.py --force --jobs 4
+#   python scripts/build.py --list          # show steps and whether they are up to date
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_FILE = os.path.join(ROOT, ".build-state.json")
+PYTHON = sys.executable
+
+
+class Step:
+    """A generator invocation: what it runs, where, what it reads and writes."""
+
+    def __init__(self, name, cmd, cwd=".", inputs=(), outputs=(), deps=(),
+                 requires=(), optional=False):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        # glob patterns relative to the repository root
+        self.inputs = inputs
+        self.outputs = outputs
+        self.deps = deps
+        # inputs that must exist for the step to make sense at all
+        self.requires = requires
+        # only run when asked for by name (or --orcid / --tsv)
+        self.optional = optional
+
+
+STEPS = [
+    Step("orcid", [PYTHON, "scripts/fetch_orcid.py"],
+         inputs=["scripts/fetch_orcid.py", "scripts/citations.py", "scripts/front_matter.py", "_config.yml"],
+         outputs=["_publications"], optional=True),
+    Step("publications-tsv", [PYTHON, "publications.py"], cwd="markdown_generator",
+         inputs=["markdown_generator/publications.tsv", "markdown_generator/publications.py",
+                 "markdown_generator/page_emitter.py", "markdown_generator/tsv_reader.py",
+                 "scripts/citations.py", "scripts/changes.py", "_config.yml"],
+         outputs=["_publications"], requires=["markdown_generator/publications.tsv"], optional=True),
+    Step("publications-bib", [PYTHON, "pubsFromBib.py"], cwd="markdown_generator",
+         inputs=["markdown_generator/*.bib", "markdown_generator/pubsFromBib.py",
+                 "markdown_generator/bib_cache.py", "markdown_generator/bib_stream.py",
+                 "markdown_generator/page_emitter.py", "scripts/citations.py", "scripts/changes.py",
+                 "_config.yml"],
+         outputs=["_publications"],
+         requires=["markdown_generator/proceedings.bib", "markdown_generator/pubs.bib"]),
+    Step("talks-tsv", [PYTHON, "talks.py"], cwd="markdown_generator",
+         inputs=["markdown_generator/talks.tsv", "markdown_generator/talks.py",
+                 "markdown_generator/page_emitter.py", "markdown_generator/tsv_reader.py",
+                 "scripts/changes.py", "scripts/front_matter.py"],
+         outputs=["_talks"], requires=["markdown_generator/talks.tsv"], optional=True),
+    Step("pdfs", [PYTHON, "scripts/build_pdf_previews.py"],
+         inputs=["files/*.pdf", "scripts/build_pdf_previews.py"],
+         outputs=["_data/pdfs.json"]),
+    Step("cv", [PYTHON, "scripts/cv_markdown_to_json.py", "--input", "_pages/cv.md",
+                "--output", "_data/cv.json", "--config", "_config.yml"],
+         inputs=["_pages/cv.md", "_config.yml", "_publications/*.md", "_talks/*.md",
+                 "_teaching/*.md", "_portfolio/*.md", "scripts/cv_markdown_to_json.py",
+                 "scripts/collection_index.py", "scripts/changes.py"],
+         outputs=["_data/cv.json"],
+         deps=["orcid", "publications-tsv", "publications-bib", "talks-tsv"]),
+    Step("listings", [PYTHON, "scripts/build_listings.py"],
+         inputs=["_config.yml", "_publications/*.md", "_talks/*.md", "_posts/*.md",
+                 "_data/pdfs.json", "scripts/build_listings.py", "scripts/build_pdf_previews.py",
+                 "scripts/collection_index.py"],
+         outputs=["_data/listings.json"],
+         deps=["orcid", "publications-tsv", "publications-bib", "talks-tsv", "pdfs"]),
+    Step("bibliography", [PYTHON, "scripts/export_bibliography.py"],
+         inputs=["_publications/*.md", "scripts/export_bibliography.py", "scripts/citations.py",
+                 "scripts/collection_index.py"],
+         outputs=["files/publications.bib", "files/publications.ris", "files/publications.json"],
+         deps=["orcid", "publications-tsv", "publications-bib"]),
+    # checks what the generators wrote (and hand-edited pages) before Jekyll has to
+    Step("validate", [PYTHON, "scripts/validate_front_matter.py"],
+         inputs=["_publications/*", "_talks/*", "_teaching/*", "_portfolio/*", "_posts/*", "_pages/*",
+                 "scripts/validate_front_matter.py"],
+         deps=["orcid", "publications-tsv", "publications-bib", "talks-tsv"]),
+    Step("search", [PYTHON, "scripts/build_search_index.py"],
+         inputs=["_config.yml", "_publications/*.md", "_talks/*.md", "_teaching/*.md",
+                 "_portfolio/*.md", "_posts/*.md", "_data/pdfs.json", "files/previews/*.txt",
+                 "scripts/build_search_index.py", "scripts/build_listings.py",
+                 "scripts/build_pdf_previews.py", "scripts/collection_index.py"],
+         outputs=["assets/search/manifest.json"],
+         deps=["orcid", "publications-tsv", "publications-bib", "talks-tsv", "pdfs"]),
+    # images/resized/ is the output, so subfolders starting with "r" are left out of the inputs
+    Step("images", [PYTHON, "scripts/build_images.py"],
+         inputs=["images/*.[jJ][pP]*[gG]", "images/[!r]*/*.[jJ][pP]*[gG]", "scripts/build_images.py"],
+         outputs=["_data/images.json"]),
+    Step("talkmap", [PYTHON, "talkmap.py"],
+         inputs=["_talks/*.md", "talkmap.py", "talkmap_*.py", "scripts/collection_index.py",
+                 "scripts/changes.py"],
+         outputs=["talkmap/org-locations.js"], deps=["talks-tsv"]),
+]
+
+
+def expand(patterns):
+    """Return the sorted repository-relative files matching `patterns`."""
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(ROOT, pattern)):
+            if os.path.isfile(path):
+                files.add(os.path.relpath(path, ROOT))
+    return sorted(files)
+
+
+def own_output(step, path):
+    """True if `path` is one of the step's outputs or inside an output folder."""
+    path = path.replace(os.sep, "/")
+    return any(path == out or path.startswith(out.rstrip("/") + "/") for out in step.outputs)
+
+
+def input_hash(step):
+    """Hash the names and contents of every file the step reads, plus its command.
+
+    Files the step writes itself are left out, so the hash taken before a run
+    still matches after it.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([os.path.basename(c) for c in step.cmd]).encode("utf-8"))
+    for path in expand(step.inputs):
+        if own_output(step, path):
+            continue
+        h.update(path.encode("utf-8") + b"\0")
+        with open(os.path.join(ROOT, path), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+
+def up_to_date(step, state, digest):
+    return state.get(step.name) == digest and \
+        all(os.path.exists(os.path.join(ROOT, p)) for p in step.outputs)
+
+
+def missing_requirements(step):
+    return [p for p in step.requires if not expand([p])]
+
+
+def select(steps, targets, include=()):
+    """Return the steps to consider: the targets plus everything they depend on.
+
+    `include` names the optional steps to run without naming them as targets.
+    """
+    by_name = {s.name: s for s in steps}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown step(s): {', '.join(unknown)}. Known: {', '.join(by_name)}")
+
+    wanted = set()
+    stack = list(targets) or [s.name for s in steps if s.name in include or not s.optional]
+    while stack:
+        name = stack.pop()
+        if name in wanted:
+            continue
+        step = by_name[name]
+        # optional steps are only pulled in when named or explicitly enabled
+        if step.optional and name not in include and name not in targets:
+            continue
+        wanted.add(name)
+        stack.extend(step.deps)
+    return [s for s in steps if s.name in wanted]
+
+
+def run_step(step):
+    """Run one step; return (returncode, seconds, combined output)."""
+    start = time.time()
+    proc = subprocess.run(step.cmd, cwd=os.path.join(ROOT, step.cwd),
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return proc.returncode, time.time() - start, proc.stdout
+
+
+def build(steps, force=False, jobs=None, dry_run=False, verbose=False):
+    """Run `steps` in dependency order, in parallel where possible.
+
+    Returns {step name: status}, where status is one of "ran", "up-to-date",
+    "skipped (...)" or "failed".
+    """
+    names = {s.name for s in steps}
+    pending = {s.name: s for s in steps}
+    status = {}
+    state = load_state()
+
+    def ready(step):
+        return all(d not in names or d in status for d in step.deps)
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        running = {}
+        while pending or running:
+            for name, step in list(pending.items()):
+                if not ready(step):
+                    continue
+                del pending[name]
+                failed_deps = [d for d in step.deps if status.get(d, "").startswith(("failed", "skipped (dep"))]
+                missing = missing_requirements(step)
+                if failed_deps:
+                    status[name] = f"skipped (dependency {failed_deps[0]} failed)"
+                elif missing:
+                    status[name] = f"skipped (no {', '.join(missing)})"
+                else:
+                    digest = input_hash(step)
+                    if not force and up_to_date(step, state, digest):
+                        status[name] = "up-to-date"
+                    elif dry_run:
+                        status[name] = "would run"
+                    else:
+                        print(f"[{name}] running: {' '.join(step.cmd[1:])} (in {step.cwd})")
+                        running[pool.submit(run_step, step)] = (step, digest)
+                        continue
+                print(f"[{name}] {status[name]}")
+
+            if not running:
+                if pending and not any(ready(s) for s in pending.values()):
+                    raise SystemExit("Dependency cycle between: " + ", ".join(pending))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, digest = running.pop(future)
+                code, seconds, output = future.result()
+                if verbose or code != 0:
+                    for line in output.rstrip().splitlines():
+                        print(f"[{step.name}]   {line}")
+                if code == 0:
+                    status[step.name] = "ran"
+                    # the inputs as they were when the step started: anything edited
+                    # while it ran has not been built yet
+                    state[step.name] = digest
+                    save_state(state)
+                else:
+                    status[step.name] = "failed"
+                print(f"[{step.name}] {status[step.name]} in {seconds:.1f}s")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally rebuild all generated site content")
+    parser.add_argument("targets", nargs="*", help="steps to build (default: all)")
+    parser.add_argument("--orcid", action="store_true", help="include the ORCID fetch")
+    parser.add_argument("--tsv", action="store_true",
+                        help="include the publications.tsv and talks.tsv generators")
+    parser.add_argument("--force", action="store_true", help="run steps even if their inputs are unchanged")
+    parser.add_argument("--jobs", "-j", type=int, help="maximum steps to run at once")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="show what would run")
+    parser.add_argument("--list", action="store_true", help="list steps and their state")
+    parser.add_argument("--verbose", "-v", action="store_true", help="show each step's output")
+    args = parser.parse_args()
+
+    include = (["orcid"] if args.orcid else []) + (["publications-tsv", "talks-tsv"] if args.tsv else [])
+    steps = select(STEPS, args.targets, include)
+    if args.force:
+        # the steps inherit it, so their own change detection (scripts/changes.py) is bypassed too
+        os.environ["SITE_FORCE"] = "1"
+    if args.list:
+        state = load_state()
+        for step in STEPS:
+            missing = missing_requirements(step)
+            if missing:
+                note = f"missing {', '.join(missing)}"
+            else:
+                note = "up to date" if up_to_date(step, state, input_hash(step)) else "stale"
+            deps = f" <- {', '.join(step.deps)}" if step.deps else ""
+            print(f"{step.name:18} {note}{' (optional)' if step.optional else ''}{deps}")
+        return
+
+    status = build(steps, force=args.force, jobs=args.jobs, dry_run=args.dry_run,
+                   verbose=args.verbose)
+    failed = [name for name, s in status.items() if s == "failed"]
+    if failed:
+        print("Failed:", ", ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Generate resized JPEG and WebP variants of the photos in images/
+
+The field galleries used to serve every photo as the full-size original,
+several megabytes each, to fill 300-pixel tiles. This writes variants of
+every .jpg/.jpeg under images/ at standard widths (never wider than the
+original) into images/resized/. Each variant is oriented according to its
+EXIF tag and then saved without the EXIF block, so camera and GPS metadata
+are not published. Photos are processed in parallel, one per worker process.
+
+_data/images.json lists the variants of each photo, keyed by its site path,
+with srcset strings ready for templates:
+
+    site.data.images["/images/SDU/Llamas.jpg"]
+        width, height       size of the original, after orientation
+        srcset.jpeg         "/images/resized/SDU/Llamas-1a2b3c4d-320.jpg 320w, ..."
+        srcset.webp         the same widths as WebP
+        digest              SHA-1 of the original
+
+_includes/responsive-image.html turns an entry into a <picture> element.
+The manifest doubles as the cache. A photo whose content hash is still the
+same, and whose variants are all present, is skipped, so a rebuild only
+processes new or edited photos. Variant names include the hash. Variants
+of edited or deleted photos are removed. A photo that cannot be read is
+reported and left out of the manifest; the others are still processed, and
+it is tried again on the next run.
+
+Needs Pillow (pip install pillow).
+
+Usage (from the repository root):
+    python scripts/build_images.py [--root .] [--jobs N] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import stage, start
+
+SOURCE_DIR = "images"
+OUTPUT_DIR = os.path.join("images", "resized")
+MANIFEST_FILE = os.path.join("_data", "images.json")
+
+# The lightbox still opens the original, so nothing wider than a laptop screen is needed
+WIDTHS = (320, 640, 960, 1440)
+EXTENSIONS = (".jpg", ".jpeg")
+EXIF_ORIENTATION = 0x0112
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_photos(root):
+    """Site paths ("/images/...") of the photos under images/, outside images/resized/."""
+    source = os.path.join(root, SOURCE_DIR)
+    skip = os.path.normpath(os.path.join(root, OUTPUT_DIR))
+    photos = []
+    for folder, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(folder, d)) != skip)
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                rel = os.path.relpath(os.path.join(folder, name), root)
+                photos.append("/" + rel.replace(os.sep, "/"))
+    return photos
+
+
+def variant_widths(width):
+    """The standard widths narrower than `width`, plus the original width if it is smaller than the largest."""
+    widths = [w for w in WIDTHS if w < width]
+    widths.append(min(width, WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def render_variants(root, site_path, digest):
+    """Write the variants of one photo; return its manifest entry. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    rel = site_path.lstrip("/")
+    sub = os.path.relpath(os.path.splitext(rel)[0], SOURCE_DIR)
+    base = f"{sub}-{digest[:8]}"
+    with Image.open(os.path.join(root, rel)) as original:
+        icc = original.info.get("icc_profile")
+        width, height = original.size
+        turned = original.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        if turned:
+            width, height = height, width
+        widths = variant_widths(width)
+
+        # let the JPEG decoder scale down by 1/2, 1/4 or 1/8 when the largest variant allows it
+        need = (widths[-1], max(1, round(height * widths[-1] / width)))
+        original.draft("RGB", need[::-1] if turned else need)
+        image = ImageOps.exif_transpose(original)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        srcset = {"jpeg": [], "webp": []}
+        for w in widths:
+            h = max(1, round(height * w / width))
+            resized = image if image.size == (w, h) else image.resize((w, h), Image.LANCZOS,
+                                                                       reducing_gap=3.0)
+            for fmt, ext, options in (("jpeg", "jpg", {"quality": JPEG_QUALITY, "optimize": True,
+                                                        "progressive": True}),
+                                      ("webp", "webp", {"quality": WEBP_QUALITY})):
+                out = os.path.join(OUTPUT_DIR, f"{base}-{w}.{ext}")
+                os.makedirs(os.path.dirname(os.path.join(root, out)), exist_ok=True)
+                # no exif= argument, so the EXIF block is dropped; the colour profile is kept
+                resized.save(os.path.join(root, out), fmt.upper(), icc_profile=icc, **options)
+                srcset[fmt].append(f"/{out.replace(os.sep, '/')} {w}w")
+    return {"digest": digest, "width": width, "height": height,
+            "srcset": {fmt: ", ".join(items) for fmt, items in srcset.items()}}
+
+
+def try_render_variants(root, site_path, digest):
+    """render_variants(), returning (entry, None), or (None, error message) if the photo cannot be read."""
+    try:
+        return render_variants(root, site_path, digest), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def variant_files(entry):
+    """Repository-relative paths of the files an entry's srcsets point to."""
+    return [item.split()[0].lstrip("/") for srcset in entry["srcset"].values()
+            for item in srcset.split(", ")]
+
+
+def build_images(root=".", jobs=None, force=False):
+    """Bring images/resized/ and the manifest up to date; return counts of photos processed."""
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+    except (OSError, ValueError):
+        old = {}
+
+    stage("hash")
+    manifest, todo = {}, []
+    for site_path in find_photos(root):
+        digest = file_digest(os.path.join(root, site_path.lstrip("/")))
+        entry = old.get(site_path)
+        if not force and entry and entry["digest"] == digest \
+                and all(os.path.exists(os.path.join(root, p)) for p in variant_files(entry)):
+            manifest[site_path] = entry
+        else:
+            todo.append((site_path, digest))
+
+    stage("resize")
+    failed = 0
+    if todo:
+        if jobs == 1 or len(todo) == 1:
+            results = [try_render_variants(root, path, digest) for path, digest in todo]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(try_render_variants, [root] * len(todo),
+                                        *zip(*todo)))
+        for (site_path, _), (entry, error) in zip(todo, results):
+            if error:
+                # whatever it managed to write is not in the manifest, so it is removed below
+                print(f"Skipping {site_path}: {error}", file=sys.stderr)
+                failed += 1
+            else:
+                manifest[site_path] = entry
+
+    stage("write")
+    keep = {os.path.normpath(os.path.join(root, p)) for e in manifest.values() for p in variant_files(e)}
+    removed = 0
+    for folder, _, files in os.walk(os.path.join(root, OUTPUT_DIR)):
+        for name in files:
+            path = os.path.normpath(os.path.join(folder, name))
+            if path not in keep:
+                os.remove(path)
+                removed += 1
+
+    content = json.dumps(manifest, indent=1, sort_keys=True) + "\n"
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            unchanged = f.read() == content
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return {"photos": len(manifest), "processed": len(todo) - failed, "failed": failed,
+            "removed": removed}
+
+
+def main():
+    start("build_images")
+    parser = argparse.ArgumentParser(description="Generate responsive JPEG/WebP variants of the photos in images/")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="regenerate every photo's variants")
+    args = parser.parse_args()
+
+    counts = build_images(args.root, args.jobs, args.force)
+    print(f"Images: {counts['photos']} photos, {counts['processed']} processed, "
+          f"{counts['failed']} failed, {counts['removed']} stale variants removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Precompute the publication, talk and blog post listings into _data/listings.json
+
+_pages/publications.html used to walk every publication once per entry in
+site.publication_category, and the year archive grouped site.posts while
+looping; both grow with (categories x entries) on every Jekyll build. This
+reads the collections once, through the shared collection index, and writes
+each listing already sorted (newest first) and grouped, so the pages only
+iterate what they show:
+
+    site.data.listings.publications.items          every entry, newest first
+    site.data.listings.publications.by_category    {category: [item positions]}
+    site.data.listings.publications.by_year        [{key: year, items: [...]}]
+    site.data.listings.publications.by_venue       [{key: venue, items: [...]}]
+
+and the same for talks (by year and venue) and posts (by year). Each item
+carries the fields _includes/archive-single.html reads, including the URL
+Jekyll gives the page, so it can be passed to that include as `post`.
+
+Usage (from the repository root):
+    python scripts/build_listings.py [--root .] [--output _data/listings.json]
+"""
+
+import argparse
+import json
+import os
+import re
+
+import yaml
+
+from build_pdf_previews import linked_pdfs, load_manifest
+from collection_index import CollectionIndex, INDEX_FILE, collection_dirs
+from profiling import stage, start
+
+LISTINGS_FILE = os.path.join("_data", "listings.json")
+
+# Which groupings each listing gets
+LISTINGS = {
+    "publications": ("category", "year", "venue"),
+    "talks": ("year", "venue"),
+    "posts": ("year",),
+}
+
+# Front matter archive-single.html and archive-single-talk.html use
+ITEM_FIELDS = ("title", "date", "venue", "location", "type", "category", "excerpt",
+               "citation", "paperurl", "slidesurl", "bibtexurl", "link", "read_time", "header")
+
+DATE_FILENAME = re.compile(r"^(\d{2,4}-\d{1,2}-\d{1,2})-(.*)$")
+
+
+def slugify(text):
+    """Jekyll's default slugify: runs of non-alphanumerics become '-', lower-cased."""
+    return re.sub(r"[\W_]+", "-", str(text)).strip("-").lower()
+
+
+def front_matter_defaults(config, collection):
+    """Merge the `defaults` values from _config.yml that apply to a whole collection."""
+    values = {}
+    for default in config.get("defaults") or []:
+        scope = default.get("scope") or {}
+        if scope.get("type") in (None, collection) and not scope.get("path"):
+            values.update(default.get("values") or {})
+    return values
+
+
+def page_url(record, collection, config, slug):
+    """The URL Jekyll gives a document, from its permalink or the collection's pattern."""
+    template = record.permalink
+    if not template:
+        if collection == "posts":
+            template = config.get("permalink") or "/:categories/:year/:month/:day/:title:output_ext"
+        else:
+            meta = (config.get("collections") or {}).get(collection) or {}
+            template = meta.get("permalink") or "/:collection/:path:output_ext"
+    if ":" in template:
+        date = str(record.date or "")
+        categories = record.get("categories") or record.get("category") or []
+        if isinstance(categories, str):
+            categories = categories.split()
+        name = os.path.splitext(os.path.basename(record.path))[0]
+        template = re.sub(r":(\w+)", lambda m: {
+            "collection": collection,
+            "path": name,
+            "name": slugify(name),
+            "title": slug,
+            "categories": "/".join(str(c).lower() for c in categories),
+            "year": date[:4], "month": date[5:7], "day": date[8:10],
+            "output_ext": ".html",
+        }.get(m.group(1), m.group(0)), template)
+    return re.sub(r"/{2,}", "/", template)
+
+
+def listing_item(record, collection, config, defaults, pdfs=None):
+    """The dict a listing page hands to archive-single.html as `post`.
+
+    `pdfs` is the PDF manifest (scripts/build_pdf_previews.py); a page with no
+    excerpt and no text of its own gets the opening of the PDF it links to.
+    """
+    name = os.path.splitext(os.path.basename(record.path))[0]
+    match = DATE_FILENAME.match(name)
+    slug = match.group(2) if match else name
+
+    item = {key: record.get(key) for key in ITEM_FIELDS if record.get(key) is not None}
+    for key, value in defaults.items():
+        if key in ITEM_FIELDS:
+            item.setdefault(key, value)
+
+    # Jekyll takes a missing date from the file name; ORCID pages only have a year
+    if "date" not in item:
+        if match:
+            item["date"] = match.group(1)
+        elif str(record.get("year", "")).isdigit():
+            item["date"] = f"{record.get('year')}-01-01"
+    if "title" not in item:
+        item["title"] = " ".join(w.capitalize() for w in slug.split("-"))
+    if "venue" not in item and record.get("journal"):
+        item["venue"] = record.get("journal")
+    if "excerpt" not in item and record.lead:
+        item["excerpt"] = record.lead
+    if "excerpt" not in item:
+        for entry in linked_pdfs(record, pdfs or {}):
+            if entry.get("excerpt"):
+                item["excerpt"] = entry["excerpt"]
+                break
+
+    item["url"] = page_url(record, collection, config, slug)
+    # archive-single.html only renders Markdown in titles of real documents
+    item["id"] = item["url"]
+    item["collection"] = collection
+    item["words"] = record.words
+    return item
+
+
+def group_positions(items, key):
+    """[{key, items: [positions]}] in order of first appearance in `items`.
+
+    Keys differing only in case are one group, shown as first spelled.
+    """
+    groups = {}
+    for i, item in enumerate(items):
+        value = key(item)
+        if value:
+            groups.setdefault(value.casefold(), {"key": value, "items": []})["items"].append(i)
+    return list(groups.values())
+
+
+def build_listing(records, collection, config, groupings, pdfs=None):
+    defaults = front_matter_defaults(config, collection)
+    items = [listing_item(r, collection, config, defaults, pdfs) for r in records
+             if r.get("published", True) is not False]
+    # newest first, like `site.publications reversed`; undated entries last
+    items.sort(key=lambda item: (str(item.get("date", "")), item["url"]), reverse=True)
+    items.sort(key=lambda item: "date" not in item)
+
+    listing = {"items": items}
+    if "category" in groupings:
+        by_category = {}
+        for i, item in enumerate(items):
+            if item.get("category"):
+                by_category.setdefault(str(item["category"]), []).append(i)
+        listing["by_category"] = by_category
+    if "year" in groupings:
+        listing["by_year"] = group_positions(items, lambda item: str(item.get("date", ""))[:4])
+    if "venue" in groupings:
+        venues = group_positions(items, lambda item: str(item.get("venue", "")).strip())
+        listing["by_venue"] = sorted(venues, key=lambda group: group["key"].casefold())
+    return listing
+
+
+def build_listings(root=".", output=None):
+    """Write the listings JSON; return True if its content changed."""
+    output = output or os.path.join(root, LISTINGS_FILE)
+    with open(os.path.join(root, "_config.yml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    stage("read")
+    index = CollectionIndex.load(collection_dirs(root, list(LISTINGS)),
+                                 cache_path=os.path.join(root, INDEX_FILE))
+
+    pdfs = load_manifest(root)
+
+    stage("group")
+    listings = {collection: build_listing(index.query(collection=collection), collection,
+                                          config, groupings, pdfs)
+                for collection, groupings in LISTINGS.items()}
+
+    stage("write")
+    content = json.dumps(listings, indent=1, ensure_ascii=False) + "\n"
+    try:
+        with open(output, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def main():
+    start("build_listings")
+    parser = argparse.ArgumentParser(description="Precompute collection listings into _data/listings.json")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("--output", help="listings file (default: <root>/_data/listings.json)")
+    args = parser.parse_args()
+
+    changed = build_listings(args.root, args.output)
+    print(f"{'Updated' if changed else 'Unchanged'}: {args.output or os.path.join(args.root, LISTINGS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
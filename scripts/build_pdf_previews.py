@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Render first-page thumbnails and extract the text of the PDFs in files/
+
+Publication and talk pages link to papers, slides and the CV as bare
+"Download" links, so visitors fetch a whole PDF just to see what it is. For
+every PDF under files/, this writes into files/previews/:
+
+    NAME-HASH.jpg    a thumbnail of the first page, THUMB_WIDTH pixels wide
+    NAME-HASH.txt    the plain text of the whole document
+
+and lists them in _data/pdfs.json, keyed by the PDF's site path:
+
+    site.data.pdfs["/files/paper1.pdf"]
+        pages, bytes, title, words
+        excerpt          the opening of the text, up to EXCERPT_CHARS
+        thumbnail        {src, width, height}
+        text             site path of the .txt file
+        digest           SHA-1 of the PDF
+
+_includes/pdf-previews.html shows the thumbnails on publication and talk
+pages. scripts/build_search_index.py indexes the text of the PDFs a page
+links to, and scripts/build_listings.py uses the excerpt when a page has
+none of its own.
+
+PDFs are rendered in parallel, one per worker process. The manifest is also
+the cache: a PDF is skipped while its content hash is unchanged and its
+preview files exist, and previews of PDFs that changed or were deleted are
+removed. A PDF that cannot be rendered (empty, encrypted or corrupt) is
+reported and left out of the manifest; the others are still processed, and
+it is tried again on the next run.
+
+Needs PyMuPDF (pip install pymupdf).
+
+Usage (from the repository root):
+    python scripts/build_pdf_previews.py [--root .] [--jobs N] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import stage, start
+
+SOURCE_DIR = "files"
+OUTPUT_DIR = os.path.join("files", "previews")
+MANIFEST_FILE = os.path.join("_data", "pdfs.json")
+
+THUMB_WIDTH = 360
+JPEG_QUALITY = 80
+EXCERPT_CHARS = 300
+
+# Front matter fields that link a page to a PDF
+LINK_FIELDS = ("paperurl", "slidesurl")
+FILES_PATH = re.compile(r"(/files/[^?#]+\.pdf)(?:[?#].*)?$", re.IGNORECASE)
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_pdfs(root):
+    """Site paths ("/files/...") of the PDFs under files/, outside files/previews/."""
+    skip = os.path.normpath(os.path.join(root, OUTPUT_DIR))
+    pdfs = []
+    for folder, dirs, files in os.walk(os.path.join(root, SOURCE_DIR)):
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(folder, d)) != skip)
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                rel = os.path.relpath(os.path.join(folder, name), root)
+                pdfs.append("/" + rel.replace(os.sep, "/"))
+    return pdfs
+
+
+def load_manifest(root="."):
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def linked_pdfs(record, manifest):
+    """Manifest entries of the PDFs in files/ that a collection record links to.
+
+    Links may be site paths or full URLs ("https://.../files/paper1.pdf").
+    """
+    entries = []
+    for field in LINK_FIELDS:
+        match = FILES_PATH.search(str(record.get(field, "")))
+        if match and match.group(1) in manifest:
+            entries.append(manifest[match.group(1)])
+    return entries
+
+
+def read_text(root, entry):
+    """The extracted text of a manifest entry, or "" if it is missing."""
+    try:
+        with open(os.path.join(root, entry["text"].lstrip("/")), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def excerpt_of(text, limit=EXCERPT_CHARS):
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def render_preview(root, site_path, digest):
+    """Write the thumbnail and text of one PDF; return its manifest entry. Runs in a worker process."""
+    import pymupdf
+
+    rel = site_path.lstrip("/")
+    base = os.path.join(OUTPUT_DIR, f"{os.path.relpath(os.path.splitext(rel)[0], SOURCE_DIR)}-{digest[:8]}")
+    os.makedirs(os.path.dirname(os.path.join(root, base)), exist_ok=True)
+    with pymupdf.open(os.path.join(root, rel)) as doc:
+        if doc.needs_pass:
+            raise ValueError("the PDF is encrypted")
+        if doc.page_count == 0:
+            raise ValueError("the PDF has no pages")
+        page = doc[0]
+        scale = THUMB_WIDTH / page.rect.width
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), alpha=False)
+        pix.save(os.path.join(root, base + ".jpg"), jpg_quality=JPEG_QUALITY)
+
+        # one line per text line, pages separated by a blank line
+        text = "\n\n".join("\n".join(line.strip() for line in p.get_text().splitlines() if line.strip())
+                           for p in doc)
+        with open(os.path.join(root, base + ".txt"), "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+        title = (doc.metadata or {}).get("title", "").strip() or next(iter(text.splitlines()), "")
+        return {
+            "digest": digest,
+            "bytes": os.path.getsize(os.path.join(root, rel)),
+            "pages": doc.page_count,
+            "title": title,
+            "words": len(text.split()),
+            "excerpt": excerpt_of(text),
+            "thumbnail": {"src": "/" + (base + ".jpg").replace(os.sep, "/"),
+                          "width": pix.width, "height": pix.height},
+            "text": "/" + (base + ".txt").replace(os.sep, "/"),
+        }
+
+
+def try_render_preview(root, site_path, digest):
+    """render_preview(), returning (entry, None), or (None, error message) if the PDF cannot be rendered."""
+    try:
+        return render_preview(root, site_path, digest), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def preview_files(entry):
+    return [entry["thumbnail"]["src"].lstrip("/"), entry["text"].lstrip("/")]
+
+
+def build_pdf_previews(root=".", jobs=None, force=False):
+    """Bring files/previews/ and the manifest up to date; return counts of PDFs processed."""
+    old = load_manifest(root)
+
+    stage("hash")
+    manifest, todo = {}, []
+    for site_path in find_pdfs(root):
+        digest = file_digest(os.path.join(root, site_path.lstrip("/")))
+        entry = old.get(site_path)
+        if not force and entry and entry["digest"] == digest \
+                and all(os.path.exists(os.path.join(root, p)) for p in preview_files(entry)):
+            manifest[site_path] = entry
+        else:
+            todo.append((site_path, digest))
+
+    stage("render")
+    failed = 0
+    if todo:
+        if jobs == 1 or len(todo) == 1:
+            results = [try_render_preview(root, path, digest) for path, digest in todo]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(try_render_preview, [root] * len(todo), *zip(*todo)))
+        for (site_path, _), (entry, error) in zip(todo, results):
+            if error:
+                # whatever it managed to write is not in the manifest, so it is removed below
+                print(f"Skipping {site_path}: {error}", file=sys.stderr)
+                failed += 1
+            else:
+                manifest[site_path] = entry
+
+    stage("write")
+    keep = {os.path.normpath(os.path.join(root, p)) for e in manifest.values() for p in preview_files(e)}
+    removed = 0
+    for folder, _, files in os.walk(os.path.join(root, OUTPUT_DIR)):
+        for name in files:
+            path = os.path.normpath(os.path.join(folder, name))
+            if path not in keep:
+                os.remove(path)
+                removed += 1
+
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    content = json.dumps(manifest, indent=1, sort_keys=True, ensure_ascii=False) + "\n"
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            unchanged = f.read() == content
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return {"pdfs": len(manifest), "processed": len(todo) - failed, "failed": failed,
+            "removed": removed}
+
+
+def main():
+    start("build_pdf_previews")
+    parser = argparse.ArgumentParser(description="Render thumbnails and extract text from the PDFs in files/")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="re-render every PDF")
+    args = parser.parse_args()
+
+    counts = build_pdf_previews(args.root, args.jobs, args.force)
+    print(f"PDF previews: {counts['pdfs']} PDFs, {counts['processed']} processed, "
+          f"{counts['failed']} failed, {counts['removed']} stale files removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Build the client-side search index for the site
+
+Reads _publications, _talks, _teaching, _portfolio and _posts (titles,
+authors, venues, tags, excerpts and page text, plus the text of any PDF in
+files/ a page links to, as extracted by scripts/build_pdf_previews.py),
+tokenizes and stems the text
+with the Porter stemmer, and writes an inverted index split into small JSON
+shards by the first two letters of each term. assets/js/search.js ports the
+same tokenizer and stemmer and only downloads the shards a query needs, so
+searching never means shipping every page to the browser.
+
+Files written to assets/search/:
+
+    manifest.json          shard and document file names, stop words, version
+    docs-HASH.json         {doc id: [url, title, collection, date, venue]}
+    shards/PREFIX-HASH.json  {term: [doc id, weight, doc id, weight, ...]}
+
+Shard and document files are named by content hash, so unchanged ones keep
+their name (and browser cache) between builds, and files no longer referenced
+are removed. A document's id is a short hash of its path in the repository,
+so it is the same on every checkout and adding or removing a page never
+renumbers the others. Each document's terms are kept in
+.search-index-state.json with the hash of its file (and of its linked PDFs),
+so a rebuild only reads and tokenizes the documents that changed.
+
+Usage (from the repository root):
+    python scripts/build_search_index.py [--root .] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import yaml
+
+from build_listings import DATE_FILENAME, page_url
+from build_pdf_previews import linked_pdfs, load_manifest, read_text
+from collection_index import CollectionIndex, INDEX_FILE, collection_dirs
+from profiling import stage, start
+
+COLLECTIONS = ["publications", "talks", "teaching", "portfolio", "posts"]
+OUTPUT_DIR = os.path.join("assets", "search")
+STATE_FILE = ".search-index-state.json"
+
+# Bump when tokenizing, stemming or the file layout changes; search.js checks it
+INDEX_VERSION = 2
+
+# Hex digits of the path hash used as a document id (more only on a collision)
+DOC_ID_LENGTH = 8
+
+# How much an occurrence of a term counts, by where it occurs
+FIELD_WEIGHTS = {"title": 5, "authors": 3, "venue": 2, "tags": 2, "excerpt": 1, "body": 1,
+                 "attachments": 1}
+
+STOP_WORDS = sorted("""
+a an and are as at be but by for from has have in into is it its of on or
+that the their this to was were which with
+""".split())
+
+TOKEN = re.compile(r"[a-z0-9]+")
+MARKUP = re.compile(r"\{%.*?%\}|\{\{.*?\}\}|<[^>]*>|\]\([^)]*\)|https?://\S+", re.DOTALL)
+
+
+# ---------------------------------------------------------------- stemming
+# The Porter stemmer (M.F. Porter, 1980); assets/js/search.js has the same rules
+
+def _cons(w, i):
+    if w[i] in "aeiou":
+        return False
+    if w[i] == "y":
+        return i == 0 or not _cons(w, i - 1)
+    return True
+
+
+def _measure(stem):
+    """The number of vowel-consonant sequences in `stem`."""
+    m, vowel = 0, False
+    for i in range(len(stem)):
+        if _cons(stem, i):
+            m += vowel
+            vowel = False
+        else:
+            vowel = True
+    return m
+
+
+def _has_vowel(stem):
+    return any(not _cons(stem, i) for i in range(len(stem)))
+
+
+def _double(w):
+    return len(w) >= 2 and w[-1] == w[-2] and _cons(w, len(w) - 1)
+
+
+def _cvc(w):
+    return len(w) >= 3 and _cons(w, len(w) - 3) and not _cons(w, len(w) - 2) \
+        and _cons(w, len(w) - 1) and w[-1] not in "wxy"
+
+
+STEP2 = [("ational", "ate"), ("tional", "tion"), ("enci", "ence"), ("anci", "ance"),
+         ("izer", "ize"), ("abli", "able"), ("alli", "al"), ("entli", "ent"), ("eli", "e"),
+         ("ousli", "ous"), ("ization", "ize"), ("ation", "ate"), ("ator", "ate"),
+         ("alism", "al"), ("iveness", "ive"), ("fulness", "ful"), ("ousness", "ous"),
+         ("aliti", "al"), ("iviti", "ive"), ("biliti", "ble")]
+STEP3 = [("icate", "ic"), ("ative", ""), ("alize", "al"), ("iciti", "ic"), ("ical", "ic"),
+         ("ful", ""), ("ness", "")]
+STEP4 = ["al", "ance", "ence", "er", "ic", "able", "ible", "ant", "ement", "ment", "ent",
+         "ion", "ou", "ism", "ate", "iti", "ous", "ive", "ize"]
+
+
+def _longest(word, suffixes):
+    """The longest suffix of `word` in `suffixes`, or None."""
+    best = None
+    for suffix in suffixes:
+        if word.endswith(suffix) and (best is None or len(suffix) > len(best)):
+            best = suffix
+    return best
+
+
+def stem(word):
+    """Reduce an English word to its Porter stem ("processing" -> "process")."""
+    if len(word) <= 2:
+        return word
+
+    # Step 1a: plurals
+    if word.endswith("sses") or word.endswith("ies"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+
+    # Step 1b: -ed and -ing
+    if word.endswith("eed"):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ("ed", "ing"):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word[-2:] in ("at", "bl", "iz"):
+                    word += "e"
+                elif _double(word) and word[-1] not in "lsz":
+                    word = word[:-1]
+                elif _measure(word) == 1 and _cvc(word):
+                    word += "e"
+                break
+
+    # Step 1c: y -> i
+    if word.endswith("y") and _has_vowel(word[:-1]):
+        word = word[:-1] + "i"
+
+    # Steps 2 and 3: map double and single suffixes to simpler ones
+    for rules in (STEP2, STEP3):
+        table = dict(rules)
+        suffix = _longest(word, table)
+        if suffix and _measure(word[:-len(suffix)]) > 0:
+            word = word[:-len(suffix)] + table[suffix]
+
+    # Step 4: drop suffixes from long stems
+    suffix = _longest(word, STEP4)
+    if suffix:
+        rest = word[:-len(suffix)]
+        if _measure(rest) > 1 and (suffix != "ion" or rest[-1:] in ("s", "t")):
+            word = rest
+
+    # Step 5: tidy up a final -e and -ll
+    if word.endswith("e"):
+        rest = word[:-1]
+        m = _measure(rest)
+        if m > 1 or (m == 1 and not _cvc(rest)):
+            word = rest
+    if word.endswith("ll") and _measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lower-case, accent-free, stemmed terms of `text`, without stop words."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    stops = set(STOP_WORDS)
+    return [stem(t) if not t.isdigit() else t
+            for t in TOKEN.findall(text) if len(t) > 1 and t not in stops]
+
+
+def shard_of(term):
+    """The shard a term lives in: its first two characters."""
+    return term[:2]
+
+
+# ---------------------------------------------------------------- documents
+
+def document_terms(record, body, attachments=""):
+    """{term: weight} for one document, from its front matter, body and linked PDFs."""
+    authors = record.get("authors") or []
+    if isinstance(authors, str):
+        authors = [authors]
+    tags = record.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tags]
+    fields = {
+        "title": record.get("title", ""),
+        "authors": " ".join(str(a) for a in authors),
+        "venue": " ".join(str(record.get(k, "")) for k in ("venue", "journal", "location")),
+        "tags": " ".join(str(t) for t in tags),
+        "excerpt": record.get("excerpt", ""),
+        "body": MARKUP.sub(" ", body),
+        "attachments": attachments,
+    }
+    terms = {}
+    for field, text in fields.items():
+        for term in tokenize(text):
+            terms[term] = terms.get(term, 0) + FIELD_WEIGHTS[field]
+    return terms
+
+
+def read_body(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.startswith("---"):
+        end = text.find("\n---", 3)
+        if end != -1:
+            text = text[end + 4:]
+    return text
+
+
+def document_meta(record, collection, config):
+    name = os.path.splitext(os.path.basename(record.path))[0]
+    match = DATE_FILENAME.match(name)
+    slug = match.group(2) if match else name
+    date = record.date or (match.group(1) if match else None) or record.get("year")
+    venue = record.get("venue") or record.get("journal") or ""
+    return [page_url(record, collection, config, slug), str(record.get("title", slug)),
+            collection, str(date or "")[:10], str(venue)]
+
+
+# ---------------------------------------------------------------- output
+
+def _write_hashed(folder, prefix, data, wanted):
+    """Write `data` as PREFIX-HASH.json unless that file exists; return (name, written)."""
+    content = json.dumps(data, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+    name = f"{prefix}-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]}.json"
+    wanted.add(name)
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        return name, False
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return name, True
+
+
+def _prune(folder, wanted):
+    removed = 0
+    for name in os.listdir(folder):
+        if name.endswith(".json") and name not in wanted:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+    return removed
+
+
+def document_ids(paths, root="."):
+    """{path: id} for the documents in `paths`, from a hash of each repository-relative path.
+
+    Ids depend only on the path, never on which other documents exist or the
+    order they were read in. Paths whose hashes share a prefix get longer ids.
+    """
+    pending = {path: hashlib.sha1(os.path.relpath(path, root).replace(os.sep, "/").encode("utf-8"))
+               .hexdigest() for path in paths}
+    ids = {}
+    length = DOC_ID_LENGTH
+    while pending:
+        counts = {}
+        for digest in pending.values():
+            counts[digest[:length]] = counts.get(digest[:length], 0) + 1
+        for path, digest in list(pending.items()):
+            if counts[digest[:length]] == 1:
+                ids[path] = digest[:length]
+                del pending[path]
+        length += 1
+    return ids
+
+
+def build_search_index(root=".", output=None, force=False):
+    """Update the search index; return counts of documents and files touched."""
+    output = output or os.path.join(root, OUTPUT_DIR)
+    state_path = os.path.join(root, STATE_FILE)
+    with open(os.path.join(root, "_config.yml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    state = {}
+    if not force:
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+    if state.get("version") != INDEX_VERSION:
+        state = {"version": INDEX_VERSION, "docs": {}}
+
+    stage("read")
+    index = CollectionIndex.load(collection_dirs(root, COLLECTIONS),
+                                 cache_path=os.path.join(root, INDEX_FILE))
+    pdfs = load_manifest(root)
+    docs = {}
+    tokenized = 0
+    for record in index.query():
+        if record.get("published", True) is False:
+            continue
+        attached = linked_pdfs(record, pdfs)
+        digest = "+".join([record.digest] + [entry["digest"] for entry in attached])
+        old = state["docs"].get(record.path)
+        if old and old["digest"] == digest:
+            docs[record.path] = old
+            continue
+        docs[record.path] = {
+            "digest": digest,
+            "meta": document_meta(record, record.collection, config),
+            "terms": document_terms(record, read_body(record.path),
+                                    "\n".join(read_text(root, entry) for entry in attached)),
+        }
+        tokenized += 1
+    removed_docs = len(set(state["docs"]) - set(docs))
+    state["docs"] = docs
+    ids = document_ids(docs, root)
+    for path, doc in docs.items():
+        doc["id"] = ids[path]
+
+    stage("invert")
+    shards = {}
+    for doc in sorted(docs.values(), key=lambda d: d["id"]):
+        for term, weight in doc["terms"].items():
+            shards.setdefault(shard_of(term), {}).setdefault(term, []).extend((doc["id"], weight))
+
+    stage("write")
+    shard_dir = os.path.join(output, "shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    wanted_shards, wanted_top = set(), {"manifest.json"}
+    written = 0
+    shard_files = {}
+    for prefix in sorted(shards):
+        shard_files[prefix], new = _write_hashed(shard_dir, prefix, shards[prefix], wanted_shards)
+        written += new
+    docs_file, new = _write_hashed(output, "docs", {str(d["id"]): d["meta"] for d in docs.values()},
+                                   wanted_top)
+    written += new
+
+    manifest = json.dumps({"version": INDEX_VERSION, "docs": docs_file, "shards": shard_files,
+                           "stopWords": STOP_WORDS}, indent=1, sort_keys=True)
+    manifest_path = os.path.join(output, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            unchanged = f.read() == manifest
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            f.write(manifest)
+    removed = _prune(shard_dir, wanted_shards) + _prune(output, wanted_top)
+
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    return {"documents": len(docs), "tokenized": tokenized, "dropped": removed_docs,
+            "shards": len(shard_files), "written": written, "removed": removed}
+
+
+def main():
+    start("build_search_index")
+    parser = argparse.ArgumentParser(description="Build the sharded client-side search index")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("--output", help="output folder (default: <root>/assets/search)")
+    parser.add_argument("--force", action="store_true", help="re-tokenize every document")
+    args = parser.parse_args()
+
+    counts = build_search_index(args.root, args.output, args.force)
+    print(f"Search index: {counts['documents']} documents ({counts['tokenized']} re-read, "
+          f"{counts['dropped']} dropped) in {counts['shards']} shards; "
+          f"{counts['written']} files written, {counts['removed']} removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Which generator inputs changed since a generator last ran successfully
+
+The generators can be incremental, but to find out what changed they had to
+read or stat every file under _publications/, _talks/ and so on. This asks
+git instead:
+
+    from changes import ChangeSet
+
+    changes = ChangeSet("talkmap", inputs=["_talks/*.md"], outputs=["talkmap/org-locations.js"])
+    if not changes.changed():
+        return                          # nothing to do
+    for path in changes.matching("_talks/*.md"):
+        ...                             # or only look at what changed
+    changes.record()                    # after a successful run
+
+Patterns are globs relative to the repository root ("*" does not cross "/"),
+or absolute paths inside it.
+
+With git, the changed paths are those that differ between the commit HEAD
+was at when the generator last succeeded and HEAD now (git diff), plus the
+uncommitted ones (git status); files git ignores are not seen. Files that
+were uncommitted at that last run are remembered by content hash, so they
+are not reported again until they actually change, even after they are
+committed. Without git, or outside a
+work tree, a snapshot of the matching files' sizes and modification times is
+kept instead and compared file by file; a file whose size or modification
+time moved is hashed, so one that was only touched is not reported again.
+
+`paths` is None, meaning "assume everything changed", on a generator's first
+run, when its input patterns or `key` (e.g. a command line option that
+changes the output) are different from last time, when the commit of the last run is gone, and
+when SITE_FORCE=1 is set; scripts/build.py --force sets it.
+
+State is kept per generator in .changes/NAME.json, so generators running in
+parallel do not overwrite each other's.
+"""
+
+import fnmatch
+import glob
+import json
+import os
+import re
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIR = ".changes"
+
+# Bump when the state layout changes
+STATE_VERSION = 1
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def file_digest(path):
+    """SHA-1 of a file's content, or None if it does not exist."""
+    # imported here: loading OpenSSL costs more than a generator with nothing to hash should pay
+    import hashlib
+
+    h = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    return h.hexdigest()
+
+
+def _git(root, *args):
+    """Run git in `root`; return its stdout, or None if git is missing or fails."""
+    try:
+        proc = subprocess.run(["git", *args], cwd=root, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=False)
+    except OSError:
+        return None
+    return proc.stdout.decode("utf-8", "surrogateescape") if proc.returncode == 0 else None
+
+
+class Patterns:
+    """Root-relative glob patterns, matched the way glob.glob would."""
+
+    def __init__(self, patterns):
+        self.patterns = []
+        for p in patterns:
+            p = p.replace(os.sep, "/")
+            while p.startswith("./"):
+                p = p[2:]
+            self.patterns.append(p)
+        self.exact = {p for p in self.patterns if not GLOB_CHARS.search(p)}
+        self.globs = [(p, p.count("/")) for p in self.patterns if GLOB_CHARS.search(p)]
+
+    def match(self, path):
+        return path in self.exact or any(
+            path.count("/") == depth and fnmatch.fnmatchcase(path, p) for p, depth in self.globs)
+
+    def prefixes(self):
+        """The fixed leading directories of the patterns, for narrowing git's search."""
+        out = set()
+        for p in self.patterns:
+            fixed = GLOB_CHARS.split(p, 1)[0]
+            out.add(fixed if p in self.exact else (fixed.rsplit("/", 1)[0] if "/" in fixed else "."))
+        return sorted(out)
+
+    def files(self, root):
+        """Files under `root` that the patterns match now."""
+        out = set()
+        for p in self.patterns:
+            for path in glob.glob(os.path.join(root, p)):
+                if os.path.isfile(path):
+                    out.add(os.path.relpath(path, root).replace(os.sep, "/"))
+        return out
+
+
+class ChangeSet:
+    """The inputs and outputs of one generator that changed since its last successful run."""
+
+    def __init__(self, name, inputs, outputs=(), key=None, root=ROOT):
+        self.name = name
+        self.root = root
+        self.key = None if key is None else str(key)
+        inputs, outputs = [self._rel(p) for p in inputs], [self._rel(p) for p in outputs]
+        self.inputs = Patterns(inputs)
+        self.outputs = Patterns(outputs)
+        self.all = Patterns(inputs + outputs)
+        self.state_path = os.path.join(root, STATE_DIR, name + ".json")
+
+        previous = self._load()
+        self.commit = None
+        # git reports paths relative to the top of the work tree, so it must be `root`;
+        # one call for both, as every git process adds to the generators' startup time
+        top, _, head = (_git(root, "rev-parse", "--show-toplevel", "HEAD") or "").strip().partition("\n")
+        if top and head and os.path.realpath(top) == os.path.realpath(root):
+            self.commit = head.strip()
+        if self.commit:
+            self.method = "git"
+            # what the working tree looks like now, recorded if this run succeeds
+            self._dirty = self._git_dirty()
+            self.paths = self._git_changes(previous)
+        else:
+            self.method = "snapshot"
+            self._snapshot = self._take_snapshot(self.all, (previous or {}).get("snapshot") or {})
+            self.paths = self._snapshot_changes(previous)
+        if os.environ.get("SITE_FORCE", "") not in ("", "0"):
+            self.paths = None
+
+    def _rel(self, pattern):
+        return os.path.relpath(pattern, self.root) if os.path.isabs(pattern) else pattern
+
+    # ----------------------- queries -----------------------
+
+    def changed(self, pattern=None):
+        """True if anything (or anything matching `pattern`) changed, or if that is unknown."""
+        if self.paths is None:
+            return True
+        if pattern is None:
+            return bool(self.paths)
+        return bool(self.matching(pattern))
+
+    def matching(self, pattern):
+        """The changed paths matching `pattern`, sorted; deleted files included.
+
+        When everything must be assumed changed, every file matching `pattern` now.
+        """
+        patterns = Patterns([self._rel(p) for p in ([pattern] if isinstance(pattern, str) else pattern)])
+        if self.paths is None:
+            return sorted(patterns.files(self.root))
+        return sorted(p for p in self.paths if patterns.match(p))
+
+    def __repr__(self):
+        what = "everything" if self.paths is None else f"{len(self.paths)} paths"
+        return f"ChangeSet({self.name!r}, {self.method}, {what})"
+
+    # ----------------------- state -----------------------
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("version") != STATE_VERSION or state.get("key") != self.key \
+                or state.get("inputs") != self.inputs.patterns:
+            return None
+        return state
+
+    def record(self, outputs=None):
+        """Remember the state this run started from, as the baseline for the next one.
+
+        Outputs are looked at again, since the run has just written them; pass
+        `outputs` when the run produced a different set of files than expected.
+        """
+        if outputs is not None:
+            self.outputs = Patterns([self._rel(p) for p in outputs])
+            self.all = Patterns(self.inputs.patterns + self.outputs.patterns)
+        state = {"version": STATE_VERSION, "key": self.key, "method": self.method,
+                 "inputs": self.inputs.patterns}
+        if self.method == "git":
+            dirty = {p: h for p, h in self._dirty.items() if not self.outputs.match(p)}
+            dirty.update(self._git_dirty(self.outputs))
+            state["commit"] = self.commit
+            state["dirty"] = dirty
+        else:
+            snapshot = {p: v for p, v in self._snapshot.items() if not self.outputs.match(p)}
+            snapshot.update(self._take_snapshot(self.outputs, self._snapshot))
+            state["snapshot"] = snapshot
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp, self.state_path)
+
+    # ----------------------- git -----------------------
+
+    def _git_status(self, patterns):
+        """Paths matching `patterns` that are modified, added, deleted or untracked in the work tree."""
+        out = _git(self.root, "status", "--porcelain", "-z", "--untracked-files=all", "--",
+                   *patterns.prefixes())
+        if out is None:
+            return set()
+        paths = set()
+        fields = out.split("\0")
+        i = 0
+        while i < len(fields):
+            entry = fields[i]
+            i += 1
+            if len(entry) < 4:
+                continue
+            paths.add(entry[3:])
+            # renames and copies are followed by the original path
+            if entry[0] in "RC":
+                paths.add(fields[i])
+                i += 1
+        return {p for p in paths if patterns.match(p)}
+
+    def _git_dirty(self, patterns=None):
+        patterns = patterns or self.all
+        return {p: file_digest(os.path.join(self.root, p)) for p in self._git_status(patterns)}
+
+    def _git_changes(self, previous):
+        if previous is None or previous.get("method") != "git":
+            return None
+        base = previous["commit"]
+        if base == self.commit:
+            committed = set()
+        else:
+            out = _git(self.root, "diff", "--name-only", "-z", "--no-renames", base, self.commit, "--",
+                       *self.all.prefixes())
+            if out is None:
+                # the commit is gone (rebased away, shallow clone): start over
+                return None
+            committed = {p for p in out.split("\0") if p and self.all.match(p)}
+        recorded = {p: h for p, h in (previous.get("dirty") or {}).items() if self.all.match(p)}
+        changed = set()
+        for path in committed | set(self._dirty) | set(recorded):
+            if path in recorded:
+                # uncommitted at the last run: changed only if its content is different now
+                current = self._dirty[path] if path in self._dirty else file_digest(os.path.join(self.root, path))
+                if current == recorded[path]:
+                    continue
+            changed.add(path)
+        return changed
+
+    # ----------------------- snapshot -----------------------
+
+    def _take_snapshot(self, patterns, previous):
+        """{path: [size, mtime_ns, sha1]} for the matching files.
+
+        A file is only hashed when it was seen before with a different size or
+        modification time; new files get None, as nothing is compared against it.
+        """
+        snapshot = {}
+        for path in patterns.files(self.root):
+            st = os.stat(os.path.join(self.root, path))
+            stat = [st.st_size, st.st_mtime_ns]
+            old = previous.get(path)
+            if old and old[:2] == stat:
+                snapshot[path] = old
+            else:
+                snapshot[path] = stat + [file_digest(os.path.join(self.root, path)) if old else None]
+        return snapshot
+
+    def _snapshot_changes(self, previous):
+        if previous is None or previous.get("method") != "snapshot":
+            return None
+        old = previous.get("snapshot") or {}
+        changed = set()
+        for path in set(old) | set(self._snapshot):
+            before, now = old.get(path), self._snapshot.get(path)
+            if before is None or now is None:
+                changed.add(path)
+            elif before[:2] != now[:2] and (before[2] is None or before[2] != now[2]):
+                changed.add(path)
+        return changed
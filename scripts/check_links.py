@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Check the outbound links in the collections' front matter
+
+Publication pages carry paperurl, url and doi values from publications.py,
+pubsFromBib.py and fetch_orcid.py, and talks carry talk_url, and nothing
+ever checked that they still resolve. This collects every such link from
+the collections (through the shared collection index), drops duplicates,
+and checks each distinct URL once:
+
+    - site paths ("/files/paper1.pdf") must exist in the repository
+    - http(s) URLs get a HEAD request, or a GET when the server does not
+      allow HEAD, following redirects
+    - DOIs are checked as https://doi.org/DOI
+
+Requests run concurrently, but each host gets its own connection pool, at
+most --per-host requests at a time and at least --delay seconds between
+requests, so no single server (doi.org above all) is hammered.
+
+Results are kept in .link-check-cache.json. Working links are not checked
+again for --ttl days; broken ones are checked on every run, so a fixed link
+is noticed right away.
+
+Exits with status 1 when a link is broken. URLs given with --url are checked
+instead of the collections, e.g. against a local stub server:
+
+    python -m http.server 8000 &
+    python scripts/check_links.py --url http://127.0.0.1:8000/ --url http://127.0.0.1:8000/missing
+
+Needs requests (pip install requests).
+
+Usage (from the repository root):
+    python scripts/check_links.py [--root .] [--jobs 16] [--per-host 2] [--delay 0.5]
+                                  [--ttl 7] [--timeout 15] [--force] [--report FILE]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from collection_index import CollectionIndex, INDEX_FILE, collection_dirs
+from profiling import stage, start
+
+CACHE_FILE = ".link-check-cache.json"
+
+# Front matter fields holding a link, and the collections that use them
+LINK_FIELDS = ("paperurl", "slidesurl", "bibtexurl", "url", "link", "talk_url", "redirect_url")
+DOI_FIELD = "doi"
+COLLECTIONS = ["publications", "talks", "teaching", "portfolio"]
+
+USER_AGENT = "gordondzwilliams.github.io link checker (+https://github.com/gordondzwilliams/gordondzwilliams.github.io)"
+
+# Statuses that mean "the server does not answer HEAD properly", so GET is tried
+HEAD_UNSUPPORTED = {400, 403, 404, 405, 501}
+# Statuses that say nothing about the link itself; never cached
+TRANSIENT = {408, 425, 429, 500, 502, 503, 504}
+
+
+def link_targets(record):
+    """The links a record's front matter points to, as absolute URLs or site paths."""
+    targets = []
+    for field in LINK_FIELDS:
+        value = str(record.get(field, "") or "").strip()
+        if value.startswith(("http://", "https://", "/")) and not value.startswith("//"):
+            targets.append(value)
+    doi = str(record.get(DOI_FIELD, "") or "").strip()
+    if doi:
+        if doi.lower().startswith("http"):
+            doi = doi.split("doi.org/")[-1]
+        targets.append("https://doi.org/" + urllib.parse.quote(doi, safe="/:;()._-"))
+    return targets
+
+
+def collect_links(root="."):
+    """{url: [page paths]} for every link in the collections."""
+    index = CollectionIndex.load(collection_dirs(root, COLLECTIONS),
+                                 cache_path=os.path.join(root, INDEX_FILE))
+    links = {}
+    for record in index.records:
+        for url in link_targets(record):
+            pages = links.setdefault(url, [])
+            if record.path not in pages:
+                pages.append(record.path)
+    return links
+
+
+def check_local(root, path):
+    """A site path resolves if the file (or a folder's index.html) is in the repository."""
+    rel = urllib.parse.unquote(urllib.parse.urlsplit(path).path).lstrip("/")
+    full = os.path.join(root, rel)
+    ok = os.path.isfile(full) or os.path.isfile(os.path.join(full, "index.html"))
+    return {"ok": ok, "status": None, "error": None if ok else "not in the repository"}
+
+
+class HostLimiter:
+    """Per-host connection pools and politeness limits, shared by the worker threads."""
+
+    def __init__(self, per_host, delay, timeout):
+        self.per_host = per_host
+        self.delay = delay
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers["User-Agent"] = USER_AGENT
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._hosts[host] = {"session": session, "slots": threading.Semaphore(self.per_host),
+                                     "lock": threading.Lock(), "next": 0.0}
+            return self._hosts[host]
+
+    def request(self, method, url):
+        host = self._host(urllib.parse.urlsplit(url).netloc.lower())
+        with host["slots"]:
+            # space out the start of requests to the same host
+            with host["lock"]:
+                wait = host["next"] - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                host["next"] = time.monotonic() + self.delay
+            response = host["session"].request(method, url, allow_redirects=True, timeout=self.timeout,
+                                               stream=(method == "GET"))
+            response.close()
+            return response
+
+    def close(self):
+        for host in self._hosts.values():
+            host["session"].close()
+
+
+def check_remote(limiter, url):
+    """HEAD the URL, falling back to GET; return the result entry."""
+    import requests
+
+    try:
+        response = limiter.request("HEAD", url)
+        if response.status_code in HEAD_UNSUPPORTED:
+            response = limiter.request("GET", url)
+    except requests.RequestException as e:
+        return {"ok": False, "status": None, "error": f"{type(e).__name__}: {e}", "transient": True}
+    result = {"ok": response.status_code < 400, "status": response.status_code, "error": None}
+    if response.url != url:
+        result["final_url"] = response.url
+    if response.status_code in TRANSIENT:
+        result["transient"] = True
+    return result
+
+
+def load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def check_links(urls, root=".", jobs=16, per_host=2, delay=0.5, ttl_days=7, timeout=15,
+                force=False, cache_path=None):
+    """Check `urls`; return {url: result} with "ok", "status", "error" and "cached" keys."""
+    cache_path = cache_path or os.path.join(root, CACHE_FILE)
+    cache = load_cache(cache_path)
+    now = time.time()
+
+    results, remote = {}, []
+    for url in dict.fromkeys(urls):
+        if url.startswith("/"):
+            results[url] = dict(check_local(root, url), cached=False)
+            continue
+        old = cache.get(url)
+        if not force and old and old.get("ok") and now - old.get("checked", 0) < ttl_days * 86400:
+            results[url] = dict(old, cached=True)
+        else:
+            remote.append(url)
+
+    # hosts with the most links first, so the slowest queue starts early
+    per_host_count = {}
+    for url in remote:
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        per_host_count[host] = per_host_count.get(host, 0) + 1
+    remote.sort(key=lambda url: -per_host_count[urllib.parse.urlsplit(url).netloc.lower()])
+
+    limiter = HostLimiter(per_host, delay, timeout)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for url, result in zip(remote, pool.map(lambda u: check_remote(limiter, u), remote)):
+                result["checked"] = now
+                transient = result.pop("transient", False)
+                results[url] = dict(result, cached=False)
+                if not transient:
+                    cache[url] = result
+    finally:
+        limiter.close()
+
+    if remote:
+        save_cache(cache_path, cache)
+    return results
+
+
+def main():
+    start("check_links")
+    parser = argparse.ArgumentParser(description="Check the links in the collections' front matter")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("--url", action="append", default=[],
+                        help="check this URL instead of the collections (repeatable)")
+    parser.add_argument("-j", "--jobs", type=int, default=16, help="concurrent requests in total")
+    parser.add_argument("--per-host", type=int, default=2, help="concurrent requests per host")
+    parser.add_argument("--delay", type=float, default=0.5,
+                        help="seconds between the starts of requests to one host")
+    parser.add_argument("--ttl", type=float, default=7, help="days before a working link is checked again")
+    parser.add_argument("--timeout", type=float, default=15, help="seconds to wait for a response")
+    parser.add_argument("--force", action="store_true", help="ignore cached results")
+    parser.add_argument("--report", help="also write every result, with the pages using it, to this JSON file")
+    args = parser.parse_args()
+
+    stage("collect")
+    links = {url: [] for url in args.url} if args.url else collect_links(args.root)
+
+    stage("check")
+    results = check_links(links, args.root, args.jobs, args.per_host, args.delay, args.ttl,
+                          args.timeout, args.force)
+
+    stage("report")
+    broken = {url: r for url, r in results.items() if not r["ok"]}
+    for url, result in sorted(broken.items()):
+        print(f"BROKEN {url}: {result['error'] or result['status']}")
+        for page in links[url]:
+            print(f"    in {page}")
+    cached = sum(1 for r in results.values() if r["cached"])
+    print(f"{len(results)} links checked ({cached} from cache), {len(broken)} broken")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({url: dict(results[url], pages=links[url]) for url in sorted(results)}, f, indent=1)
+    sys.exit(1 if broken else 0)
+
+
+if __name__ == "__main__":
+    main()
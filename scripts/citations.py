@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Citation formatting shared by the publication generators.
+
+pubsFromBib.py used to build each citation by concatenating strings in its
+entry loop, publications.py copied whatever the TSV's citation column held
+and fetch_orcid.py wrote no citation at all. All three now go through this
+module, so every page cites the same way:
+
+    from citations import render_citations
+
+    citations = render_citations(records, style="apa")
+
+A record is a dict with any of the keys in FIELDS. `authors` is a list of
+people, each either a pybtex-style person (first_names, middle_names,
+prelast_names, last_names), a CrossRef-style dict (given, family) or a plain
+name string ("Given Family" or "Family, Given").
+
+Each style in STYLES is compiled once into a list of segments. A segment in
+[brackets] in the template is left out when any field it uses is empty,
+which is what keeps the punctuation right for records without a volume,
+DOI and so on. Authors are parsed and formatted once per distinct name and
+style, and whole author lists are memoized too, because the same few
+co-authors appear on most entries.
+
+The "highlight" style sets the site owner in bold: author.name in
+_config.yml, read the first time it is needed. Callers can pass other names
+with `highlight=`.
+
+Values are not HTML-escaped. The templates add <i> and <b> markup, and the
+generators escape the finished string for their YAML front matter as before.
+"""
+
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+FIELDS = ("authors", "year", "title", "venue", "volume", "issue", "pages", "doi")
+
+# Where the "highlight" style finds the site owner's name (author.name)
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "_config.yml")
+
+DEFAULT_STYLE = "highlight"
+
+# Lowercase words that belong to the family name ("Ludwig van Beethoven")
+PARTICLES = {"van", "von", "der", "den", "de", "del", "della", "di", "da", "du", "la", "le", "dos", "ter"}
+
+Style = namedtuple("Style", ["name", "author", "first_author", "conjunction", "max_authors", "template"])
+
+STYLES = {
+    # APA 7th edition: Williams, G. D. Z., & Doe, J. (2020). Title. <i>Journal</i>, <i>1</i>(2), 3–4. https://doi.org/...
+    "apa": Style("apa", "{family}, {initials}", None, "& ", 20,
+                 "[{authors}][ ({year}).][ {title}.][ <i>{venue}</i>][, <i>{volume}</i>][({issue})][, {pages}]."
+                 "[ https://doi.org/{doi}]"),
+    # Chicago author-date: Williams, Gordon D.Z., and Jane Doe. 2020. "Title." <i>Journal</i> 1 (2): 3–4. https://doi.org/...
+    "chicago": Style("chicago", "{given} {family}", "{family}, {given}", "and ", 10,
+                     '[{authors}.][ {year}.][ "{title}."][ <i>{venue}</i>][ {volume}][ ({issue})][: {pages}].'
+                     "[ https://doi.org/{doi}.]"),
+    # The site's own style, as pubsFromBib.py always wrote it, with the site owner in bold:
+    # Jane Doe and <b>Gordon D.Z. Williams</b>. "Title." Journal, 2020.
+    "highlight": Style("highlight", "{given} {family}", None, "and ", None,
+                       '[{authors}.][ "{title}."][ {venue},][ {year}].'),
+}
+
+SEGMENT = re.compile(r"\[([^\]]*)\]|([^\[]+)")
+FIELD = re.compile(r"{(\w+)}")
+# Doubled punctuation left where a segment ends in a period, e.g. a title ending in "?"
+DOUBLE_STOP = re.compile(r"([.?!])(</i>|\")?\.")
+# ...or a comma left before the final period when the segment after it was dropped
+STRAY_COMMA = re.compile(r",(?=\.$)")
+MARKUP = re.compile(r"[{}\\]")
+
+
+def _clean(value):
+    """Text of a field without BibTeX braces and backslashes, with "--" page ranges as en dashes."""
+    return re.sub(r"\s+", " ", MARKUP.sub("", str(value))).replace("--", "–").strip()
+
+
+# ----------------------- authors -----------------------
+
+Name = namedtuple("Name", ["given", "family"])
+
+
+@lru_cache(maxsize=None)
+def parse_name(text):
+    """Split "Given Family" or "Family, Given" into a Name."""
+    text = _clean(text)
+    if "," in text:
+        family, given = (part.strip() for part in text.split(",", 1))
+        return Name(given, family)
+    words = text.split()
+    if len(words) < 2:
+        return Name("", text)
+    # the family name starts at the first particle, or is the last word
+    for i, word in enumerate(words[1:-1], 1):
+        if word in PARTICLES:
+            return Name(" ".join(words[:i]), " ".join(words[i:]))
+    return Name(" ".join(words[:-1]), words[-1])
+
+
+def to_name(person):
+    """A Name from a pybtex-style person, a CrossRef-style dict or a name string."""
+    if isinstance(person, Name):
+        return person
+    if isinstance(person, str):
+        return parse_name(person)
+    if isinstance(person, dict):
+        if person.get("family"):
+            return Name(_clean(person.get("given") or ""), _clean(person["family"]))
+        return parse_name(person.get("name") or person.get("given") or "")
+    given = " ".join(list(person.first_names) + list(person.middle_names))
+    family = " ".join(list(person.prelast_names) + list(person.last_names))
+    return Name(_clean(given), _clean(family))
+
+
+@lru_cache(maxsize=None)
+def initials(given):
+    """ "Gordon D.Z." -> "G. D. Z.", "Jean-Paul" -> "J.-P." """
+    out = []
+    for word in given.replace(".", ". ").split():
+        parts = [p.strip(".")[:1] for p in word.split("-") if p.strip(".")]
+        if parts:
+            out.append("-".join(p.upper() + "." for p in parts))
+    return " ".join(out)
+
+
+def _name_key(name):
+    return name.family.casefold(), name.given[:1].casefold()
+
+
+@lru_cache(maxsize=None)
+def site_authors(config=CONFIG_FILE):
+    """The names the "highlight" style sets in bold by default: author.name in _config.yml."""
+    # imported here so the other styles never pay for it
+    import yaml
+
+    try:
+        with open(config, "r", encoding="utf-8") as f:
+            site = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
+    except OSError:
+        return ()
+    name = (site.get("author") or {}).get("name")
+    return (str(name).strip(),) if name else ()
+
+
+@lru_cache(maxsize=None)
+def highlight_keys(names):
+    """Names to highlight, matched on family name and first initial, so "G. Williams" counts too."""
+    return frozenset(_name_key(parse_name(n)) for n in names)
+
+
+@lru_cache(maxsize=None)
+def format_name(name, style, first=False, highlight=()):
+    """One author in `style`; `first` selects the style's form for the first author, if it has one.
+
+    `highlight` is a tuple of names set in bold by the "highlight" style.
+    """
+    s = STYLES[style]
+    pattern = s.first_author if first and s.first_author else s.author
+    if not name.given:
+        text = name.family
+    else:
+        text = pattern.format(given=name.given, family=name.family, initials=initials(name.given))
+    if style == "highlight" and _name_key(name) in highlight_keys(highlight):
+        text = f"<b>{text}</b>"
+    return text
+
+
+@lru_cache(maxsize=4096)
+def format_names(names, style, highlight=()):
+    """A whole author list (a tuple of Names) in `style`."""
+    s = STYLES[style]
+    formatted = [format_name(n, style, first=(i == 0), highlight=highlight)
+                 for i, n in enumerate(names) if n.family]
+    if s.max_authors and len(formatted) > s.max_authors:
+        if style == "apa":
+            # APA: the first 19, an ellipsis, then the last author
+            return ", ".join(formatted[:19]) + ", . . . " + formatted[-1]
+        return ", ".join(formatted[:7]) + ", et al"
+    if len(formatted) < 2:
+        return "".join(formatted)
+    if len(formatted) == 2 and style == "highlight":
+        return f"{formatted[0]} {s.conjunction}{formatted[1]}"
+    return ", ".join(formatted[:-1]) + ", " + s.conjunction + formatted[-1]
+
+
+def default_highlight(style):
+    """The names `style` highlights when the caller does not say: the site owner, for "highlight"."""
+    return site_authors() if style == "highlight" else ()
+
+
+def format_authors(people, style=DEFAULT_STYLE, highlight=None):
+    """Format a list of people (in any form to_name accepts) in `style`."""
+    highlight = default_highlight(style) if highlight is None else tuple(highlight)
+    return format_names(tuple(to_name(p) for p in people), style, highlight)
+
+
+# ----------------------- templates -----------------------
+
+@lru_cache(maxsize=None)
+def compile_style(style):
+    """Compile a style's template into a list of (fields, format string) segments.
+
+    Segments with no fields are always kept; the others only when every field they use is set.
+    """
+    if style not in STYLES:
+        raise ValueError(f"unknown citation style {style!r}; expected one of {', '.join(STYLES)}")
+    segments = []
+    for optional, literal in SEGMENT.findall(STYLES[style].template):
+        text = optional or literal
+        segments.append((tuple(FIELD.findall(text)), text))
+    return segments
+
+
+def render_citations(records, style=DEFAULT_STYLE, highlight=None):
+    """Render a batch of records in `style`; returns the citations in the same order.
+
+    `highlight` lists the names the "highlight" style sets in bold; by default the site owner's.
+    """
+    segments = compile_style(style)
+    if highlight is not None:
+        highlight = tuple(highlight)
+    out = []
+    for record in records:
+        values = {field: _clean(record[field]) for field in FIELDS[1:] if record.get(field)}
+        if record.get("authors"):
+            if highlight is None:
+                # only now, so batches without author lists never read _config.yml
+                highlight = default_highlight(style)
+            values["authors"] = format_authors(record["authors"], style, highlight)
+        parts = [text.format_map(values) for fields, text in segments
+                 if all(values.get(f) for f in fields)]
+        text = DOUBLE_STOP.sub(r"\1\2", "".join(parts)).strip()
+        out.append(STRAY_COMMA.sub("", text))
+    return out
+
+
+def render_citation(record, style=DEFAULT_STYLE, highlight=None):
+    """Render one record; for many, render_citations is faster."""
+    return render_citations([record], style, highlight)[0]
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+In-memory index of the Jekyll collections (_publications, _talks, _teaching,
+_portfolio), shared by the scripts that build things from them.
+
+Each Markdown file is parsed once into a compact Record. The index keeps
+secondary indexes by collection, date, venue and location so callers can
+query it instead of walking and parsing the collection folders themselves:
+
+    from collection_index import CollectionIndex, collection_dirs
+
+    index = CollectionIndex.load(collection_dirs("."))
+    for talk in index.query(collection="talks", start="2015-01-01", order_by="date"):
+        print(talk.date, talk.title, talk.location)
+
+The index is persisted to .collection-index.json in the repository root.
+On the next load, files whose size and modification time (or, failing that,
+content hash) are unchanged reuse their stored record, so only edited files
+are parsed again.
+"""
+
+import bisect
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import unicodedata
+from datetime import date, datetime
+
+import yaml
+
+COLLECTIONS = ["publications", "talks", "teaching", "portfolio"]
+INDEX_FILE = ".collection-index.json"
+
+# Bump when the record layout or parsing changes, to discard stored indexes
+INDEX_VERSION = 2
+
+FRONT_MATTER = re.compile(r'^---\s*\n(.*?)\n---[ \t]*(?:\n|$)', re.DOTALL)
+HTML_TAG = re.compile(r"<[^>]*>")
+
+
+def collection_dirs(root=".", names=COLLECTIONS):
+    """Return {collection: folder} for the standard `_name` folders under `root`."""
+    return {name: os.path.join(root, "_" + name) for name in names}
+
+
+def normalize_key(value):
+    """Case-, accent- and whitespace-insensitive key used by the venue and location indexes."""
+    value = unicodedata.normalize("NFKC", str(value)).casefold()
+    value = re.sub(r"\s*,\s*", ", ", value)
+    return re.sub(r"\s+", " ", value).strip(" ,.;")
+
+
+def _plain(value):
+    """Make a front matter value JSON-serializable (YAML dates become ISO strings)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+class Record:
+    """One collection item: the commonly used front matter fields, plus the rest in `extra`.
+
+    `lead` is the first paragraph of the body (what Jekyll uses as the
+    excerpt when the front matter has none) and `words` the body's word count.
+    """
+
+    FIELDS = ("title", "date", "venue", "location", "type", "permalink", "excerpt")
+    __slots__ = ("collection", "path", "digest", "stat", "extra", "lead", "words") + FIELDS
+
+    def __init__(self, collection, path, digest, stat, front_matter, body=""):
+        self.collection = collection
+        self.path = path
+        self.digest = digest
+        self.stat = stat
+        front_matter = {k: _plain(v) for k, v in front_matter.items()}
+        for field in self.FIELDS:
+            setattr(self, field, front_matter.pop(field, None))
+        self.extra = front_matter
+        body = body.lstrip("\n")
+        self.lead = body.partition("\n\n")[0].strip()
+        self.words = len(HTML_TAG.sub(" ", body).split())
+
+    def get(self, key, default=None):
+        """Look up a front matter field, like dict.get on the parsed front matter."""
+        value = getattr(self, key, None) if key in self.FIELDS else self.extra.get(key)
+        return default if value is None else value
+
+    def to_list(self):
+        return [self.collection, self.path, self.digest, self.stat, self.extra, self.lead, self.words] + \
+            [getattr(self, field) for field in self.FIELDS]
+
+    @classmethod
+    def from_list(cls, row):
+        record = cls.__new__(cls)
+        (record.collection, record.path, record.digest, record.stat, record.extra,
+         record.lead, record.words) = row[:7]
+        for field, value in zip(cls.FIELDS, row[7:]):
+            setattr(record, field, value)
+        return record
+
+    def __repr__(self):
+        return f"Record({self.collection!r}, {self.path!r}, title={self.title!r}, date={self.date!r})"
+
+
+def parse_file(collection, path, stat=None, raw=None):
+    """Parse one Markdown file into a Record, or return None if it has no front matter."""
+    if raw is None:
+        with open(path, "rb") as f:
+            raw = f.read()
+    text = raw.decode("utf-8")
+    match = FRONT_MATTER.match(text)
+    if not match:
+        return None
+    front_matter = yaml.safe_load(match.group(1))
+    if not isinstance(front_matter, dict):
+        return None
+    return Record(collection, path, hashlib.sha1(raw).hexdigest(), stat, front_matter,
+                  text[match.end():])
+
+
+class CollectionIndex:
+    """Records for every item in a set of collection folders, with secondary indexes."""
+
+    def __init__(self, records=(), others=()):
+        self.records = sorted(records, key=lambda r: (r.collection, r.path))
+        # stored records of collections that were not loaded; kept so save()
+        # does not throw away another caller's work
+        self._others = list(others)
+        self.by_collection = {}
+        self.by_venue = {}
+        self.by_location = {}
+        for i, record in enumerate(self.records):
+            self.by_collection.setdefault(record.collection, []).append(i)
+            if record.venue:
+                self.by_venue.setdefault(normalize_key(record.venue), []).append(i)
+            if record.location:
+                self.by_location.setdefault(normalize_key(record.location), []).append(i)
+        # (date, position) pairs in date order, for range queries
+        self.by_date = sorted((str(r.date), i) for i, r in enumerate(self.records) if r.date)
+        self.parsed = 0
+
+    @classmethod
+    def load(cls, dirs, cache_path=INDEX_FILE):
+        """Index the *.md files in `dirs` ({collection: folder}).
+
+        Records stored in `cache_path` are reused for files that have not
+        changed; pass cache_path=None to parse everything.
+        """
+        stored = {}
+        others = []
+        if cache_path:
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    for row in data["records"]:
+                        record = Record.from_list(row)
+                        if record.collection in dirs:
+                            stored[record.path] = record
+                        else:
+                            others.append(record)
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        records = []
+        parsed = 0
+        for collection, folder in dirs.items():
+            for path in sorted(glob.glob(os.path.join(folder, "*.md"))):
+                # "./_talks/x.md" and "_talks/x.md" are the same stored record
+                path = os.path.normpath(path)
+                st = os.stat(path)
+                stat = [st.st_size, st.st_mtime_ns]
+                old = stored.get(path)
+                if old is not None and old.collection == collection and old.stat == stat:
+                    records.append(old)
+                    continue
+                with open(path, "rb") as f:
+                    raw = f.read()
+                if old is not None and old.collection == collection \
+                        and old.digest == hashlib.sha1(raw).hexdigest():
+                    old.stat = stat
+                    records.append(old)
+                    continue
+                record = parse_file(collection, path, stat, raw)
+                parsed += 1
+                if record is not None:
+                    records.append(record)
+
+        index = cls(records, others)
+        index.parsed = parsed
+        if cache_path:
+            index.save(cache_path)
+        return index
+
+    def save(self, path=INDEX_FILE):
+        """Persist the index; the file is only rewritten when its content changes.
+
+        Several build steps save the index at the same time, so each save
+        writes its own temp file and moves it into place; the last one wins,
+        and whatever it lacks is parsed again on the next load.
+        """
+        rows = [r.to_list() for r in self.records + self._others]
+        content = json.dumps({"version": INDEX_VERSION, "records": rows},
+                             separators=(",", ":"), ensure_ascii=False)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return
+        except FileNotFoundError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                   prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def query(self, collection=None, venue=None, location=None, start=None, end=None,
+              where=None, order_by=None, reverse=False):
+        """Return the records matching every given condition.
+
+        `venue` and `location` match case- and whitespace-insensitively;
+        `start` and `end` are inclusive ISO date strings (records without a
+        date never match a date range); `where` is an extra predicate taking a
+        Record. Results are in path order unless `order_by` names a field,
+        in which case records missing that field sort last.
+        """
+        candidates = None
+
+        def narrow(positions):
+            nonlocal candidates
+            positions = set(positions)
+            candidates = positions if candidates is None else candidates & positions
+
+        if collection is not None:
+            narrow(self.by_collection.get(collection, ()))
+        if venue is not None:
+            narrow(self.by_venue.get(normalize_key(venue), ()))
+        if location is not None:
+            narrow(self.by_location.get(normalize_key(location), ()))
+        if start is not None or end is not None:
+            lo = 0 if start is None else bisect.bisect_left(self.by_date, (str(start),))
+            # "\uffff" sorts after any time part, so a date end includes that whole day
+            hi = len(self.by_date) if end is None else \
+                bisect.bisect_right(self.by_date, (str(end) + "\uffff",))
+            narrow(i for _, i in self.by_date[lo:hi])
+
+        positions = range(len(self.records)) if candidates is None else sorted(candidates)
+        results = [self.records[i] for i in positions]
+        if where is not None:
+            results = [r for r in results if where(r)]
+        if order_by is not None:
+            present = [r for r in results if r.get(order_by) is not None]
+            missing = [r for r in results if r.get(order_by) is None]
+            present.sort(key=lambda r: str(r.get(order_by)), reverse=reverse)
+            results = present + missing
+        return results
+
+    def __len__(self):
+        return len(self.records)
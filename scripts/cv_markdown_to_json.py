@@ -11,7 +11,10 @@ import yaml
 import argparse
 from datetime import datetime, date
 from pathlib import Path
-import glob
+
+from changes import ChangeSet
+from collection_index import COLLECTIONS, CollectionIndex, INDEX_FILE, collection_dirs
+from profiling import stage, start
 
 # Custom JSON encoder to handle date objects
 class DateTimeEncoder(json.JSONEncoder):
@@ -248,124 +251,82 @@ def parse_skills(skills_text):
     
     return skills_entries
 
-def parse_publications(pub_dir):
-    """Parse publications from the _publications directory."""
+def parse_publications(index):
+    """List publications from the _publications collection."""
     publications = []
     
-    if not os.path.exists(pub_dir):
-        return publications
-    
-    for pub_file in sorted(glob.glob(os.path.join(pub_dir, "*.md"))):
-        with open(pub_file, 'r', encoding='utf-8') as file:
-            content = file.read()
+    for record in index.query(collection="publications"):
+        # Extract publication details
+        pub_entry = {
+            "name": record.get('title', ''),
+            "publisher": record.get('venue', ''),
+            "releaseDate": record.get('date', ''),
+            "website": record.get('paperurl', ''),
+            "summary": record.get('excerpt', '')
+        }
         
-        # Extract front matter
-        front_matter_match = re.match(r'^---\s*(.*?)\s*---', content, re.DOTALL)
-        if front_matter_match:
-            front_matter = yaml.safe_load(front_matter_match.group(1))
-            
-            # Extract publication details
-            pub_entry = {
-                "name": front_matter.get('title', ''),
-                "publisher": front_matter.get('venue', ''),
-                "releaseDate": front_matter.get('date', ''),
-                "website": front_matter.get('paperurl', ''),
-                "summary": front_matter.get('excerpt', '')
-            }
-            
-            publications.append(pub_entry)
+        publications.append(pub_entry)
     
     return publications
 
-def parse_talks(talks_dir):
-    """Parse talks from the _talks directory."""
+def parse_talks(index):
+    """List talks from the _talks collection."""
     talks = []
     
-    if not os.path.exists(talks_dir):
-        return talks
-    
-    for talk_file in sorted(glob.glob(os.path.join(talks_dir, "*.md"))):
-        with open(talk_file, 'r', encoding='utf-8') as file:
-            content = file.read()
+    for record in index.query(collection="talks"):
+        # Extract talk details
+        talk_entry = {
+            "name": record.get('title', ''),
+            "event": record.get('venue', ''),
+            "date": record.get('date', ''),
+            "location": record.get('location', ''),
+            "description": record.get('excerpt', '')
+        }
         
-        # Extract front matter
-        front_matter_match = re.match(r'^---\s*(.*?)\s*---', content, re.DOTALL)
-        if front_matter_match:
-            front_matter = yaml.safe_load(front_matter_match.group(1))
-            
-            # Extract talk details
-            talk_entry = {
-                "name": front_matter.get('title', ''),
-                "event": front_matter.get('venue', ''),
-                "date": front_matter.get('date', ''),
-                "location": front_matter.get('location', ''),
-                "description": front_matter.get('excerpt', '')
-            }
-            
-            talks.append(talk_entry)
+        talks.append(talk_entry)
     
     return talks
 
-def parse_teaching(teaching_dir):
-    """Parse teaching from the _teaching directory."""
+def parse_teaching(index):
+    """List teaching from the _teaching collection."""
     teaching = []
     
-    if not os.path.exists(teaching_dir):
-        return teaching
-    
-    for teaching_file in sorted(glob.glob(os.path.join(teaching_dir, "*.md"))):
-        with open(teaching_file, 'r', encoding='utf-8') as file:
-            content = file.read()
+    for record in index.query(collection="teaching"):
+        # Extract teaching details
+        teaching_entry = {
+            "course": record.get('title', ''),
+            "institution": record.get('venue', ''),
+            "date": record.get('date', ''),
+            "role": record.get('type', ''),
+            "description": record.get('excerpt', '')
+        }
         
-        # Extract front matter
-        front_matter_match = re.match(r'^---\s*(.*?)\s*---', content, re.DOTALL)
-        if front_matter_match:
-            front_matter = yaml.safe_load(front_matter_match.group(1))
-            
-            # Extract teaching details
-            teaching_entry = {
-                "course": front_matter.get('title', ''),
-                "institution": front_matter.get('venue', ''),
-                "date": front_matter.get('date', ''),
-                "role": front_matter.get('type', ''),
-                "description": front_matter.get('excerpt', '')
-            }
-            
-            teaching.append(teaching_entry)
+        teaching.append(teaching_entry)
     
     return teaching
 
-def parse_portfolio(portfolio_dir):
-    """Parse portfolio items from the _portfolio directory."""
+def parse_portfolio(index):
+    """List portfolio items from the _portfolio collection."""
     portfolio = []
     
-    if not os.path.exists(portfolio_dir):
-        return portfolio
-    
-    for portfolio_file in sorted(glob.glob(os.path.join(portfolio_dir, "*.md"))):
-        with open(portfolio_file, 'r', encoding='utf-8') as file:
-            content = file.read()
+    for record in index.query(collection="portfolio"):
+        # Extract portfolio details
+        portfolio_entry = {
+            "name": record.get('title', ''),
+            "category": record.get('collection', 'portfolio'),
+            "date": record.get('date', ''),
+            "url": record.get('permalink', ''),
+            "description": record.get('excerpt', '')
+        }
         
-        # Extract front matter
-        front_matter_match = re.match(r'^---\s*(.*?)\s*---', content, re.DOTALL)
-        if front_matter_match:
-            front_matter = yaml.safe_load(front_matter_match.group(1))
-            
-            # Extract portfolio details
-            portfolio_entry = {
-                "name": front_matter.get('title', ''),
-                "category": front_matter.get('collection', 'portfolio'),
-                "date": front_matter.get('date', ''),
-                "url": front_matter.get('permalink', ''),
-                "description": front_matter.get('excerpt', '')
-            }
-            
-            portfolio.append(portfolio_entry)
+        portfolio.append(portfolio_entry)
     
     return portfolio
 
 def create_cv_json(md_file, config_file, repo_root, output_file):
     """Create a JSON CV from markdown and other repository data."""
+    stage("markdown")
+    
     # Parse the markdown CV
     sections = parse_markdown_cv(md_file)
     
@@ -386,17 +347,23 @@ def create_cv_json(md_file, config_file, repo_root, output_file):
         "references": []
     }
     
+    stage("collections")
+    
+    # Index the collections once; unchanged files are not parsed again
+    index = CollectionIndex.load(collection_dirs(repo_root),
+                                 cache_path=os.path.join(repo_root, INDEX_FILE))
+    
     # Add publications
-    cv_json["publications"] = parse_publications(os.path.join(repo_root, "_publications"))
+    cv_json["publications"] = parse_publications(index)
     
     # Add talks
-    cv_json["presentations"] = parse_talks(os.path.join(repo_root, "_talks"))
+    cv_json["presentations"] = parse_talks(index)
     
     # Add teaching
-    cv_json["teaching"] = parse_teaching(os.path.join(repo_root, "_teaching"))
+    cv_json["teaching"] = parse_teaching(index)
     
     # Add portfolio
-    cv_json["portfolio"] = parse_portfolio(os.path.join(repo_root, "_portfolio"))
+    cv_json["portfolio"] = parse_portfolio(index)
     
     # Extract languages and interests from config if available
     if 'languages' in config:
@@ -405,6 +372,8 @@ def create_cv_json(md_file, config_file, repo_root, output_file):
     if 'interests' in config:
         cv_json["interests"] = config.get('interests', [])
     
+    stage("write")
+    
     # Write the JSON to a file
     with open(output_file, 'w', encoding='utf-8') as file:
         json.dump(cv_json, file, indent=2, cls=DateTimeEncoder)
@@ -413,17 +382,35 @@ def create_cv_json(md_file, config_file, repo_root, output_file):
 
 def main():
     """Main function to parse arguments and run the conversion."""
+    start("cv_markdown_to_json")
+    
     parser = argparse.ArgumentParser(description='Convert markdown CV to JSON format')
     parser.add_argument('--input', '-i', required=True, help='Input markdown CV file')
     parser.add_argument('--output', '-o', required=True, help='Output JSON file')
     parser.add_argument('--config', '-c', help='Jekyll _config.yml file')
+    parser.add_argument('--force', action='store_true', help='convert even if no input changed')
     
     args = parser.parse_args()
     
     # Get repository root (parent directory of the input file's directory)
     repo_root = str(Path(args.input).parent.parent)
     
+    # Skip the conversion when nothing it reads has changed since the last one
+    def rel(path):
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root))
+    here = os.path.dirname(os.path.abspath(__file__))
+    inputs = [rel(args.input)] + ([rel(args.config)] if args.config else []) + \
+        [f"_{name}/*" for name in COLLECTIONS] + \
+        [rel(os.path.join(here, name)) for name in ("cv_markdown_to_json.py", "collection_index.py")]
+    changes = ChangeSet("cv", inputs, outputs=[rel(args.output)],
+                        key=json.dumps([rel(args.input), args.config and rel(args.config), rel(args.output)]),
+                        root=repo_root)
+    if not args.force and not changes.changed() and os.path.exists(args.output):
+        print(f"{args.input} and the collections are unchanged; {args.output} is up to date")
+        return
+    
     create_cv_json(args.input, args.config, repo_root, args.output)
+    changes.record()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Export the publications as BibTeX, RIS and CSL-JSON
+
+The publication pages written by fetch_orcid.py, pubsFromBib.py and
+publications.py are the only complete list of publications, so anything
+that wants a machine-readable bibliography would otherwise have to
+re-derive it from Markdown. This reads their front matter once, through the
+shared collection index, and writes all three formats in the same pass:
+
+    files/publications.bib     BibTeX, for LaTeX and reference managers
+    files/publications.ris     RIS, for EndNote, Zotero, Mendeley, ...
+    files/publications.json    CSL-JSON, for citeproc and pandoc
+
+Entries are newest first. BibTeX keys are the first author's family name,
+the year and the first word of the title ("williams2025quality"), with a
+letter appended when two entries would otherwise share a key.
+
+Each entry's three renderings are kept in .bibliography-state.json, keyed by
+the content hash of its page, so only new or edited pages are rendered
+again. An output file is only rewritten when its content changes.
+
+Usage (from the repository root):
+    python scripts/export_bibliography.py [--root .] [--force]
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import unicodedata
+
+from citations import to_name
+from collection_index import CollectionIndex, INDEX_FILE, collection_dirs
+from profiling import stage, start
+
+OUTPUTS = {
+    "bibtex": os.path.join("files", "publications.bib"),
+    "ris": os.path.join("files", "publications.ris"),
+    "csl": os.path.join("files", "publications.json"),
+}
+STATE_FILE = ".bibliography-state.json"
+
+# Bump when the rendering of any format changes, to discard the stored entries
+EXPORT_VERSION = 1
+
+# The venue pubsFromBib.py writes for entries from proceedings.bib
+PROCEEDINGS_PRETEXT = "In the proceedings of "
+
+# BibTeX special characters; braces are left alone so titles can protect capitals
+BIBTEX_ESCAPE = str.maketrans({c: "\\" + c for c in "&%$#_"})
+
+
+def text_of(value):
+    """A front matter value as plain text; pubsFromBib.py and publications.py store it HTML-escaped."""
+    if value is None:
+        return ""
+    return html.unescape(re.sub(r"\s+", " ", str(value))).strip()
+
+
+def csl_item(record):
+    """The CSL-JSON item for a publication record; the other formats are rendered from it."""
+    item = {"id": "", "type": "article-journal", "title": text_of(record.title)}
+
+    people = record.get("authors") or []
+    if isinstance(people, str):
+        people = [people]
+    names = [to_name(text_of(p)) for p in people]
+    if names:
+        item["author"] = [{"family": n.family, "given": n.given} if n.given else {"literal": n.family}
+                          for n in names if n.family]
+
+    venue = text_of(record.get("journal") or record.venue)
+    if venue.startswith(PROCEEDINGS_PRETEXT):
+        item["type"] = "paper-conference"
+        venue = venue[len(PROCEEDINGS_PRETEXT):]
+    if venue:
+        item["container-title"] = venue
+
+    date = str(record.date or "")
+    year = str(record.get("year") or date[:4])
+    if year.isdigit():
+        parts = [int(year)]
+        if date[:4] == year:
+            parts += [int(p) for p in date[5:10].split("-") if p.isdigit()]
+            # publications.py and pubsFromBib.py use the 1st of January for "year only"
+            if parts[1:] == [1, 1]:
+                parts = parts[:1]
+        item["issued"] = {"date-parts": [parts]}
+
+    for csl, field in (("volume", "volume"), ("issue", "issue"), ("page", "pages"),
+                       ("publisher", "publisher"), ("DOI", "doi")):
+        value = text_of(record.get(field))
+        if value:
+            item[csl] = value.replace("--", "–") if csl == "page" else value
+    url = text_of(record.get("url") or record.get("paperurl"))
+    if not url and item.get("DOI"):
+        url = "https://doi.org/" + item["DOI"]
+    if url:
+        item["URL"] = url
+    abstract = text_of(record.excerpt)
+    if abstract:
+        item["abstract"] = abstract
+    return item
+
+
+def base_key(item):
+    """First author's family name, year and first significant title word, ASCII only."""
+    def ascii_word(text):
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+        return re.sub(r"[^a-z0-9]", "", text.lower())
+
+    first = (item.get("author") or [{}])[0]
+    name = first.get("family") or first.get("literal") or ""
+    # "van Beethoven" -> "beethoven"
+    family = ascii_word(name.split()[-1]) if name.split() else ""
+    year = str(item.get("issued", {}).get("date-parts", [[""]])[0][0])
+    words = [ascii_word(w) for w in item["title"].split()]
+    word = next((w for w in words if len(w) > 3), next((w for w in words if w), ""))
+    return (family or "anon") + year + word
+
+
+def render_bibtex(item):
+    kind = "inproceedings" if item["type"] == "paper-conference" else "article"
+    fields = [("title", "{" + item["title"] + "}")]
+    if item.get("author"):
+        fields.append(("author", " and ".join(
+            f"{a['family']}, {a['given']}" if "family" in a else "{" + a["literal"] + "}"
+            for a in item["author"])))
+    if item.get("container-title"):
+        fields.append(("booktitle" if kind == "inproceedings" else "journal", item["container-title"]))
+    date = item.get("issued", {}).get("date-parts", [[]])[0]
+    if date:
+        fields.append(("year", str(date[0])))
+    if len(date) > 1:
+        fields.append(("month", str(date[1])))
+    for bib, csl in (("volume", "volume"), ("number", "issue"), ("pages", "page"),
+                     ("publisher", "publisher"), ("doi", "DOI"), ("url", "URL"), ("abstract", "abstract")):
+        if item.get(csl):
+            fields.append((bib, item[csl].replace("–", "--") if bib == "pages" else item[csl]))
+    body = ",\n".join(f"  {name} = {{{value.translate(BIBTEX_ESCAPE) if name not in ('url', 'doi') else value}}}"
+                      for name, value in fields)
+    return f"@{kind}{{{item['id']},\n{body}\n}}\n"
+
+
+def render_ris(item):
+    lines = [("TY", "CONF" if item["type"] == "paper-conference" else "JOUR"), ("ID", item["id"]),
+             ("TI", item["title"])]
+    for a in item.get("author", []):
+        lines.append(("AU", f"{a['family']}, {a['given']}" if "family" in a else a["literal"]))
+    if item.get("container-title"):
+        lines.append(("T2", item["container-title"]))
+    date = item.get("issued", {}).get("date-parts", [[]])[0]
+    if date:
+        lines.append(("PY", str(date[0])))
+    if len(date) > 1:
+        # YYYY/MM/DD/, with empty parts for what is unknown
+        parts = [str(date[0])] + [f"{p:02d}" for p in date[1:]]
+        lines.append(("DA", "/".join(parts + [""] * (3 - len(parts))) + "/"))
+    for tag, csl in (("VL", "volume"), ("IS", "issue"), ("PB", "publisher"), ("DO", "DOI"),
+                     ("UR", "URL"), ("AB", "abstract")):
+        if item.get(csl):
+            lines.append((tag, item[csl]))
+    if item.get("page"):
+        start_page, _, end_page = item["page"].partition("–")
+        lines.append(("SP", start_page))
+        if end_page:
+            lines.append(("EP", end_page))
+    lines.append(("ER", ""))
+    return "".join(f"{tag}  - {value}\n" for tag, value in lines)
+
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == EXPORT_VERSION:
+            return state["entries"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def export_bibliography(root=".", force=False):
+    """Write the three exports; return counts of entries, entries rendered and files rewritten."""
+    state_path = os.path.join(root, STATE_FILE)
+    previous = {} if force else load_state(state_path)
+
+    stage("read")
+    index = CollectionIndex.load(collection_dirs(root, ["publications"]),
+                                 cache_path=os.path.join(root, INDEX_FILE))
+    records = [r for r in index.query(collection="publications") if r.get("published", True) is not False]
+    # newest first; undated entries last
+    records.sort(key=lambda r: (str(r.date or r.get("year") or ""), r.path), reverse=True)
+    records.sort(key=lambda r: not (r.date or r.get("year")))
+
+    stage("render")
+    entries, rendered, used = {}, 0, {}
+    for record in records:
+        path = os.path.relpath(record.path, root).replace(os.sep, "/")
+        old = previous.get(path)
+        if old and old["digest"] == record.digest:
+            item = old["csl"]
+        else:
+            item = csl_item(record)
+            old = None
+
+        # keys depend on the other entries, so they are assigned on every run
+        key = base_key(item)
+        used[key] = used.get(key, 0) + 1
+        if used[key] > 1:
+            key += "abcdefghijklmnopqrstuvwxyz"[min(used[key] - 1, 25)]
+
+        if old and old["csl"]["id"] == key:
+            entries[path] = old
+            continue
+        item["id"] = key
+        entries[path] = {"digest": record.digest, "csl": item,
+                         "bibtex": render_bibtex(item), "ris": render_ris(item)}
+        rendered += 1
+
+    stage("write")
+    ordered = list(entries.values())
+    contents = {
+        "bibtex": "\n".join(e["bibtex"] for e in ordered),
+        "ris": "\n".join(e["ris"] for e in ordered),
+        "csl": json.dumps([e["csl"] for e in ordered], indent=1, ensure_ascii=False) + "\n",
+    }
+    written = sum(write_if_changed(os.path.join(root, OUTPUTS[fmt]), content)
+                  for fmt, content in contents.items())
+    write_if_changed(state_path, json.dumps({"version": EXPORT_VERSION, "entries": entries},
+                                            separators=(",", ":"), ensure_ascii=False))
+    return {"entries": len(entries), "rendered": rendered, "written": written}
+
+
+def main():
+    start("export_bibliography")
+    parser = argparse.ArgumentParser(description="Export the publications as BibTeX, RIS and CSL-JSON")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("--force", action="store_true", help="render every entry again")
+    args = parser.parse_args()
+
+    counts = export_bibliography(args.root, args.force)
+    print(f"Bibliography: {counts['entries']} entries, {counts['rendered']} rendered, "
+          f"{counts['written']} of {len(OUTPUTS)} files rewritten")
+
+
+if __name__ == "__main__":
+    main()
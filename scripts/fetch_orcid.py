@@ -20,6 +20,10 @@ from datetime import datetime
 
 import requests
 
+from profiling import span, stage, start
+from citations import DEFAULT_STYLE, render_citations
+from front_matter import yaml_quote
+
 # ----------------------- CONFIG -----------------------
 ORCID = "0000-0002-9076-9635"
 OUT_DIR = Path("_publications")
@@ -404,7 +408,7 @@ def parse_group_item_with_details(item, i, headers):
     }
 
 # ----------------------- markdown writer -----------------------
-def mk_markdown(parsed, idx):
+def mk_markdown(parsed, idx, citation=None):
     slug = safe_filename(parsed.get("title")) or f"publication-{idx}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
     fname_prefix = (parsed.get('year') or '')[:4] or 'nodate'
     filename = OUT_DIR / f"{fname_prefix}-{slug}.md"
@@ -416,6 +420,7 @@ def mk_markdown(parsed, idx):
         "journal": parsed.get("journal"),
         "doi": parsed["doi"],
         "url": parsed["url"],
+        "citation": citation or None,
     }
     fm = "---\n"
     for k,v in front.items():
@@ -424,9 +429,9 @@ def mk_markdown(parsed, idx):
         if isinstance(v, list):
             fm += f"{k}:\n"
             for elem in v:
-                fm += f"  - \"{elem}\"\n"
+                fm += f"  - \"{yaml_quote(elem)}\"\n"
         else:
-            fm += f"{k}: \"{v}\"\n"
+            fm += f"{k}: \"{yaml_quote(v)}\"\n"
     fm += "---\n\n"
     body = parsed["abstract"] + "\n" if parsed["abstract"] else ""
     return filename, fm + body
@@ -434,8 +439,10 @@ def mk_markdown(parsed, idx):
 # ----------------------- main ----------------------------------------------
 def main():
     print("Starting ORCID fetch for", ORCID)
+    stage("token")
     token = get_token()
     headers = {"Accept": "application/json", "Authorization": f"Bearer {token}"}
+    stage("record")
     url = ORCID_RECORD_URL_TEMPLATE.format(orcid=ORCID)
     r = requests.get(url, headers=headers, timeout=30)
     if r.status_code != 200:
@@ -457,8 +464,11 @@ def main():
     except Exception as e:
         print("Could not write debug JSON:", e)
 
+    stage("works")
+    works = []
     for i, item in enumerate(works_group):
-        parsed = parse_group_item_with_details(item, i, headers)
+        with span("details"):
+            parsed = parse_group_item_with_details(item, i, headers)
         print(f"[{i}] title='{parsed['title'][:120]}' authors_found={len(parsed['authors'])} diag={parsed['diag']}")
         if parsed['authors']:
             print(f"    authors (from ORCID/detail/deep): {parsed['authors']}")
@@ -467,21 +477,32 @@ def main():
 
         # Prefer CrossRef authors and journal when DOI exists
         if parsed.get("doi"):
-            crossref_auths = fetch_crossref_authors(parsed["doi"], mailto=CROSSREF_MAILTO)
+            with span("crossref"):
+                crossref_auths = fetch_crossref_authors(parsed["doi"], mailto=CROSSREF_MAILTO)
             if crossref_auths:
                 print(f"    Using CrossRef authors for DOI {parsed['doi']}: {crossref_auths}")
                 parsed['authors'] = crossref_auths
                 # prefer CrossRef container-title for journal if we don't already have one
                 if not parsed.get("journal"):
-                    cr_journal = fetch_crossref_container_title(parsed["doi"], mailto=CROSSREF_MAILTO)
+                    with span("crossref"):
+                        cr_journal = fetch_crossref_container_title(parsed["doi"], mailto=CROSSREF_MAILTO)
                     if cr_journal:
                         parsed["journal"] = cr_journal
             else:
                 print(f"    CrossRef had no authors for DOI {parsed['doi']}, keeping ORCID-derived authors.")
         else:
             print("    No DOI present; using ORCID-derived authors (if any).")
+        works.append(parsed)
+
+    # all citations in one batch, in the same style as the BibTeX and TSV pages
+    stage("citations")
+    citations = render_citations([{"authors": p["authors"], "title": p["title"], "venue": p.get("journal") or "",
+                                   "year": (p["year"] or "")[:4], "doi": p["doi"] or ""} for p in works],
+                                 style=DEFAULT_STYLE)
 
-        filename, content = mk_markdown(parsed, i)
+    stage("write")
+    for i, (parsed, citation) in enumerate(zip(works, citations)):
+        filename, content = mk_markdown(parsed, i, citation)
         with open(filename, "w", encoding="utf-8") as fh:
             fh.write(content)
         written.append(str(filename))
@@ -501,4 +522,5 @@ def main():
     print(f"Wrote {len(written)} publication files to {OUT_DIR}")
 
 if __name__ == "__main__":
+    start("fetch_orcid")
     main()
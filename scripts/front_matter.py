@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Writing values into YAML front matter.
+
+The generators build front matter as text rather than through a YAML
+library, which keeps them fast to start. Every value written between double
+quotes goes through yaml_quote(), so a backslash or a quote in a title
+cannot end the string early or turn into an escape sequence:
+
+    from front_matter import yaml_quote
+
+    md += 'title: "' + yaml_quote(title) + '"\n'
+"""
+
+
+def yaml_quote(value):
+    """Escape a value for a double-quoted YAML scalar: backslashes first, then quotes."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling shared by the site's generator scripts.
+
+Every generator calls start() before doing any work and marks its stages
+with span() or stage(). Normally these do nothing. Passing --profile (or
+--profile=DIR) on the command line, or setting SITE_PROFILE=1 (or
+SITE_PROFILE=DIR) in the environment, turns profiling on for that run:
+
+- cProfile records every call; the raw stats are saved for pstats/snakeviz
+- each span records its wall and CPU time (nested spans are named "outer/inner")
+- tracemalloc tracks peak memory, for the run and per span
+
+When the script exits, three files are written to DIR (default .profile/),
+named after the script and the start time:
+
+- NAME-STAMP.pstats     cProfile output, for `python -m pstats`
+- NAME-STAMP.collapsed  collapsed stacks, for flamegraph.pl or speedscope
+- NAME-STAMP.json       summary: totals, spans and the slowest functions
+
+Only the standard library is used, and nothing heavier than `os`, `sys` and
+`time` is imported unless profiling is switched on, so the hooks cost nothing
+in normal runs.
+"""
+
+import os
+import sys
+import time
+
+ENV_VAR = "SITE_PROFILE"
+DEFAULT_DIR = ".profile"
+
+# Functions listed in the summary, and the smallest stack (in microseconds)
+# kept in the collapsed output
+TOP_FUNCTIONS = 25
+MIN_STACK_US = 10
+
+_session = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, session, name):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.session.stack.append(self.name)
+        self.key = "/".join(self.session.stack)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.outer_peak = self.session.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        peak = self.session.reset_peak()
+        # the enclosing span's peak has to include what happened inside this one
+        self.session.carry_peak = max(self.outer_peak, peak)
+        self.session.stack.pop()
+        stats = self.session.spans.setdefault(self.key, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+        stats["calls"] += 1
+        stats["wall"] += wall
+        stats["cpu"] += cpu
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+        return False
+
+
+class _Session:
+    def __init__(self, name, folder):
+        import cProfile
+        import tracemalloc
+
+        self.name = name
+        self.folder = folder
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.argv = list(sys.argv)
+        self.spans = {}
+        self.stack = []
+        self.carry_peak = 0
+        # the open stage() span, if any
+        self.stage = None
+        self.tracemalloc = tracemalloc
+        tracemalloc.start()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def reset_peak(self):
+        """Return the peak traced memory since the last call, and start a new interval."""
+        _, peak = self.tracemalloc.get_traced_memory()
+        peak = max(peak, self.carry_peak)
+        self.carry_peak = 0
+        self.tracemalloc.reset_peak()
+        return peak
+
+    def finish(self):
+        if self.stage is not None:
+            self.stage.__exit__(None, None, None)
+        self.profiler.disable()
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        peak = max([self.reset_peak()] + [s["peak_bytes"] for s in self.spans.values()])
+        self.tracemalloc.stop()
+
+        import json
+        import pstats
+
+        os.makedirs(self.folder, exist_ok=True)
+        base = os.path.join(self.folder, f"{self.name}-{self.stamp}")
+        stats = pstats.Stats(self.profiler)
+        stats.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, us in collapsed_stacks(stats.stats):
+                f.write(f"{stack} {us}\n")
+
+        summary = {
+            "script": self.name,
+            "argv": self.argv,
+            "python": sys.version.split()[0],
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "peak_memory_bytes": peak,
+            "spans": {key: {"calls": s["calls"], "wall_seconds": round(s["wall"], 6),
+                            "cpu_seconds": round(s["cpu"], 6), "peak_memory_bytes": s["peak_bytes"]}
+                      for key, s in self.spans.items()},
+            "top_functions": top_functions(stats.stats),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Profile of {self.name}: {wall:.3f}s wall, {cpu:.3f}s CPU, "
+              f"{peak / 1e6:.1f} MB peak; written to {base}.{{pstats,collapsed,json}}",
+              file=sys.stderr)
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        # built-ins show up as "<built-in method ...>"
+        return name.strip("<>").replace(" ", "_").replace(";", ",")
+    return f"{os.path.basename(filename)}:{name}:{line}".replace(" ", "_").replace(";", ",")
+
+
+def collapsed_stacks(raw):
+    """Turn pstats' caller/callee graph into ("root;...;leaf", self_microseconds) pairs.
+
+    cProfile only records which function called which, not whole stacks, so
+    time is split between paths in proportion to the calls each caller made,
+    as flameprof and similar tools do. Recursive edges are not followed.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+
+    totals = {}
+
+    def walk(func, path, budget):
+        _, _, tt, ct, _ = raw[func]
+        share = budget / ct if ct else 0.0
+        path = path + [func]
+        self_us = int(tt * share * 1e6)
+        if self_us >= MIN_STACK_US:
+            key = ";".join(_label(f) for f in path)
+            totals[key] = totals.get(key, 0) + self_us
+        for callee, edge_ct in callees.get(func, ()):
+            if callee in path:
+                continue
+            child_budget = edge_ct * share
+            if child_budget * 1e6 >= MIN_STACK_US:
+                walk(callee, path, child_budget)
+
+    for root in roots:
+        walk(root, [], raw[root][3])
+    return sorted(totals.items())
+
+
+def top_functions(raw, limit=TOP_FUNCTIONS):
+    """The functions with the most cumulative time, for the JSON summary."""
+    rows = sorted(raw.items(), key=lambda item: -item[1][3])[:limit]
+    return [{"function": _label(func), "calls": nc, "primitive_calls": cc,
+             "total_seconds": round(tt, 6), "cumulative_seconds": round(ct, 6)}
+            for func, (cc, nc, tt, ct, _) in rows]
+
+
+def start(name, argv=None):
+    """Start profiling `name` if --profile or SITE_PROFILE asks for it.
+
+    The --profile option is removed from `argv` (sys.argv[1:] by default, which
+    is updated in place) so the script's own argument parsing never sees it;
+    the remaining arguments are returned.
+    """
+    global _session
+    in_sys_argv = argv is None
+    args = list(sys.argv[1:] if in_sys_argv else argv)
+
+    folder = os.environ.get(ENV_VAR) or None
+    if folder in ("1", "true", "yes"):
+        folder = DEFAULT_DIR
+    remaining = []
+    for arg in args:
+        if arg == "--profile":
+            folder = DEFAULT_DIR
+        elif arg.startswith("--profile="):
+            folder = arg.split("=", 1)[1] or DEFAULT_DIR
+        else:
+            remaining.append(arg)
+    if in_sys_argv:
+        sys.argv[1:] = remaining
+
+    if folder and _session is None:
+        import atexit
+        _session = _Session(name, folder)
+        atexit.register(_session.finish)
+    return remaining
+
+
+def span(name):
+    """Context manager timing one stage of the run; a no-op unless profiling."""
+    if _session is None:
+        return _NULL_SPAN
+    return _Span(_session, name)
+
+
+def stage(name):
+    """Start the next sequential stage of a script, ending the previous one.
+
+    For scripts that run top to bottom rather than through functions, where
+    wrapping each stage in `with span(...)` would mean re-indenting it.
+    """
+    if _session is None:
+        return
+    if _session.stage is not None:
+        _session.stage.__exit__(None, None, None)
+    _session.stage = _Span(_session, name)
+    _session.stage.__enter__()
+
+
+def enabled():
+    return _session is not None
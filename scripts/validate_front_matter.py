@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Validate the front matter of every collection file before Jekyll sees it
+
+fetch_orcid.py, talks.py and hand edits all write YAML front matter as plain
+strings, and a stray quote in a title breaks the page. Jekyll only reports
+that at the end of a slow build, if at all. This parses the front matter of
+every file in the collection folders and checks it against the schema of its
+collection in SCHEMAS:
+
+    - the front matter is there, is valid YAML and is a mapping
+    - no key appears twice (YAML silently keeps the last one)
+    - required keys are present and not empty
+    - dates are YYYY-MM-DD (optionally with a time), years are four digits,
+      lists are lists of plain values, permalinks start with "/"
+    - no two files claim the same permalink
+
+Files are parsed in parallel worker processes when there are many of them.
+Results are kept in .front-matter-cache.json, keyed by each file's size and
+modification time and then its content hash, so a run only parses files
+that changed since the last one.
+
+Paths given on the command line are checked instead of the whole site,
+which is what a pre-commit hook passes (see .pre-commit-config.yaml).
+Exits with status 1 when a file has a problem.
+
+Usage (from the repository root):
+    python scripts/validate_front_matter.py [--root .] [--jobs N] [--force] [FILE ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import yaml
+
+from profiling import stage, start
+
+CACHE_FILE = ".front-matter-cache.json"
+
+# Bump when the checks change, to discard cached results
+VALIDATOR_VERSION = 1
+
+# Below this many files to parse, worker processes cost more than they save
+PARALLEL_THRESHOLD = 64
+
+EXTENSIONS = (".md", ".markdown", ".html")
+
+# Per collection: required keys, and the kind of value each known key must have.
+# Kinds: "str" (any scalar), "date", "year", "list", "tags" (a list or a single string),
+# "permalink", "bool". Keys not listed are not checked.
+COMMON = {"title": "str", "permalink": "permalink", "excerpt": "str", "layout": "str",
+          "published": "bool", "author_profile": "bool", "redirect_from": "tags"}
+SCHEMAS = {
+    "publications": {
+        "required": ("title",),
+        "one_of": ("date", "year"),
+        "fields": dict(COMMON, date="date", year="year", authors="list", venue="str", journal="str",
+                       citation="str", doi="str", url="str", paperurl="str", slidesurl="str",
+                       bibtexurl="str", category="str", collection="str"),
+    },
+    "talks": {
+        "required": ("title", "date"),
+        "fields": dict(COMMON, date="date", type="str", venue="str", location="str",
+                       talk_url="str", slidesurl="str", collection="str"),
+    },
+    "teaching": {
+        "required": ("title", "date"),
+        "fields": dict(COMMON, date="date", type="str", venue="str", location="str", collection="str"),
+    },
+    "portfolio": {
+        "required": ("title",),
+        "fields": dict(COMMON, date="date", collection="str"),
+    },
+    "posts": {
+        "required": ("title",),
+        "fields": dict(COMMON, date="date", tags="tags", categories="tags"),
+    },
+    "pages": {
+        "required": (),
+        "fields": dict(COMMON, sitemap="bool"),
+    },
+}
+
+FRONT_MATTER = re.compile(r"^---[ \t]*\n(.*?)\n?^---[ \t]*$", re.DOTALL | re.MULTILINE)
+OPENING = re.compile(r"^---[ \t]*(\n|$)")
+DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{1,2}:\d{2}(:\d{2})?( ?[+-]\d{2}:?\d{2}|Z)?)?$")
+
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class UniqueKeyLoader(Loader):
+    """A safe loader that refuses mappings with a repeated key."""
+
+
+def _construct_mapping(loader, node, deep=False):
+    seen = set()
+    for key_node, _ in node.value:
+        key = loader.construct_object(key_node, deep=deep)
+        if key in seen:
+            raise yaml.constructor.ConstructorError(
+                None, None, f"duplicate key {key!r}", key_node.start_mark)
+        seen.add(key)
+    return loader.construct_mapping(node, deep)
+
+
+UniqueKeyLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, _construct_mapping)
+
+
+def collection_of(path):
+    """The collection a repository-relative path belongs to ("_talks/x.md" -> "talks"), or None."""
+    folder = path.replace(os.sep, "/").split("/")[0]
+    name = folder[1:] if folder.startswith("_") else None
+    return name if name in SCHEMAS else None
+
+
+def find_files(root):
+    files = []
+    for collection in SCHEMAS:
+        folder = os.path.join(root, "_" + collection)
+        for dirpath, dirs, names in os.walk(folder):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(EXTENSIONS):
+                    files.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return files
+
+
+def check_value(kind, value):
+    """Return a description of what is wrong with `value`, or None."""
+    if value is None:
+        return None
+    if kind == "str":
+        if isinstance(value, (dict, list)):
+            return f"should be a single value, not a {type(value).__name__}"
+    elif kind == "date":
+        if not isinstance(value, (date, datetime)) and not DATE.match(str(value)):
+            return f"{value!r} is not a YYYY-MM-DD date"
+    elif kind == "year":
+        if not re.fullmatch(r"\d{4}", str(value)):
+            return f"{value!r} is not a four-digit year"
+    elif kind in ("list", "tags"):
+        if kind == "tags" and isinstance(value, str):
+            return None
+        if not isinstance(value, list):
+            return f"should be a list, not {type(value).__name__}"
+        bad = [v for v in value if isinstance(v, (dict, list)) or v is None]
+        if bad:
+            return f"list items should be plain values, not {bad[0]!r}"
+    elif kind == "permalink":
+        if not str(value).startswith("/"):
+            return f"{value!r} should start with '/'"
+    elif kind == "bool":
+        if not isinstance(value, bool):
+            return f"{value!r} should be true or false"
+    return None
+
+
+def validate_text(collection, text):
+    """Check one file's text; return (errors, permalink). Errors are "line N: message" strings."""
+    match = FRONT_MATTER.match(text)
+    if not match:
+        if OPENING.match(text):
+            return ["line 1: front matter is not closed (no second '---' line)"], None
+        return ["no front matter (the file must start with a '---' line)"], None
+    try:
+        data = yaml.load(match.group(1), Loader=UniqueKeyLoader)
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None) or getattr(e, "context_mark", None)
+        where = f"line {mark.line + 2}: " if mark else ""
+        problem = getattr(e, "problem", None) or str(e).splitlines()[0]
+        return [f"{where}invalid YAML: {problem}"], None
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return [f"front matter should be a mapping of keys to values, not {type(data).__name__}"], None
+
+    schema = SCHEMAS[collection]
+    errors = []
+    for key in schema["required"]:
+        if data.get(key) in (None, "", []):
+            errors.append(f"missing required key '{key}'")
+    one_of = schema.get("one_of")
+    if one_of and not any(data.get(key) not in (None, "") for key in one_of):
+        errors.append("needs one of " + ", ".join(f"'{k}'" for k in one_of))
+    for key, kind in schema["fields"].items():
+        problem = check_value(kind, data.get(key))
+        if problem:
+            errors.append(f"'{key}' {problem}")
+    permalink = data.get("permalink")
+    return errors, str(permalink) if permalink and not isinstance(permalink, (dict, list)) else None
+
+
+def validate_file(root, path, collection):
+    """Read and check one file; returns (errors, permalink). Runs in a worker process."""
+    try:
+        with open(os.path.join(root, path), "r", encoding="utf-8") as f:
+            text = f.read()
+    except UnicodeDecodeError:
+        return ["not valid UTF-8"], None
+    return validate_text(collection, text)
+
+
+def schema_digest():
+    return hashlib.sha1(json.dumps([VALIDATOR_VERSION, SCHEMAS], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("schema") == schema_digest():
+            return cache["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def validate(root=".", paths=None, jobs=None, force=False):
+    """Check `paths` (default: every collection file); return {path: [errors]} for every file checked."""
+    cache_path = os.path.join(root, CACHE_FILE)
+    cache = {} if force else load_cache(cache_path)
+
+    stage("scan")
+    if paths is None:
+        paths = find_files(root)
+    else:
+        paths = [os.path.relpath(os.path.abspath(p), os.path.abspath(root)) for p in paths]
+        paths = [p for p in paths if collection_of(p) and p.endswith(EXTENSIONS)
+                 and os.path.isfile(os.path.join(root, p))]
+
+    results, todo = {}, []
+    for path in paths:
+        key = path.replace(os.sep, "/")
+        st = os.stat(os.path.join(root, path))
+        stat = [st.st_size, st.st_mtime_ns]
+        old = cache.get(key)
+        if old and old["stat"] == stat:
+            results[key] = old
+            continue
+        with open(os.path.join(root, path), "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if old and old["digest"] == digest:
+            results[key] = dict(old, stat=stat)
+            continue
+        todo.append((key, path, stat, digest))
+
+    stage("parse")
+    if todo:
+        args = [(root, path, collection_of(path)) for _, path, _, _ in todo]
+        if len(todo) < PARALLEL_THRESHOLD or jobs == 1:
+            checked = [validate_file(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                checked = list(pool.map(validate_file, *zip(*args), chunksize=32))
+        for (key, _, stat, digest), (errors, permalink) in zip(todo, checked):
+            results[key] = {"stat": stat, "digest": digest, "errors": errors, "permalink": permalink}
+
+    stage("permalinks")
+    # compare against every known file, not only the ones checked this time
+    known = dict(cache)
+    known.update(results)
+    owners = {}
+    for key in sorted(known):
+        if known[key].get("permalink") and os.path.exists(os.path.join(root, key)):
+            owners.setdefault(known[key]["permalink"].rstrip("/") or "/", []).append(key)
+    report = {key: list(entry["errors"]) for key, entry in results.items()}
+    for permalink, files in owners.items():
+        if len(files) > 1:
+            for key in files:
+                if key in report:
+                    others = ", ".join(f for f in files if f != key)
+                    report[key].append(f"permalink {permalink} is also used by {others}")
+
+    if todo:
+        cache.update(results)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"schema": schema_digest(), "files": cache}, f, separators=(",", ":"))
+        os.replace(tmp, cache_path)
+    return report
+
+
+def main():
+    start("validate_front_matter")
+    parser = argparse.ArgumentParser(description="Validate the front matter of the collection files")
+    parser.add_argument("files", nargs="*", help="files to check (default: every collection file)")
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="ignore cached results")
+    args = parser.parse_args()
+
+    report = validate(args.root, args.files or None, args.jobs, args.force)
+    bad = {path: errors for path, errors in sorted(report.items()) if errors}
+    for path, errors in bad.items():
+        for error in errors:
+            print(f"{path}: {error}")
+    print(f"{len(report)} files checked, {len(bad)} with problems")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
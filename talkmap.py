@@ -1,56 +1,346 @@
 # Leaflet cluster map of talk locations
 #
-# Run this from the _talks/ directory, which contains .md files of all your
-# talks. This scrapes the location YAML field from each .md file, geolocates it
-# with geopy/Nominatim, and uses the getorg library to output data, HTML, and
-# Javascript for a standalone cluster map. This is functionally the same as the
-# #talkmap Jupyter notebook.
-import frontmatter
-import glob
-import getorg
-from geopy import Nominatim
-from geopy.exc import GeocoderTimedOut
+# Builds the talk map from the .md files of all your talks in _talks/. This
+# scrapes the location YAML field from each .md file, geolocates it with
+# geopy/Nominatim, and writes the data for a standalone cluster map into
+# talkmap/. This is functionally the same as the #talkmap Jupyter notebook, but
+# needs no Jupyter kernel. From the repository root:
+#
+#     python talkmap.py [--talks-dir _talks] [--out-dir talkmap] [--deadline 300] [--offline]
+#
+# or from other Python code:
+#
+#     from talkmap import build_talkmap
+#     build_talkmap("_talks", "talkmap")
+#
+# Importing the module does no work; geopy and the shared modules in scripts/
+# are only imported once a build needs them. Like the other generators, it
+# takes --profile (see scripts/profiling.py).
+#
+# Only the title, venue and location of each talk matter to the map. The talks
+# are read through the shared collection index (scripts/collection_index.py),
+# so unchanged files are not re-parsed, and the set of (title, venue,
+# location) tuples is recorded in talkmap/.talks-manifest.json; when it is the
+# same as last time the map build is skipped. Before even that, the shared
+# change detection (scripts/changes.py) is asked whether any talk file or map
+# output changed since the last successful build, which costs one git call.
+#
+# Network geocoding goes through a scheduler that keeps to Nominatim's rate
+# limit, retries timeouts and outages with exponential backoff, and stops once
+# the run has used DEADLINE seconds. Locations that could not be resolved are
+# saved in talkmap/geocode-pending.json and tried first on the next run, so a
+# flaky run no longer silently drops pins for good.
+#
+# Geocoding results are kept in talkmap/geocode-cache.json, keyed by the
+# normalized location string, and the cache is consulted before any call to
+# Nominatim. Locations Nominatim could not find are cached too, and retried
+# only once NEGATIVE_TTL has passed; a miss from the offline gazetteer alone
+# is not cached, but queued like a failed lookup so an online run tries it. Commit the cache along with the map so
+# later runs only geocode places that have never been seen.
+#
+# The map itself is talkmap/map.html, which is static. This script writes the
+# data it loads: talkmap/clusters/, the markers clustered ahead of time for
+# every zoom level (see talkmap_clusters.py), and talkmap/org-locations.js,
+# the plain list of points in the format getorg used to produce.
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import namedtuple
+from talkmap_geocoders import (GAZETTEER_INDEX, ChainGeocoder, DeadlineExceeded,
+                               GazetteerGeocoder, LazyGeocoder, ScheduledGeocoder, is_offline)
+from talkmap_clusters import cluster_levels, stamp_map, write_levels
 
 # Set the default timeout, in seconds
 TIMEOUT = 5
 
-# Collect the Markdown files
-g = glob.glob("_talks/*.md")
-
-# Prepare to geolocate
-geocoder = Nominatim(user_agent="academicpages.github.io")
-location_dict = {}
-location = ""
-permalink = ""
-title = ""
-
-# Perform geolocation
-for file in g:
-    # Read the file
-    data = frontmatter.load(file)
-    data = data.to_dict()
-
-    # Press on if the location is not present
-    if 'location' not in data:
-        continue
-
-    # Prepare the description
-    title = data['title'].strip()
-    venue = data['venue'].strip()
-    location = data['location'].strip()
-    description = f"{title}<br />{venue}; {location}"
-
-    # Geocode the location and report the status
+# Total time budget for network geocoding in one run, in seconds, and the
+# minimum spacing between requests Nominatim's usage policy asks for
+DEADLINE = int(os.environ.get("TALKMAP_DEADLINE", 300))
+MIN_INTERVAL = 1.0
+
+# Files kept in the output folder between builds: locations still to be
+# geocoded after an interrupted or failed run, the geocode cache, and the
+# talks that were on the map at the last build
+PENDING_FILE = "geocode-pending.json"
+CACHE_FILE = "geocode-cache.json"
+MANIFEST_FILE = ".talks-manifest.json"
+MAP_OUTPUTS = ["org-locations.js", "clusters/index.json"]
+
+# How long a "not found" from the geocoder is trusted, in seconds
+NEGATIVE_TTL = 30 * 24 * 3600
+
+# The parts of a geopy Location that getorg needs
+CachedLocation = namedtuple("CachedLocation", ["address", "latitude", "longitude"])
+
+
+def normalize_location(location):
+    """Normalize a location string so trivially different spellings share a cache entry."""
+    location = unicodedata.normalize("NFKC", location).casefold()
+    location = re.sub(r"\s*,\s*", ", ", location)
+    location = re.sub(r"\s+", " ", location)
+    return location.strip(" ,.;")
+
+
+def load_json(path):
     try:
-        location_dict[description] = geocoder.geocode(location, timeout=TIMEOUT)
-        print(description, location_dict[description])
-    except ValueError as ex:
-        print(f"Error: geocode failed on input {location} with message {ex}")
-    except GeocoderTimedOut as ex:
-        print(f"Error: geocode timed out on input {location} with message {ex}")
-    except Exception as ex:
-        print(f"An unhandled exception occurred while processing input {location} with message {ex}")
-
-# Save the map
-m = getorg.orgmap.create_map_obj()
-getorg.orgmap.output_html_cluster_map(location_dict, folder_name="talkmap", hashed_usernames=False)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(data, path):
+    """Write `data` as pretty, stable JSON, leaving the file alone if it would not change."""
+    content = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False) + "\n"
+    write_if_changed(path, content)
+
+
+def write_if_changed(path, content):
+    """Write `content` to `path` unless it already holds exactly that; return True if written."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def _use_scripts():
+    """Make the shared modules in scripts/ (collection index, profiling) importable."""
+    scripts = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts")
+    if scripts not in sys.path:
+        sys.path.insert(0, scripts)
+
+
+def read_talks(talks_dir):
+    """Return the sorted [title, venue, location] of every talk in `talks_dir` that has a location.
+
+    The talks come from the shared collection index (scripts/collection_index.py),
+    which only re-parses files that changed since it was last saved.
+    """
+    _use_scripts()
+    from collection_index import CollectionIndex, INDEX_FILE
+
+    # the index lives next to the collection folders, like in the repository root
+    root = os.path.dirname(os.path.normpath(talks_dir))
+    index = CollectionIndex.load({"talks": talks_dir}, cache_path=os.path.join(root, INDEX_FILE))
+
+    # Talks without a location are not on the map
+    return sorted([str(r.title).strip(), str(r.get("venue", "")).strip(), str(r.location).strip()]
+                  for r in index.query(collection="talks", where=lambda r: r.location))
+
+
+def cached_geocode(geocoder, location, cache, now=None):
+    """Geocode `location`, answering from `cache` when possible.
+
+    Returns a CachedLocation, or None if the place could not be found. Network
+    errors propagate and are not cached, and neither are misses of a geocoder
+    that only has local data (see talkmap_geocoders.is_offline).
+    """
+    now = time.time() if now is None else now
+    key = normalize_location(location)
+    hit = cache.get(key)
+    if hit is not None:
+        if hit.get("latitude") is not None:
+            return CachedLocation(hit["address"], hit["latitude"], hit["longitude"])
+        if now - hit.get("checked", 0) < NEGATIVE_TTL:
+            return None
+
+    result = geocoder.geocode(location, timeout=TIMEOUT)
+    if result is None:
+        if not is_offline(geocoder):
+            cache[key] = {"latitude": None, "checked": int(now)}
+        return None
+    cache[key] = {"address": result.address, "latitude": result.latitude,
+                  "longitude": result.longitude, "checked": int(now)}
+    return CachedLocation(result.address, result.latitude, result.longitude)
+
+
+def write_locations_js(location_dict, path):
+    """Write the [[title, latitude, longitude], ...] list that getorg used to write."""
+    points = [[title, location.latitude, location.longitude]
+              for title, location in location_dict.items() if location is not None]
+    return write_if_changed(path, "var addressPoints = " + json.dumps(points, indent=2) + ";")
+
+
+def nominatim_geocoder(deadline=DEADLINE):
+    """Nominatim, kept to its rate limit and to `deadline` seconds in total."""
+    from geopy import Nominatim
+    from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+    return ScheduledGeocoder(
+        Nominatim(user_agent="academicpages.github.io"), deadline,
+        min_interval=MIN_INTERVAL,
+        transient=(GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited, OSError))
+
+
+def default_geocoder(deadline=DEADLINE, offline=False):
+    """Gazetteer first when an index has been built (see talkmap_geocoders.py), then Nominatim.
+
+    With `offline=True` only the gazetteer is used. Nominatim is only set up
+    (and geopy imported) once the gazetteer misses a place.
+    """
+    geocoders = []
+    if os.path.exists(GAZETTEER_INDEX):
+        geocoders.append(GazetteerGeocoder(GAZETTEER_INDEX))
+    if not offline:
+        geocoders.append(LazyGeocoder(lambda: nominatim_geocoder(deadline)))
+    if not geocoders:
+        raise RuntimeError(f"--offline needs a gazetteer index at {GAZETTEER_INDEX}")
+    return geocoders[0] if len(geocoders) == 1 else ChainGeocoder(*geocoders)
+
+
+def build_talkmap(talks_dir="_talks", out_dir="talkmap", geocoder=None, force=False):
+    """Geocode the talks in `talks_dir` and write the map data into `out_dir`.
+
+    `geocoder` is anything with a geopy-style geocode(query, timeout) method;
+    by default the gazetteer and Nominatim are used (see default_geocoder),
+    set up only once a place is missing from the cache.
+    Returns a summary dict; "skipped" is True when the talks' titles, venues
+    and locations had not changed and nothing was rebuilt.
+    """
+    _use_scripts()
+    from profiling import stage
+
+    stage("read")
+
+    # Find out which talks are on the map, and stop if that has not changed
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    pending_path = os.path.join(out_dir, PENDING_FILE)
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    manifest = load_json(manifest_path)
+    pending = load_json(pending_path) or []
+    outputs_exist = all(os.path.exists(os.path.join(out_dir, p)) for p in MAP_OUTPUTS)
+
+    from changes import ChangeSet
+    root = os.path.dirname(os.path.normpath(os.path.abspath(talks_dir)))
+    out_rel = os.path.relpath(os.path.abspath(out_dir), root)
+    inputs = [os.path.join(os.path.relpath(os.path.abspath(talks_dir), root), "*.md")]
+    # the map's own code, when it lives in the same tree as the talks
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = [os.path.join(here, name) for name in ("talkmap.py", "talkmap_geocoders.py", "talkmap_clusters.py")]
+    if os.path.realpath(here) == os.path.realpath(root):
+        inputs += code
+    changes = ChangeSet("talkmap", inputs,
+                        outputs=[os.path.join(out_rel, p) for p in MAP_OUTPUTS + [MANIFEST_FILE]],
+                        key=out_rel, root=root)
+    if not force and not pending and outputs_exist and not changes.changed():
+        print("No talk files changed since the last build; map is up to date")
+        return {"skipped": True, "talks": len(manifest.get("talks") or []), "mapped": None, "unresolved": []}
+
+    talk_set = read_talks(talks_dir)
+    # a change to the map's own code rebuilds it even if the talks are the same
+    code_changed = changes.paths is not None and bool(changes.matching(code))
+    if not force and not code_changed and talk_set == manifest.get("talks") and not pending and outputs_exist:
+        print(f"Talk titles, venues and locations unchanged ({len(talk_set)} talks); map is up to date")
+        changes.record()
+        return {"skipped": True, "talks": len(talk_set), "mapped": None, "unresolved": []}
+
+    stage("geocode")
+
+    # Prepare to geolocate
+    if geocoder is None:
+        geocoder = LazyGeocoder(default_geocoder)
+    cache = load_json(cache_path)
+    location_dict = {}
+
+    # Group the talks by place, so each distinct location is geocoded only once
+    places = {}
+    for title, venue, location in talk_set:
+        # Prepare the description
+        description = f"{title}<br />{venue}; {location}"
+
+        key = normalize_location(location)
+        if key not in places:
+            places[key] = (location, [])
+        places[key][1].append(description)
+    print(f"{sum(len(d) for _, d in places.values())} talks at {len(places)} distinct locations")
+
+    # Places left over from the last run go first, so they are not starved again
+    retry = set(normalize_location(location) for location in pending)
+    order = sorted(places, key=lambda key: key not in retry)
+    if retry:
+        print(f"Retrying {len(retry & set(places))} locations left pending by the last run")
+
+    # Perform geolocation
+    unresolved = []
+    for key in order:
+        location, descriptions = places[key]
+        # Geocode the location and report the status
+        try:
+            result = cached_geocode(geocoder, location, cache)
+            print(location, result)
+        except DeadlineExceeded:
+            unresolved.append(location)
+            continue
+        except ValueError as ex:
+            print(f"Error: geocode failed on input {location} with message {ex}")
+            continue
+        except Exception as ex:
+            print(f"Error: geocoding {location} failed with {type(ex).__name__}: {ex}")
+            unresolved.append(location)
+            continue
+        if result is None and is_offline(geocoder):
+            # not in the gazetteer; only Nominatim can say the place does not exist
+            unresolved.append(location)
+            continue
+
+        # Every talk at this place gets the same coordinates
+        for description in descriptions:
+            location_dict[description] = result
+
+    if unresolved:
+        print(f"{len(unresolved)} locations could not be geocoded this run; "
+              f"they are queued in {pending_path} for the next one")
+    save_json(sorted(unresolved), pending_path)
+
+    stage("write")
+
+    # Keep what we learned for the next run
+    save_json(cache, cache_path)
+
+    # Save the map data: the point list and the precomputed clusters
+    changed = write_locations_js(location_dict, os.path.join(out_dir, "org-locations.js"))
+    written, version = write_levels(cluster_levels(location_dict), os.path.join(out_dir, "clusters"))
+    stamp_map(os.path.join(out_dir, "map.html"), version)
+    print(f"Wrote {len(location_dict)} talks to {out_dir}/ "
+          f"(org-locations.js {'updated' if changed else 'unchanged'}, {written} new cluster files)")
+
+    save_json({"talks": talk_set}, manifest_path)
+    # a run that left locations pending is not a baseline; the next one must look again
+    if not unresolved:
+        changes.record()
+    return {"skipped": False, "talks": len(talk_set),
+            "mapped": sum(1 for v in location_dict.values() if v is not None),
+            "unresolved": sorted(unresolved)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Leaflet map of talk locations")
+    parser.add_argument("--talks-dir", default="_talks", help="folder of talk .md files")
+    parser.add_argument("--out-dir", default="talkmap", help="folder holding map.html")
+    parser.add_argument("--deadline", type=float, default=DEADLINE,
+                        help="time budget for network geocoding, in seconds")
+    parser.add_argument("--offline", action="store_true",
+                        help="only use the local gazetteer index, never Nominatim")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild even if no talk's title, venue or location changed")
+    _use_scripts()
+    from profiling import start
+    args = parser.parse_args(start("talkmap", argv))
+
+    # built on the first cache miss: an up-to-date map needs neither geopy nor the gazetteer
+    geocoder = LazyGeocoder(lambda: default_geocoder(args.deadline, args.offline))
+    build_talkmap(args.talks_dir, args.out_dir, geocoder, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
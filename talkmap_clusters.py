@@ -0,0 +1,190 @@
+# Precomputed marker clustering for the talk map
+#
+# leaflet.markercluster clusters every point in the browser on each page load
+# and zoom change, which gets slow on phones once there are thousands of
+# talks. Instead, talkmap.py clusters the points here, once per build, and
+# writes one small GeoJSON file per zoom level into talkmap/clusters/;
+# talkmap/map.html only fetches the level it is currently showing.
+#
+# The clustering is hierarchical in the style of supercluster: talks at the
+# same coordinates are merged into one place, then for each zoom from
+# MAX_ZOOM down to 0 the previous level's items are greedily merged with
+# everything within RADIUS screen pixels, using a grid so each step is close
+# to linear. Levels that come out identical share one file.
+#
+# The level files are named by content hash, so they can be cached for good.
+# index.json keeps its name, so map.html asks for it with the index's own
+# hash as a query string (see stamp_map), and a rebuilt index is never served
+# stale by the browser or the Pages CDN.
+import hashlib
+import json
+import math
+import os
+import re
+
+# Cluster radius in screen pixels, and the tile size Leaflet uses
+RADIUS = 60
+TILE_SIZE = 256
+
+# Above this zoom every place is shown individually
+MAX_ZOOM = 16
+
+# The index URL in map.html, with or without a version query
+INDEX_URL = re.compile(r"'clusters/index\.json(\?v=[0-9a-f]*)?'")
+
+
+def project(lat, lon):
+    """Project to Web Mercator coordinates in [0, 1]."""
+    sin = math.sin(math.radians(max(min(lat, 85.05112878), -85.05112878)))
+    x = lon / 360 + 0.5
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return x, y
+
+
+def unproject(x, y):
+    lon = (x - 0.5) * 360
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, lon
+
+
+class _Item:
+    __slots__ = ("x", "y", "count", "titles", "zoom")
+
+    def __init__(self, x, y, count, titles, zoom):
+        self.x = x
+        self.y = y
+        self.count = count
+        # only set for single places; clusters just carry a count
+        self.titles = titles
+        # the zoom this cluster was formed at; clicking it zooms one level past
+        self.zoom = zoom
+
+
+def _places(location_dict):
+    """Merge talks given at the same coordinates into one item each."""
+    places = {}
+    for title, location in location_dict.items():
+        if location is None:
+            continue
+        key = (round(location.latitude, 6), round(location.longitude, 6))
+        places.setdefault(key, []).append(title)
+    items = []
+    for (lat, lon), titles in sorted(places.items()):
+        x, y = project(lat, lon)
+        items.append(_Item(x, y, len(titles), sorted(titles), None))
+    return items
+
+
+def _cluster(items, zoom):
+    """Merge items that are within RADIUS pixels of each other at `zoom`."""
+    r = RADIUS / (TILE_SIZE * 2 ** zoom)
+    grid = {}
+    for i, item in enumerate(items):
+        grid.setdefault((int(item.x / r), int(item.y / r)), []).append(i)
+
+    used = [False] * len(items)
+    out = []
+    for i, item in enumerate(items):
+        if used[i]:
+            continue
+        used[i] = True
+        members = [item]
+        cx, cy = int(item.x / r), int(item.y / r)
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for j in grid.get((gx, gy), ()):
+                    other = items[j]
+                    if not used[j] and (other.x - item.x) ** 2 + (other.y - item.y) ** 2 <= r * r:
+                        used[j] = True
+                        members.append(other)
+        if len(members) == 1:
+            out.append(item)
+            continue
+        count = sum(m.count for m in members)
+        out.append(_Item(sum(m.x * m.count for m in members) / count,
+                         sum(m.y * m.count for m in members) / count,
+                         count, None, zoom))
+    return out
+
+
+def _feature(item):
+    lat, lon = unproject(item.x, item.y)
+    if item.titles is not None:
+        properties = {"count": item.count, "titles": item.titles}
+    else:
+        properties = {"count": item.count, "expand": item.zoom + 1}
+    return {"type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+            "properties": properties}
+
+
+def cluster_levels(location_dict, max_zoom=MAX_ZOOM):
+    """Return {zoom: GeoJSON FeatureCollection} for zooms 0..max_zoom + 1.
+
+    `location_dict` maps a talk's popup HTML to an object with `latitude` and
+    `longitude` (or None, which is skipped), as built by talkmap.py.
+    """
+    items = _places(location_dict)
+    levels = {max_zoom + 1: items}
+    for zoom in range(max_zoom, -1, -1):
+        items = _cluster(items, zoom)
+        levels[zoom] = items
+    return {zoom: {"type": "FeatureCollection", "features": [_feature(i) for i in items]}
+            for zoom, items in levels.items()}
+
+
+def write_levels(levels, folder="talkmap/clusters"):
+    """Write one compact GeoJSON file per distinct level plus an index.json.
+
+    Files are named by content hash, so identical levels share a file and
+    unchanged levels keep their name between builds; files no longer
+    referenced are removed. Returns the number of files written and the
+    content hash of index.json, for stamp_map.
+    """
+    os.makedirs(folder, exist_ok=True)
+    index = {"maxZoom": max(levels), "levels": {}}
+    wanted = {"index.json"}
+    written = 0
+    for zoom in sorted(levels):
+        data = json.dumps(levels[zoom], separators=(",", ":"), sort_keys=True)
+        name = hashlib.sha1(data.encode("utf-8")).hexdigest()[:12] + ".json"
+        index["levels"][str(zoom)] = name
+        if name not in wanted:
+            wanted.add(name)
+            path = os.path.join(folder, name)
+            if not os.path.exists(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                written += 1
+
+    content = json.dumps(index, indent=1, sort_keys=True)
+    path = os.path.join(folder, "index.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            unchanged = f.read() == content
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    for name in os.listdir(folder):
+        if name.endswith(".json") and name not in wanted:
+            os.remove(os.path.join(folder, name))
+    return written, hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+
+def stamp_map(page, version):
+    """Point `page` at the current index.json by adding its content hash, `version`, to the URL.
+
+    Returns True if the page was rewritten; pages without the index URL are left alone.
+    """
+    if not os.path.exists(page):
+        return False
+    with open(page, "r", encoding="utf-8") as f:
+        html = f.read()
+    stamped = INDEX_URL.sub("'clusters/index.json?v=" + version + "'", html)
+    if stamped == html:
+        return False
+    with open(page, "w", encoding="utf-8") as f:
+        f.write(stamped)
+    return True
@@ -0,0 +1,313 @@
+# Geocoder backends for talkmap.py
+#
+# A geocoder is anything with a geopy-style `geocode(query, timeout=None)`
+# method that returns an object with `address`, `latitude` and `longitude`,
+# or None when the place is unknown. geopy's Nominatim already fits, and this
+# module adds:
+#
+# - GazetteerGeocoder: resolves places offline from a local gazetteer such as
+#   a GeoNames dump (https://download.geonames.org/export/dump/, e.g.
+#   cities15000.zip). The dump is compiled once into a compact gzipped index
+#   with every normalized name and alternate name; lookups are dictionary hits
+#   that take microseconds, with a fuzzy fallback for misspellings.
+# - ChainGeocoder: asks several geocoders in order and returns the first hit,
+#   so Nominatim is only called for places the gazetteer does not know.
+# - ScheduledGeocoder: wraps a network geocoder to keep to the provider's rate
+#   limit, retry transient failures with exponential backoff, and stop once
+#   the run's overall deadline is spent (raising DeadlineExceeded).
+# - LazyGeocoder: builds a geocoder on its first lookup, so a run where every
+#   place is cached never imports geopy or loads the gazetteer.
+#
+# Build an index with:
+#
+#     python talkmap_geocoders.py cities15000.txt [--admin1 admin1CodesASCII.txt]
+import argparse
+import difflib
+import gzip
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+from collections import namedtuple
+
+GAZETTEER_INDEX = ".gazetteer/index.json.gz"
+
+# Bump when the index layout changes
+INDEX_VERSION = 1
+
+# Fuzzy matches must be at least this similar to be accepted
+FUZZY_CUTOFF = 0.85
+
+Place = namedtuple("Place", ["address", "latitude", "longitude"])
+
+# Common ways talks spell out countries that GeoNames only knows by ISO code
+# (keys are normalized, so "U.S.A." arrives as "usa")
+COUNTRY_ALIASES = {
+    "usa": "us", "united states": "us",
+    "united states of america": "us", "america": "us",
+    "uk": "gb", "united kingdom": "gb", "great britain": "gb",
+    "england": "gb", "scotland": "gb", "wales": "gb", "northern ireland": "gb",
+    "germany": "de", "deutschland": "de", "france": "fr", "spain": "es",
+    "italy": "it", "netherlands": "nl", "the netherlands": "nl", "belgium": "be",
+    "switzerland": "ch", "austria": "at", "denmark": "dk", "sweden": "se",
+    "norway": "no", "finland": "fi", "ireland": "ie", "portugal": "pt",
+    "poland": "pl", "greece": "gr", "israel": "il", "canada": "ca",
+    "mexico": "mx", "brazil": "br", "argentina": "ar", "chile": "cl",
+    "china": "cn", "japan": "jp", "south korea": "kr", "korea": "kr",
+    "india": "in", "australia": "au", "new zealand": "nz",
+    "south africa": "za", "russia": "ru", "turkey": "tr",
+}
+
+
+def normalize(text):
+    """Lower-case, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = re.sub(r"[^\w\s,]", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def build_index(dump_path, index_path=GAZETTEER_INDEX, admin1_path=None, min_population=0):
+    """Compile a GeoNames dump into the compact index GazetteerGeocoder loads.
+
+    Each record is stored once as [name, lat, lon, country, admin1,
+    population]; `names` maps every normalized name and alternate name to the
+    record indexes carrying it, most populous first. `admin1_path` is the
+    optional admin1CodesASCII.txt, which lets queries like "Berkeley,
+    California" match on the state's name as well as its code.
+    """
+    records = []
+    names = {}
+    with open(dump_path, "r", encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            population = int(cols[14] or 0)
+            if population < min_population:
+                continue
+            idx = len(records)
+            records.append([cols[1], round(float(cols[4]), 5), round(float(cols[5]), 5),
+                            cols[8].lower(), cols[10].lower(), population])
+            aliases = {cols[1], cols[2]}
+            aliases.update(a for a in cols[3].split(",") if a)
+            for alias in aliases:
+                key = normalize(alias)
+                if key:
+                    names.setdefault(key, []).append(idx)
+
+    for idxs in names.values():
+        idxs.sort(key=lambda i: -records[i][5])
+
+    admin1 = {}
+    if admin1_path:
+        with open(admin1_path, "r", encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) >= 3:
+                    country, _, code = cols[0].lower().partition(".")
+                    for name in (cols[1], cols[2]):
+                        admin1[country + ":" + normalize(name)] = code.lower()
+
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    with gzip.open(index_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "records": records, "names": names,
+                   "admin1": admin1}, f, separators=(",", ":"))
+    return len(records), len(names)
+
+
+def is_offline(geocoder):
+    """True if `geocoder` only looks at local data, so not finding a place proves little."""
+    return getattr(geocoder, "offline", False)
+
+
+class GazetteerGeocoder:
+    """Offline geocoder backed by an index built with build_index()."""
+
+    offline = True
+
+    def __init__(self, index_path=GAZETTEER_INDEX):
+        with gzip.open(index_path, "rt", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            raise ValueError(f"{index_path} was built by a different version; rebuild it")
+        self.records = index["records"]
+        self.names = index["names"]
+        self.admin1 = index["admin1"]
+        self._by_prefix = None
+
+    def _qualifier_matches(self, record, qualifier):
+        _, _, _, country, admin1, _ = record
+        if qualifier in (country, admin1):
+            return True
+        if COUNTRY_ALIASES.get(qualifier) == country:
+            return True
+        return self.admin1.get(country + ":" + qualifier) == admin1
+
+    def _best(self, idxs, qualifiers):
+        """Pick the most populous record that agrees with every qualifier."""
+        for i in idxs:
+            record = self.records[i]
+            if all(self._qualifier_matches(record, q) for q in qualifiers):
+                return record
+        return None
+
+    def _fuzzy(self, name):
+        if self._by_prefix is None:
+            self._by_prefix = {}
+            for key in self.names:
+                self._by_prefix.setdefault(key[:2], []).append(key)
+        return difflib.get_close_matches(name, self._by_prefix.get(name[:2], []),
+                                         n=3, cutoff=FUZZY_CUTOFF)
+
+    def geocode(self, query, timeout=None):
+        """Resolve "City, Region, Country" style strings; return a Place or None."""
+        parts = [p.strip() for p in normalize(query).split(",") if p.strip()]
+        if not parts:
+            return None
+
+        # "Berkeley CA, USA": try the whole first part, then peel trailing
+        # words off it and treat them as extra qualifiers
+        words = parts[0].split(" ")
+        candidates = []
+        for cut in range(len(words), 0, -1):
+            candidates.append((" ".join(words[:cut]), words[cut:] + parts[1:]))
+
+        for name, qualifiers in candidates:
+            record = self._best(self.names.get(name, ()), qualifiers)
+            if record:
+                return self._place(record)
+        for name, qualifiers in candidates:
+            for match in self._fuzzy(name):
+                record = self._best(self.names[match], qualifiers)
+                if record:
+                    return self._place(record)
+        return None
+
+    @staticmethod
+    def _place(record):
+        name, lat, lon, country, admin1, _ = record
+        address = ", ".join(p for p in (name, admin1.upper(), country.upper()) if p)
+        return Place(address, lat, lon)
+
+
+class ChainGeocoder:
+    """Try each geocoder in turn and return the first result.
+
+    Errors from one backend are only raised if no later backend finds the
+    place, so an unreachable Nominatim never hides a gazetteer hit.
+    """
+
+    def __init__(self, *geocoders):
+        self.geocoders = geocoders
+
+    @property
+    def offline(self):
+        return all(is_offline(g) for g in self.geocoders)
+
+    def geocode(self, query, timeout=None):
+        error = None
+        for geocoder in self.geocoders:
+            try:
+                result = geocoder.geocode(query, timeout=timeout)
+            except Exception as ex:
+                error = ex
+                continue
+            if result is not None:
+                return result
+        if error is not None:
+            raise error
+        return None
+
+
+class LazyGeocoder:
+    """Call `factory` to build the real geocoder on the first lookup, not before."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.geocoder = None
+
+    @property
+    def offline(self):
+        # nothing was looked up yet, so no miss can have come from local data alone
+        return self.geocoder is not None and is_offline(self.geocoder)
+
+    def geocode(self, query, timeout=None):
+        if self.geocoder is None:
+            self.geocoder = self.factory()
+        return self.geocoder.geocode(query, timeout=timeout)
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of geocoding once a ScheduledGeocoder's time budget is used up."""
+
+
+class ScheduledGeocoder:
+    """Rate-limited, retrying wrapper with an overall deadline for one run.
+
+    Calls are spaced at least `min_interval` seconds apart (Nominatim's usage
+    policy allows one request per second). Exceptions listed in `transient`
+    are retried up to `retries` times, waiting `backoff * 2**attempt`
+    seconds plus jitter, or the server's Retry-After when it sends one. Once
+    less than a request's worth of the `deadline` budget remains, every call
+    raises DeadlineExceeded so the caller can queue the rest for next time.
+    """
+
+    def __init__(self, geocoder, deadline, min_interval=1.0, retries=3, backoff=2.0,
+                 transient=(TimeoutError, ConnectionError), clock=time.monotonic, sleep=time.sleep):
+        self.geocoder = geocoder
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.transient = transient
+        self.clock = clock
+        self.sleep = sleep
+        self.deadline = clock() + deadline
+        self._next_call = clock()
+
+    def remaining(self):
+        return self.deadline - self.clock()
+
+    def _wait(self, until):
+        if until > self.deadline:
+            raise DeadlineExceeded()
+        delay = until - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+
+    def geocode(self, query, timeout=None):
+        attempt = 0
+        while True:
+            self._wait(max(self._next_call, self.clock()))
+            remaining = self.remaining()
+            if timeout is not None and remaining < timeout:
+                raise DeadlineExceeded()
+            self._next_call = self.clock() + self.min_interval
+            try:
+                return self.geocoder.geocode(query, timeout=timeout)
+            except self.transient as ex:
+                if attempt >= self.retries:
+                    raise
+                delay = getattr(ex, "retry_after", None) or self.backoff * 2 ** attempt
+                attempt += 1
+                print(f"Retrying {query!r} in {delay:.1f}s after {type(ex).__name__} "
+                      f"(attempt {attempt} of {self.retries})")
+                self._wait(self.clock() + delay + random.uniform(0, self.min_interval))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline gazetteer index used by talkmap.py")
+    parser.add_argument("dump", help="GeoNames dump, e.g. cities15000.txt")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt, to match region names")
+    parser.add_argument("--output", "-o", default=GAZETTEER_INDEX, help="index file to write")
+    parser.add_argument("--min-population", type=int, default=0, help="skip smaller places")
+    args = parser.parse_args()
+
+    count, names = build_index(args.dump, args.output, args.admin1, args.min_population)
+    print(f"Indexed {count} places under {names} names in {args.output}")
+
+
+if __name__ == "__main__":
+    main()